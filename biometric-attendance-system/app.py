@@ -1,16 +1,28 @@
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for, send_file, flash
+from flask import Flask, render_template, request, jsonify, session, redirect, url_for, send_file, flash, Response, stream_with_context
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
 from werkzeug.security import check_password_hash, generate_password_hash
 from werkzeug.utils import secure_filename
-from models import db, Admin, Faculty, Student, AttendanceRecord, Subject, LeaveApplication, Timetable, AttendanceSession
-from face_recognition_api import encode_face_from_image, encode_face_from_array, find_matching_student, detect_faces_in_frame
+from models import db, Admin, Faculty, Student, AttendanceRecord, Subject, LeaveApplication, Timetable, AttendanceSession, AttendanceSummary, BackgroundJob, ROSTER
+from face_recognition_api import encode_face_from_array, find_matching_student, detect_faces_in_frame, match_encodings, build_face_templates, refine_with_templates, ENROLL_MAX_SAMPLES
+from encoding_cache import encoding_cache
+from identity_cache import identity_cache
+from gallery_index import campus_index
+from attendance_service import mark_students_bulk, end_attendance_session, update_summary, rebuild_summary, MARKED, DUPLICATE
+from stats_cache import stats_cache, invalidate_dashboard, DASHBOARD_KEY
+from inference_service import inference_service, InferenceQueueFull, InferenceTimeout
+from face_tracker import session_trackers
+from job_queue import enqueue, get_job, job_handler, periodic_task, job_file_path, job_files, require_files, PermanentJobError, runner as job_runner, stats as job_stats
+from bulk_import import start_import, save_import_zip
+from session_expiry import expire_sessions, session_expires_at, stats as session_expiry_stats
+from auth_service import find_credentials, password_verifier, login_limiter, LoginBusy, stats as login_stats
 from datetime import datetime, date, time
 import datetime as dt
 import json
 import os
 from dotenv import load_dotenv
-from sqlalchemy import or_, and_
+from sqlalchemy import or_, and_, func, case, tuple_
 from sqlalchemy.exc import SQLAlchemyError, IntegrityError
+from sqlalchemy.orm import joinedload
 import logging
 
 # Load environment variables
@@ -18,9 +30,12 @@ load_dotenv()
 import cv2
 import numpy as np
 import pandas as pd
-from io import BytesIO
+import io
+import csv
+import zlib
 import base64
-from config import DATABASE_URI, DATABASE_TYPE
+import binascii
+from config import DATABASE_URI, DATABASE_TYPE, get_engine_options, pool_stats
 
 # Configure Logging
 logging.basicConfig(
@@ -55,9 +70,13 @@ else:
         app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{db_path}'
     print(f"DEBUG: Using database: {app.config['SQLALCHEMY_DATABASE_URI']}")
 
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = get_engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['UPLOAD_FOLDER'] = 'static/uploads'
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+app.config['DEFAULTER_THRESHOLD'] = float(os.environ.get('DEFAULTER_THRESHOLD', 75))  # percent
+app.config['MAX_FRAME_BYTES'] = int(os.environ.get('MAX_FRAME_BYTES', 2 * 1024 * 1024))  # binary scanner uploads
+app.config['WS_SESSION_RECHECK'] = int(os.environ.get('WS_SESSION_RECHECK', 5))  # seconds between session/roster checks
 
 # Session Configuration
 app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'
@@ -75,6 +94,15 @@ db.init_app(app)
 # app.jinja_env.globals['csrf_token'] = generate_csrf
 login_manager = LoginManager()
 
+# Optional WebSocket support for the streaming scanner; without it the
+# scanner keeps posting frames to /api/recognize_face_frame
+try:
+    from flask_sock import Sock
+    sock = Sock(app)
+except ImportError:
+    sock = None
+    print("Warning: flask-sock not installed. Live scanner will use HTTP uploads (pip install flask-sock)")
+
 # @app.context_processor
 # def inject_csrf_token():
 #     return dict(csrf_token=generate_csrf)
@@ -99,19 +127,16 @@ os.makedirs('static/uploads', exist_ok=True)
 
 @app.before_request
 def log_request_info():
+    # Job runner threads also run the session expiry sweep, so start them with the first request
+    job_runner.ensure_started(app)
     if request.endpoint != 'static':
-        print(f"DEBUG: Request to {request.path} | Method: {request.method} | User: {current_user} | Session: {list(session.keys())}")
+        # The session's user id, not current_user: that would load the user on every request
+        print(f"DEBUG: Request to {request.path} | Method: {request.method} | User: {session.get('_user_id')} | Session: {list(session.keys())}")
 
 @login_manager.user_loader
 def load_user(user_id):
-    print(f"DEBUG: load_user called with {user_id}")
-    if user_id.startswith('admin_'):
-        return Admin.query.get(int(user_id.split('_')[1]))
-    elif user_id.startswith('faculty_'):
-        return Faculty.query.get(int(user_id.split('_')[1]))
-    elif user_id.startswith('student_'):
-        return Student.query.get(int(user_id.split('_')[1]))
-    return None
+    # Served from the per-process identity cache; password and face columns load only if accessed
+    return identity_cache.get(user_id)
 
 
 # --- Admin helpers (safe) ---
@@ -203,35 +228,29 @@ def login():
         email_or_id = request.form.get('email')
         password = request.form.get('password')
         
-        user = None
-        user_type = None
-
-        # Try to find user in all tables
-        # 1. Check Admin
-        user = Admin.query.filter_by(email=email_or_id).first()
-        if user:
-            user_type = 'admin'
-        
-        # 2. Check Faculty
-        if not user:
-            user = Faculty.query.filter_by(email=email_or_id).first()
-            if user:
-                user_type = 'faculty'
+        # Cheap rejection before any query or hashing
+        if not login_limiter.allow(email_or_id):
+            print(f"DEBUG: Too many login attempts for {email_or_id}")
+            return render_template('login.html', error='Too many login attempts. Please try again in a few minutes.'), 429
         
-        # 3. Check Student
-        if not user:
-            user = Student.query.filter_by(enrollment_number=email_or_id).first()
-            if user:
-                user_type = 'student'
+        # One query across Admin, Faculty and Student
+        credentials = find_credentials(email_or_id)
             
-        if user:
-            # Verify password hash
-            is_valid = check_password_hash(user.password, password)
+        if credentials:
+            # Verify password hash on the bounded hashing pool
+            try:
+                is_valid = password_verifier.verify(credentials.password_hash, password)
+            except LoginBusy as e:
+                print(f"Warning: login for {email_or_id} rejected: {e}")
+                return render_template('login.html', error='The server is busy. Please try again.'), 503
+            user_type = credentials.user_type
             print(f"DEBUG: Checking password for {email_or_id} (UserType: {user_type}). Result: {is_valid}")
             
             if is_valid:
                 print(f"DEBUG: Login successful for {email_or_id} as {user_type}")
-                login_user(user)
+                login_limiter.reset(email_or_id)
+                # Warms the identity cache the next requests are served from
+                login_user(identity_cache.get(credentials.user_id))
                 session['user_type'] = user_type
                 if user_type == 'student':
                     return redirect(url_for('student_dashboard'))
@@ -252,45 +271,72 @@ def logout():
     session.clear()
     return redirect(url_for('login'))
 
+def compute_dashboard_stats():
+    """
+    Counts for the dashboard: two scalar counts plus one (date, status)
+    grouped aggregate over the last 7 days, instead of nine COUNT queries.
+    """
+    today = date.today()
+    window_start = today - dt.timedelta(days=6)
+
+    student_count, subject_count = db.session.execute(db.select(
+        db.select(func.count()).select_from(Student).scalar_subquery(),
+        db.select(func.count()).select_from(Subject).scalar_subquery()
+    )).one()
+
+    per_day = db.session.execute(
+        db.select(AttendanceRecord.date, AttendanceRecord.status, func.count())
+        .where(AttendanceRecord.date >= window_start, AttendanceRecord.date <= today)
+        .group_by(AttendanceRecord.date, AttendanceRecord.status)
+    ).all()
+
+    present_by_day = {}
+    today_attendance = 0
+    for day, status, count in per_day:
+        if status == 'Present':
+            present_by_day[day] = count
+        if day == today:
+            today_attendance += count
+
+    days = [window_start + dt.timedelta(days=i) for i in range(7)]
+    return {
+        'day': today.isoformat(),
+        'students': student_count,
+        'subjects': subject_count,
+        'today': today_attendance,
+        'dates': [d.strftime('%d %b') for d in days],
+        'counts': [present_by_day.get(d, 0) for d in days]
+    }
+
 # --- DASHBOARD & CORE ---
 @app.route('/dashboard')
 @login_required
 def dashboard():
     user_type = session.get('user_type', 'faculty')
     
-    # Stats for Dashboard
-    student_count = Student.query.count()
-    subject_count = Subject.query.count()
-    today_attendance = AttendanceRecord.query.filter_by(date=date.today()).count()
-    
-    # Chart Data: Last 7 Days
-    dates = []
-    counts = []
-    for i in range(6, -1, -1):
-        d = date.today() - dt.timedelta(days=i)
-        # Count present records for this day
-        # Note: This is a simple count of records, might need refinement for actual 'attendance'
-        c = AttendanceRecord.query.filter(AttendanceRecord.date == d, AttendanceRecord.status == 'Present').count()
-        dates.append(d.strftime('%d %b'))
-        counts.append(c)
+    # Stats for Dashboard (shared across workers for a few seconds)
+    stats = stats_cache.get(DASHBOARD_KEY)
+    if stats is None or stats.get('day') != date.today().isoformat():
+        stats = compute_dashboard_stats()
+        stats_cache.set(DASHBOARD_KEY, stats)
         
     # Chart Data: Today's Status
-    present = today_attendance
+    present = stats['today']
     # Approximate absent (Total Students - Present)
     # This assumes all students should be present.
-    absent = max(0, student_count - present) 
+    absent = max(0, stats['students'] - present) 
     
     return render_template('dashboard.html', 
                          user_type=user_type, 
                          user=current_user,
                          stats={
-                             'students': student_count,
-                             'subjects': subject_count,
-                             'today': today_attendance
+                             'students': stats['students'],
+                             'subjects': stats['subjects'],
+                             'today': stats['today']
                          },
                          chart_data={
-                             'dates': dates,  # Pass as list, Jinja will handle safe json dump if needed or we do it there
-                             'counts': counts,
+                             'dates': stats['dates'],  # Pass as list, Jinja will handle safe json dump if needed or we do it there
+                             'counts': stats['counts'],
                              'present': present,
                              'absent': absent
                          })
@@ -303,25 +349,28 @@ def student_dashboard():
         
     student = current_user
     
-    # Calculate Attendance
-    total_records = AttendanceRecord.query.filter_by(student_id=student.student_id).all()
-    attended = [r for r in total_records if r.status == 'Present']
-    
-    total_lectures = len(total_records) # Simplified: Assuming only records exist for classes held
-    # To be more accurate, we'd need a timetable or "total lectures held" metric per subject.
-    # For this dashboard in this codebase context, we'll show Stats based on marked records.
+    # Counts from the per-subject summary rows, so the cost doesn't grow with history.
+    # Simplified: only lectures with a marked record count (no timetable-based "lectures held").
+    present_count, total_lectures = db.session.query(
+        func.coalesce(func.sum(AttendanceSummary.present), 0),
+        func.coalesce(func.sum(AttendanceSummary.total), 0)
+    ).filter(AttendanceSummary.student_id == student.student_id).one()
     
-    present_count = len(attended)
     absent_count = total_lectures - present_count
     percentage = (present_count / total_lectures * 100) if total_lectures > 0 else 0
     
+    # Newest 10 records, read from the (student_id, date, time) index
+    recent_records = AttendanceRecord.query.options(joinedload(AttendanceRecord.subject)).filter_by(
+        student_id=student.student_id
+    ).order_by(AttendanceRecord.date.desc(), AttendanceRecord.time.desc()).limit(10).all()
+    
     return render_template('student_dashboard.html', 
                            student=student,
                            total=total_lectures,
                            present=present_count,
                            absent=absent_count,
                            percentage=round(percentage, 1),
-                           recent_records=total_records[-10:][::-1]) # Last 10 reversed
+                           recent_records=recent_records)
 
 # --- STUDENT MANAGEMENT ---
 @app.route('/students')
@@ -329,8 +378,13 @@ def student_dashboard():
 def students():
     if session.get('user_type') != 'admin':
         return redirect(url_for('dashboard'))
-    students = Student.query.all()
-    return render_template('students.html', students=students)
+    students = Student.query.options(ROSTER).all()
+    # Enrollments still encoding, or failed in the last day, from add_student
+    enrollments = BackgroundJob.query.filter(
+        BackgroundJob.kind == 'enroll_student', BackgroundJob.status != 'completed',
+        BackgroundJob.created_at >= datetime.now() - dt.timedelta(days=1)
+    ).order_by(BackgroundJob.id.desc()).all()
+    return render_template('students.html', students=students, enrollments=enrollments)
 
 @app.route('/add_student', methods=['GET', 'POST'])
 @login_required
@@ -345,9 +399,10 @@ def add_student():
             class_name = request.form.get('class_name')
             dob_str = request.form.get('dob')
             password = request.form.get('password') # Optional, default if empty
-            photo = request.files.get('photo')
+            # Several photos (or a webcam burst) give a more robust face template
+            photos = [p for p in request.files.getlist('photo') if p and p.filename][:ENROLL_MAX_SAMPLES]
             
-            if not all([name, enrollment_number, class_name, photo, dob_str]):
+            if not all([name, enrollment_number, class_name, photos, dob_str]):
                 flash('All fields are required', 'error')
                 return redirect(url_for('add_student'))
 
@@ -366,36 +421,26 @@ def add_student():
                 flash(f'Student with enrollment {enrollment_number} already exists', 'error')
                 return redirect(url_for('add_student'))
 
-            # Save photo
-            filename = secure_filename(f"{enrollment_number}_{photo.filename}")
-            photo_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            photo.save(photo_path)
-            
-            # Encode face
-            try:
-                face_encoding = encode_face_from_image(photo_path)
-                if face_encoding is None:
-                    flash('No face detected in photo. Please upload a clear photo with visible face.', 'error')
-                    return redirect(url_for('add_student'))
-            except ImportError as ie:
-                flash(f'Error processing image: {str(ie)}', 'error')
-                return redirect(url_for('add_student'))
+            # Save photos (the first one is the profile photo)
+            photo_paths = []
+            for i, photo in enumerate(photos):
+                prefix = enrollment_number if i == 0 else f"{enrollment_number}_{i}"
+                filename = secure_filename(f"{prefix}_{photo.filename}")
+                photo_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+                photo.save(photo_path)
+                photo_paths.append(photo_path)
             
-
-            student = Student(
-                name=name,
-                enrollment_number=enrollment_number,
-                class_name=class_name,
-                password=generate_password_hash(password) if password else generate_password_hash('123456'),
-                face_encoding=json.dumps(face_encoding),
-                photo_url=photo_path,
-                dob=dob,
-                admission_date=date.today()
-            )
-            db.session.add(student)
-            db.session.commit()
+            # Face encoding runs as a background job; the student is created when it finishes
+            enqueue('enroll_student', {
+                'name': name,
+                'enrollment_number': enrollment_number,
+                'class_name': class_name,
+                'password': generate_password_hash(password) if password else generate_password_hash('123456'),
+                'dob': dob.isoformat(),
+                'photo_paths': photo_paths,
+            }, created_by=current_user.get_id())
             
-            flash('Student added successfully', 'success')
+            flash(f'Photos uploaded. {name} will be listed once their face has been encoded.', 'info')
             return redirect(url_for('students'))
         except Exception as e:
             db.session.rollback()
@@ -403,6 +448,47 @@ def add_student():
             
     return render_template('add_student.html')
 
+@job_handler('enroll_student')
+def enroll_student_job(payload, job):
+    """Encode the uploaded samples and create the student (queued by add_student)."""
+    photo_paths = payload['photo_paths']
+    require_files(photo_paths)
+    
+    # Encode every sample in parallel, then keep the centroid plus the per-photo templates
+    face_encoding, templates = build_face_templates(inference_service.encode_images(photo_paths))
+    if face_encoding is None:
+        for path in photo_paths:
+            if os.path.exists(path):
+                os.remove(path)
+        raise PermanentJobError(f"No face detected in {payload['name']}'s photo. Please upload a clear photo with visible face.")
+    
+    student = Student(
+        name=payload['name'],
+        enrollment_number=payload['enrollment_number'],
+        class_name=payload['class_name'],
+        password=payload['password'],
+        face_encoding=face_encoding,
+        face_templates=templates if len(templates) > 1 else None,
+        photo_url=photo_paths[0],
+        dob=date.fromisoformat(payload['dob']),
+        admission_date=date.today()
+    )
+    db.session.add(student)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        raise PermanentJobError(f"Student with enrollment {payload['enrollment_number']} already exists")
+    encoding_cache.invalidate(student.class_name)
+    campus_index.add(student.student_id, face_encoding)
+    invalidate_dashboard()
+    
+    ignored = len(photo_paths) - len(templates)
+    message = f"{student.name} added"
+    if ignored:
+        message += f" ({ignored} photo(s) ignored: no face found or a different face)"
+    return {'student_id': student.student_id, 'message': message}
+
 @app.route('/delete_student/<int:id>', methods=['POST'])
 @login_required
 def delete_student(id):
@@ -419,13 +505,73 @@ def delete_student(id):
             pass
             
     # Delete records and student
+    class_name = student.class_name
     AttendanceRecord.query.filter_by(student_id=id).delete()
+    AttendanceSummary.query.filter_by(student_id=id).delete()
     db.session.delete(student)
     db.session.commit()
+    identity_cache.invalidate(f'student_{id}')
+    encoding_cache.invalidate(class_name)
+    campus_index.remove(id)
+    invalidate_dashboard()
     
     flash('Student deleted successfully', 'success')
     return redirect(url_for('students'))
 
+@app.route('/bulk_upload_students', methods=['POST'])
+@login_required
+def bulk_upload_students():
+    """Queue a CSV + photo zip import; the browser polls /api/jobs/<job_id>."""
+    if session.get('user_type') != 'admin':
+        return jsonify({'success': False, 'message': 'Unauthorized'}), 403
+
+    csv_file = request.files.get('csv_file')
+    if not csv_file or not csv_file.filename.lower().endswith('.csv'):
+        return jsonify({'success': False, 'message': 'Please upload a CSV file'}), 400
+    try:
+        csv_text = csv_file.read().decode('utf-8')
+    except UnicodeDecodeError:
+        return jsonify({'success': False, 'message': 'CSV must be UTF-8 encoded'}), 400
+
+    zip_path = None
+    photos = request.files.get('photos_zip')
+    if photos and photos.filename:
+        zip_path = save_import_zip(photos)
+        if zip_path is None:
+            return jsonify({'success': False, 'message': 'Photos must be a .zip file'}), 400
+
+    job_id = start_import(csv_text, zip_path, app.config['UPLOAD_FOLDER'], created_by=current_user.get_id())
+    return jsonify({'success': True, 'job_id': job_id, 'message': 'Import started'}), 202
+
+# --- BACKGROUND JOBS ---
+def get_own_job(job_id):
+    """The job if the current user queued it (admins see every job), else None."""
+    job = get_job(job_id)
+    if job is None or (session.get('user_type') != 'admin' and job.created_by != current_user.get_id()):
+        return None
+    return job
+
+@app.route('/api/jobs/<int:job_id>')
+@login_required
+def job_status(job_id):
+    job = get_own_job(job_id)
+    if job is None:
+        return jsonify({'success': False, 'message': 'Job not found'}), 404
+    return jsonify({'success': True, **job.to_dict()})
+
+@app.route('/api/jobs/<int:job_id>/download')
+@login_required
+def job_download(job_id):
+    """Send the file a completed job produced (e.g. an Excel export)."""
+    job = get_own_job(job_id)
+    if job is None or job.status != 'completed' or not (job.result or {}).get('path'):
+        return jsonify({'success': False, 'message': 'No file available for this job'}), 404
+    path = job.result['path']
+    if path not in job_files(job) or not os.path.exists(path):
+        return jsonify({'success': False, 'message': 'File has expired'}), 410
+    return send_file(path, mimetype=job.result.get('mimetype'), as_attachment=True,
+                     download_name=job.result.get('filename', os.path.basename(path)))
+
 # --- FACULTY MANAGEMENT ---
 @app.route('/faculty')
 @login_required
@@ -501,6 +647,7 @@ def delete_faculty(id):
     faculty_member = Faculty.query.get_or_404(id)
     db.session.delete(faculty_member)
     db.session.commit()
+    identity_cache.invalidate(f'faculty_{id}')
     
     flash('Faculty member deleted', 'success')
     return redirect(url_for('faculty'))
@@ -528,6 +675,7 @@ def add_subject():
             sub = Subject(name=name, class_name=class_name, semester=semester)
             db.session.add(sub)
             db.session.commit()
+            invalidate_dashboard()
             flash('Subject added successfully', 'success')
         except ValueError:
             flash('Invalid semester', 'error')
@@ -547,12 +695,14 @@ def delete_subject(id):
     try:
         # Manually delete related records to ensure cascade happens even if DB constraints are strict
         AttendanceRecord.query.filter_by(subject_id=id).delete()
+        AttendanceSummary.query.filter_by(subject_id=id).delete()
         AttendanceSession.query.filter_by(subject_id=id).delete()
         LeaveApplication.query.filter_by(subject_id=id).delete()
         Timetable.query.filter_by(subject_id=id).delete()
         
         db.session.delete(sub)
         db.session.commit()
+        invalidate_dashboard()
         print("DEBUG: Subject and related records deleted successfully")
         flash('Subject deleted successfully', 'success')
     except Exception as e:
@@ -586,13 +736,20 @@ def get_subjects(class_name):
     subjects = query.all()
     return jsonify([{'id': s.subject_id, 'name': s.name} for s in subjects])
 
+def inference_busy_response(error):
+    """429 when the inference pool is saturated, so scanners back off instead of piling up"""
+    print(f"DEBUG: Inference busy: {error}")
+    status = 429 if isinstance(error, InferenceQueueFull) else 503
+    response = jsonify({'success': False, 'busy': True, 'error': 'Recognition is busy, retrying shortly'})
+    response.status_code = status
+    response.headers['Retry-After'] = '1'
+    return response
+
 @app.route('/api/recognize_face', methods=['POST'])
 @login_required
 def recognize_face():
+    """JSON body with a base64 data URL. Kept for older clients; the scanner uses recognize_face_frame."""
     try:
-        from face_recognition_api import analyze_faces
-        from sqlalchemy.exc import IntegrityError
-        
         data = request.get_json()
         image_data = data.get('image')
         class_name = data.get('class_name')
@@ -603,70 +760,139 @@ def recognize_face():
             
         # Decode image
         image_data = image_data.split(',')[1] if ',' in image_data else image_data
-        nparr = np.frombuffer(base64.b64decode(image_data), np.uint8)
-        frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        frame = decode_frame(base64.b64decode(image_data))
+        if frame is None:
+            return jsonify({'success': False, 'error': 'Invalid image'})
         
-        # 1. Analyze Faces (Get Encodings + Liveness)
-        faces_data = analyze_faces(frame)
-        if not faces_data:
+        results = recognize_frame(frame, class_name, subject_id, current_user.faculty_id)
+        if not results:
             return jsonify({'success': True, 'results': [], 'message': 'No faces detected'})
-            
-        # 2. Load Class Students (Optimization: Single DB query)
-        students = Student.query.filter_by(class_name=class_name).all()
-        # Pre-load encodings into memory to avoid JSON parsing in loop
-        known_faces = []
-        for s in students:
-            if s.face_encoding:
-                try:
-                    known_faces.append({
-                        'student': s,
-                        'encoding': json.loads(s.face_encoding)
-                    })
-                except:
-                    continue
+        return jsonify({'success': True, 'results': results})
+        
+    except (InferenceQueueFull, InferenceTimeout) as e:
+        return inference_busy_response(e)
+    except Exception as e:
+        print(f"API Error: {e}")
+        return jsonify({'success': False, 'error': str(e)})
 
-        results = []
-        today = date.today()
+@app.route('/api/recognize_face_frame', methods=['POST'])
+@login_required
+def recognize_face_frame():
+    """
+    Binary frame upload: a raw image/jpeg body with class_name and subject_id
+    in the query string, or multipart/form-data with a 'frame' file part.
+    The bytes are decoded straight from the request buffer (no base64 or JSON).
+    """
+    try:
+        if request.content_length and request.content_length > app.config['MAX_FRAME_BYTES']:
+            return jsonify({'success': False, 'error': 'Frame too large'}), 413
         
-        # Get active session for this faculty and subject
-        active_session = AttendanceSession.query.filter_by(
-            faculty_id=current_user.faculty_id,
+        if request.mimetype == 'multipart/form-data':
+            upload = request.files.get('frame')
+            buffer = upload.read() if upload else b''
+            class_name = request.form.get('class_name')
+            subject_id = request.form.get('subject_id')
+        else:
+            buffer = request.get_data(cache=False)
+            class_name = request.args.get('class_name')
+            subject_id = request.args.get('subject_id')
+        
+        if not all([buffer, class_name, subject_id]):
+            return jsonify({'success': False, 'error': 'Missing data'})
+        
+        frame = decode_frame(buffer)
+        if frame is None:
+            return jsonify({'success': False, 'error': 'Invalid image'})
+        
+        results = recognize_frame(frame, class_name, subject_id, current_user.faculty_id)
+        if not results:
+            return jsonify({'success': True, 'results': [], 'message': 'No faces detected'})
+        return jsonify({'success': True, 'results': results})
+        
+    except (InferenceQueueFull, InferenceTimeout) as e:
+        return inference_busy_response(e)
+    except Exception as e:
+        print(f"API Error: {e}")
+        return jsonify({'success': False, 'error': str(e)})
+
+def decode_frame(buffer):
+    """Decode JPEG/PNG bytes to a BGR frame without copying them first. Returns None if undecodable."""
+    return cv2.imdecode(np.frombuffer(buffer, np.uint8), cv2.IMREAD_COLOR)
+
+def find_active_session(faculty_id, subject_id):
+    """(id, status) of the faculty's Active, else Reopened, session for a subject; (None, None) if neither"""
+    for status in ('Active', 'Reopened'):
+        row = db.session.query(AttendanceSession.id, AttendanceSession.status).filter_by(
+            faculty_id=faculty_id,
             subject_id=subject_id,
-            status='Active'
+            status=status
         ).order_by(AttendanceSession.start_time.desc()).first()
+        if row:
+            return row.id, row.status
+    return None, None
+
+def recognize_frame(frame, class_name, subject_id, faculty_id, active_session=None):
+    """
+    Match and mark the faces in one decoded frame; returns the per-face results
+    (empty if no faces were found). Shared by the HTTP routes and the WebSocket
+    channel, which passes an already resolved active_session (id, status).
+    """
+    # Get the active (or reopened) session for this faculty and subject
+    if active_session is None:
+        active_session = find_active_session(faculty_id, subject_id)
+    session_id, session_status = active_session
+    
+    # Faces tracked from earlier frames and already marked skip encoding.
+    # A concurrent frame for the same session just runs untracked.
+    tracker = session_trackers.get((faculty_id, int(subject_id), session_id))
+    tracking = tracker.lock.acquire(blocking=False)
+    try:
+        skip_boxes = tracker.begin_frame() if tracking else None
         
-        # Also check for reopened session
-        if not active_session:
-            active_session = AttendanceSession.query.filter_by(
-                faculty_id=current_user.faculty_id,
-                subject_id=subject_id,
-                status='Reopened'
-            ).order_by(AttendanceSession.start_time.desc()).first()
+        # 1. Analyze Faces (Get Encodings + Liveness) on the inference pool
+        faces_data = inference_service.analyze(frame, skip_boxes)
+        tracks = tracker.update(faces_data) if tracking else [None] * len(faces_data)
+        if not faces_data:
+            return []
         
-        session_id = active_session.id if active_session else None
+        def remember(track, student=None, marked=False):
+            if track is not None:
+                tracker.resolve(track, student, marked)
         
-        # 3. Match Each Detected Face
-        for face in faces_data:
-            unknown_encoding = face['encoding']
-            is_live = face['is_smiling']
+        encoded = [i for i, face in enumerate(faces_data) if face['encoding'] is not None]
+        session_trackers.record(len(encoded), len(faces_data) - len(encoded))
             
-            best_match = None
-            best_distance = 1.0  # Start with worst possible distance
-            tolerance = 0.45  # Standardized tolerance threshold
+        # 2. Load Class Gallery (cached (N, 128) float32 matrix, one DB query per miss)
+        gallery = encoding_cache.get(class_name)
 
+        results = []
+        today = date.today()
+        
+        # 3. Match all encoded faces against the gallery in one vectorized pass
+        tolerance = 0.45  # Standardized tolerance threshold
+        probes = [faces_data[i]['encoding'] for i in encoded]
+        best_indices, best_distances = match_encodings(probes, gallery.matrix, gallery.sq_norms)
+        # Near misses on the centroid get a second look against the enrollment templates
+        best_distances = refine_with_templates(probes, best_indices, best_distances, gallery.templates, tolerance)
+        matches = dict(zip(encoded, zip(best_indices, best_distances)))
+        
+        # Matched, live faces waiting to be marked: (index in results, student, track)
+        to_mark = []
+        for i, (face, track) in enumerate(zip(faces_data, tracks)):
+            if face['encoding'] is None:
+                # Skipped by the tracker: still the same, already marked student
+                results.append({
+                    'status': 'existing',
+                    'name': track.student.name,
+                    'enrollment': track.student.enrollment_number,
+                    'message': 'Already Marked',
+                    'location': face['location']
+                })
+                continue
             
-            # Find best match from loaded students
-            import face_recognition
-            if known_faces:
-                for entry in known_faces:
-                    dist = face_recognition.face_distance([np.array(entry['encoding'])], np.array(unknown_encoding))[0]
-                    # Debug print to help tune threshold
-                    if dist < 0.6:
-                         print(f"DEBUG: Checking {entry['student'].name} - Distance: {dist}")
-                         
-                    if dist < best_distance:
-                        best_distance = dist
-                        best_match = entry['student']
+            best_index, best_distance = matches[i]
+            is_live = face['is_smiling']
+            best_match = gallery.student(best_index) if best_index >= 0 else None
             
             # Check if best match meets threshold
             if best_match and best_distance < tolerance:
@@ -674,6 +900,7 @@ def recognize_face():
                 
                 # LIVENESS CHECK
                 if not is_live:
+                    remember(track, best_match)
                     results.append({
                         'status': 'liveness_failed',
                         'name': best_match.name,
@@ -683,73 +910,247 @@ def recognize_face():
                     })
                     continue
                 
-                # 4. Transaction Handling per Student (Prevent Duplicates)
-                try:
-                    # Check existence first (cleaner than relying solely on IntegrityError for feedback)
-                    existing = AttendanceRecord.query.filter_by(
-                        student_id=best_match.student_id,
-                        date=today,
-                        subject_id=subject_id
-                    ).first()
-                    
-                    if existing:
-                        results.append({
-                            'status': 'existing',
-                            'name': best_match.name,
-                            'enrollment': best_match.enrollment_number,
-                            'message': 'Already Marked',
-                            'location': face['location']
-                        })
-                    else:
-                        # Determine status based on session status
-                        if active_session and active_session.status == 'Reopened':
-                            record_status = 'Late'
-                        else:
-                            record_status = 'Present'
-                        
-                        # Attempt Insert
-                        record = AttendanceRecord(
-                            date=today,
-                            time=datetime.now().time(),
-                            status=record_status,
-                            method='FaceID',
-                            student_id=best_match.student_id,
-                            faculty_id=current_user.faculty_id,
-                            subject_id=subject_id,
-                            session_id=session_id
-                        )
-                        db.session.add(record)
-                        db.session.commit()
-                        
-                        results.append({
-                            'status': 'marked',
-                            'name': best_match.name,
-                            'enrollment': best_match.enrollment_number,
-                            'message': 'Marked Present',
-                            'location': face['location']
-                        })
-                except IntegrityError:
-                    db.session.rollback() # Important!
-                    results.append({
-                        'status': 'existing',
-                        'name': best_match.name,
-                        'enrollment': best_match.enrollment_number,
-                        'message': 'Already Marked (Duplicate)',
-                        'location': face['location']
-                    })
-                except Exception as e:
-                    db.session.rollback()
-                    print(f"Error marking for {best_match.name}: {e}")
-                    results.append({'status': 'error', 'message': str(e), 'location': face['location']})
+                results.append({
+                    'name': best_match.name,
+                    'enrollment': best_match.enrollment_number,
+                    'location': face['location']
+                })
+                to_mark.append((len(results) - 1, best_match, track))
             else:
+                remember(track)
                 results.append({'status': 'unknown', 'message': 'Unknown Face', 'location': face['location']})
+        
+        # 4. Mark every matched student in one batch (one SELECT, one upsert, one commit)
+        if to_mark:
+            # Determine status based on session status
+            if session_status == 'Reopened':
+                record_status = 'Late'
+            else:
+                record_status = 'Present'
+            
+            try:
+                outcome = mark_students_bulk(
+                    [student.student_id for _, student, _ in to_mark],
+                    subject_id=int(subject_id),
+                    faculty_id=faculty_id,
+                    status=record_status,
+                    session_id=session_id,
+                    on_date=today
+                )
+                marked_now = set()
+                for i, student, track in to_mark:
+                    state = outcome[student.student_id]
+                    remember(track, student, marked=True)
+                    if state == MARKED and student.student_id not in marked_now:
+                        # Same student twice in one frame: the second face reports Already Marked
+                        marked_now.add(student.student_id)
+                        results[i].update(status='marked', message='Marked Present')
+                    elif state == DUPLICATE:
+                        results[i].update(status='existing', message='Already Marked (Duplicate)')
+                    else:
+                        results[i].update(status='existing', message='Already Marked')
+            except Exception as e:
+                db.session.rollback()
+                print(f"Error marking attendance: {e}")
+                for i, _, _ in to_mark:
+                    results[i] = {'status': 'error', 'message': str(e), 'location': results[i]['location']}
+
+        return results
+    finally:
+        if tracking:
+            tracker.lock.release()
+
+def session_roster(session_id, class_name):
+    """Marked (Present/Late) students in a session vs. the class size"""
+    present = AttendanceRecord.query.filter(
+        AttendanceRecord.session_id == session_id,
+        AttendanceRecord.status.in_(['Present', 'Late'])
+    ).count()
+    return {'type': 'roster', 'present': present, 'class_size': len(encoding_cache.get(class_name).student_ids)}
+
+def recognize_socket(ws):
+    """
+    Streaming recognition for one AttendanceSession (/ws/recognize?session_id=N).
+    Login, the session row and its class are resolved once at connect. Each
+    binary message is a JPEG frame answered by a 'results' message; 'roster'
+    messages follow marks, and the session is re-checked every few seconds so
+    the scanner learns when it has been ended.
+    """
+    if not current_user.is_authenticated or session.get('user_type') != 'faculty':
+        ws.send(json.dumps({'type': 'error', 'message': 'Unauthorized'}))
+        return
+    
+    attendance_session = AttendanceSession.query.filter_by(
+        id=request.args.get('session_id', type=int),
+        faculty_id=current_user.faculty_id
+    ).first()
+    if not attendance_session or attendance_session.status not in ['Active', 'Reopened']:
+        ws.send(json.dumps({'type': 'error', 'message': 'No active session'}))
+        return
+    
+    # Plain values only: per-frame commits expire ORM objects
+    faculty_id = current_user.faculty_id
+    session_id = attendance_session.id
+    subject_id = attendance_session.subject_id
+    class_name = attendance_session.class_name
+    active_session = (session_id, attendance_session.status)
+    roster = session_roster(session_id, class_name)
+    db.session.close()
+    
+    ws.send(json.dumps({'type': 'ready', 'session_id': session_id, 'class_name': class_name,
+                        'subject_id': subject_id, 'status': active_session[1]}))
+    ws.send(json.dumps(roster))
+    print(f"DEBUG: Scanner socket opened for session {session_id}")
+    
+    recheck = app.config['WS_SESSION_RECHECK']
+    last_check = datetime.now()
+    while True:
+        message = ws.receive(timeout=recheck)
+        try:
+            if (datetime.now() - last_check).total_seconds() >= recheck:
+                last_check = datetime.now()
+                status = db.session.query(AttendanceSession.status).filter_by(id=session_id).scalar()
+                if status not in ['Active', 'Reopened']:
+                    ws.send(json.dumps({'type': 'session_ended', 'status': status}))
+                    break
+                if status != active_session[1]:
+                    active_session = (session_id, status)
+                    ws.send(json.dumps({'type': 'status', 'status': status}))
+                # Picks up marks made by other scanners or manual entry
+                latest = session_roster(session_id, class_name)
+                if latest != roster:
+                    roster = latest
+                    ws.send(json.dumps(roster))
+            
+            if message is None:
+                continue  # receive timed out
+            if isinstance(message, str):
+                if json.loads(message).get('type') == 'ping':
+                    ws.send(json.dumps({'type': 'pong'}))
+                continue
+            if len(message) > app.config['MAX_FRAME_BYTES']:
+                ws.send(json.dumps({'type': 'error', 'message': 'Frame too large'}))
+                continue
+            
+            frame = decode_frame(message)
+            if frame is None:
+                ws.send(json.dumps({'type': 'error', 'message': 'Invalid image'}))
+                continue
+            
+            try:
+                results = recognize_frame(frame, class_name, subject_id, faculty_id, active_session)
+            except (InferenceQueueFull, InferenceTimeout):
+                ws.send(json.dumps({'type': 'busy', 'retry_after': 1}))
+                continue
+            ws.send(json.dumps({'type': 'results', 'results': results}))
+            
+            if any(r.get('status') == 'marked' for r in results):
+                roster = session_roster(session_id, class_name)
+                ws.send(json.dumps(roster))
+        except ValueError as e:
+            ws.send(json.dumps({'type': 'error', 'message': str(e)}))
+        finally:
+            # Don't hold a pooled connection while waiting for the next frame
+            db.session.close()
+    
+    print(f"DEBUG: Scanner socket closed for session {session_id}")
 
+if sock is not None:
+    sock.route('/ws/recognize')(recognize_socket)
+
+@app.route('/api/identify_face', methods=['POST'])
+@login_required
+def identify_face():
+    """Identify faces against every enrolled student (open gates, exam halls). Does not mark attendance."""
+    if session.get('user_type') not in ['admin', 'faculty']:
+        return jsonify({'success': False, 'message': 'Unauthorized'})
+    
+    try:
+        data = request.get_json()
+        image_data = data.get('image')
+        k = max(1, min(int(data.get('k', 3)), 20))
+        nprobe = data.get('nprobe')  # Higher = better recall, slower
+        nprobe = int(nprobe) if nprobe else None
+        
+        if not image_data:
+            return jsonify({'success': False, 'error': 'Missing data'})
+        
+        image_data = image_data.split(',')[1] if ',' in image_data else image_data
+        nparr = np.frombuffer(base64.b64decode(image_data), np.uint8)
+        frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        
+        faces_data = inference_service.analyze(frame)
+        if not faces_data:
+            return jsonify({'success': True, 'results': [], 'message': 'No faces detected'})
+        
+        tolerance = 0.45
+        ids, distances = campus_index.search([face['encoding'] for face in faces_data], k=k, nprobe=nprobe)
+        
+        # One query for the names of every candidate
+        candidate_ids = {int(i) for i in ids.ravel() if i >= 0}
+        students = {}
+        if candidate_ids:
+            rows = db.session.query(
+                Student.student_id, Student.name, Student.enrollment_number, Student.class_name
+            ).filter(Student.student_id.in_(candidate_ids)).all()
+            students = {r.student_id: r for r in rows}
+        
+        results = []
+        for face, face_ids, face_distances in zip(faces_data, ids, distances):
+            candidates = []
+            for student_id, distance in zip(face_ids, face_distances):
+                s = students.get(int(student_id))
+                if s is None:
+                    continue
+                candidates.append({
+                    'student_id': s.student_id,
+                    'name': s.name,
+                    'enrollment': s.enrollment_number,
+                    'class_name': s.class_name,
+                    'distance': round(float(distance), 4)
+                })
+            matched = bool(candidates) and candidates[0]['distance'] < tolerance
+            results.append({
+                'status': 'identified' if matched else 'unknown',
+                'candidates': candidates,
+                'location': face['location']
+            })
+        
         return jsonify({'success': True, 'results': results})
         
+    except (InferenceQueueFull, InferenceTimeout) as e:
+        return inference_busy_response(e)
     except Exception as e:
         print(f"API Error: {e}")
         return jsonify({'success': False, 'error': str(e)})
 
+@periodic_task(60)
+def refresh_campus_index():
+    """Rebuild a stale campus index off the request path (only once this process has used it)."""
+    campus_index.rebuild(only_if_due=True)
+
+@app.route('/api/metrics')
+@login_required
+def metrics():
+    """In-process cache and inference counters for this worker"""
+    if session.get('user_type') != 'admin':
+        return jsonify({'success': False, 'message': 'Unauthorized'}), 403
+
+    return jsonify({
+        'success': True,
+        'pid': os.getpid(),
+        'encoding_cache': encoding_cache.stats(),
+        'identity_cache': identity_cache.stats(),
+        'campus_index': campus_index.stats(),
+        'stats_cache': stats_cache.stats(),
+        'inference': inference_service.stats(),
+        'face_tracker': session_trackers.stats(),
+        'jobs': job_stats(),
+        'session_expiry': session_expiry_stats(),
+        'login': login_stats(),
+        'db_pool': pool_stats(db.engine)
+    })
+
 # --- SESSION MANAGEMENT API ---
 @app.route('/api/session_status')
 @login_required
@@ -764,10 +1165,9 @@ def session_status():
     ).order_by(AttendanceSession.start_time.desc()).first()
     
     if active_session:
-        # Calculate remaining time
-        elapsed = datetime.now() - active_session.start_time
-        remaining_seconds = (active_session.duration_minutes * 60) - elapsed.total_seconds()
-        remaining_minutes = max(0, int(remaining_seconds / 60))
+        # Remaining time until the expiry scheduler ends the session
+        expires_at = active_session.expires_at or session_expires_at(active_session.start_time, active_session.duration_minutes)
+        remaining_seconds = max(0, int((expires_at - datetime.now()).total_seconds()))
         
         return jsonify({
             'active': True,
@@ -775,7 +1175,8 @@ def session_status():
             'class_name': active_session.class_name,
             'subject_id': active_session.subject_id,
             'status': active_session.status,
-            'remaining_minutes': remaining_minutes
+            'remaining_minutes': remaining_seconds // 60,
+            'remaining_seconds': remaining_seconds
         })
     
     # Check for reopened session
@@ -807,12 +1208,18 @@ def start_session():
     print(f"DEBUG: start_session received data: {data}") # DEBUG LOG
     class_name = data.get('class_name')
     subject_id = data.get('subject_id')
-    duration = data.get('duration', 10)
+    try:
+        duration = int(data.get('duration', 10))
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'message': 'Invalid duration'})
     
     if not all([class_name, subject_id]):
         print("DEBUG: Missing required fields for start_session") # DEBUG LOG
         return jsonify({'success': False, 'message': 'Missing required fields'})
     
+    # A session whose time ran out before the scheduler's next sweep doesn't block a new one
+    expire_sessions(faculty_id=current_user.faculty_id)
+    
     # Check if there's already an active session
     existing = AttendanceSession.query.filter_by(
         faculty_id=current_user.faculty_id,
@@ -823,11 +1230,14 @@ def start_session():
         return jsonify({'success': False, 'message': 'An active session already exists'})
     
     # Create new session
+    start_time = datetime.now()
     new_session = AttendanceSession(
         faculty_id=current_user.faculty_id,
         subject_id=subject_id,
         class_name=class_name,
+        start_time=start_time,
         duration_minutes=duration,
+        expires_at=session_expires_at(start_time, duration),
         status='Active'
     )
     
@@ -864,44 +1274,13 @@ def end_session():
     if attendance_session.status == 'Ended':
         return jsonify({'success': False, 'message': 'Session already ended'})
     
-    # Mark session as ended
-    attendance_session.status = 'Ended'
-    attendance_session.end_time = datetime.now()
-    
-    # Get all students in the class
-    students = Student.query.filter_by(class_name=attendance_session.class_name).all()
-    
-    # Get students already marked present
-    marked_student_ids = {r.student_id for r in AttendanceRecord.query.filter_by(
-        date=attendance_session.start_time.date(),
-        subject_id=attendance_session.subject_id,
-        status='Present'
-    ).all()}
-    
-    # Mark absent students
-    absent_count = 0
-    for student in students:
-        if student.student_id not in marked_student_ids:
-            # Check if already marked absent
-            existing = AttendanceRecord.query.filter_by(
-                student_id=student.student_id,
-                date=attendance_session.start_time.date(),
-                subject_id=attendance_session.subject_id
-            ).first()
-            
-            if not existing:
-                absent_record = AttendanceRecord(
-                    date=attendance_session.start_time.date(),
-                    time=datetime.now().time(),
-                    status='Absent',
-                    method='Auto',
-                    student_id=student.student_id,
-                    faculty_id=current_user.faculty_id,
-                    subject_id=attendance_session.subject_id,
-                    session_id=attendance_session.id
-                )
-                db.session.add(absent_record)
-                absent_count += 1
+    # Mark session as ended and everyone without a record as absent (single INSERT ... SELECT)
+    absent_ids = end_attendance_session(attendance_session)
+    if absent_ids is None:
+        db.session.rollback()
+        return jsonify({'success': False, 'message': 'Session already ended'})
+    absent_count = len(absent_ids)
+    session_trackers.discard((current_user.faculty_id, attendance_session.subject_id, attendance_session.id))
     
     db.session.commit()
     
@@ -973,6 +1352,7 @@ def manual_attendance():
                     subject_id=subject_id
                 )
                 db.session.add(record)
+                update_summary([(student_id, subject_id, status)])
                 db.session.commit()
                 flash('Attendance marked manually', 'success')
             else:
@@ -984,7 +1364,7 @@ def manual_attendance():
     class_name = request.args.get('class_name')
     students = []
     if class_name:
-        students = Student.query.filter_by(class_name=class_name).all()
+        students = Student.query.options(ROSTER).filter_by(class_name=class_name).all()
         
     return render_template('manual_attendance.html', students=students, class_name=class_name)
 
@@ -995,12 +1375,61 @@ def reports():
     user_type = session.get('user_type', 'faculty')
     return render_template('reports.html', user_type=user_type)
 
+REPORT_PAGE_MAX = 500
+
+def report_faculty_scope():
+    """Faculty see only their own records in reports and exports; admins see all (None)."""
+    return current_user.faculty_id if session.get('user_type') == 'faculty' else None
+
+def apply_report_filters(query, start_date, end_date, class_name, faculty_id=None):
+    """Date range, class and faculty scoping shared by the report and export APIs."""
+    if start_date:
+        query = query.filter(AttendanceRecord.date >= datetime.strptime(start_date, '%Y-%m-%d').date())
+    if end_date:
+        query = query.filter(AttendanceRecord.date <= datetime.strptime(end_date, '%Y-%m-%d').date())
+    if class_name:
+        query = query.filter(Student.class_name == class_name)
+        
+    if faculty_id is not None:
+        query = query.filter(AttendanceRecord.faculty_id == faculty_id)
+    
+    return query
+
+def encode_report_cursor(record_date, record_id):
+    return base64.urlsafe_b64encode(f'{record_date.isoformat()}|{record_id}'.encode()).decode()
+
+def decode_report_cursor(cursor):
+    """Returns (date, record_id) or raises ValueError."""
+    record_date, record_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+    return datetime.strptime(record_date, '%Y-%m-%d').date(), int(record_id)
+
+def estimate_row_count(query):
+    """
+    Planner row estimate on PostgreSQL (no scan); SQLite has no estimator,
+    so it falls back to an exact COUNT.
+    """
+    if db.engine.dialect.name == 'postgresql':
+        statement = query.statement.compile(db.engine, compile_kwargs={'literal_binds': True})
+        plan = db.session.execute(db.text(f'EXPLAIN (FORMAT JSON) {statement}')).scalar()
+        plan = json.loads(plan) if isinstance(plan, str) else plan
+        return int(plan[0]['Plan']['Plan Rows']), True
+    return query.order_by(None).count(), False
+
 @app.route('/api/get_attendance')
 @login_required
 def get_attendance():
+    """
+    Attendance rows for the reports page, newest first.
+    Pass limit (and the returned next_cursor) to page through results with
+    keyset pagination on (date, record_id); count=exact|estimate adds a total
+    to the first page. Without limit every row is returned.
+    """
     start_date = request.args.get('start_date')
     end_date = request.args.get('end_date')
     class_name = request.args.get('class_name')
+    limit = request.args.get('limit', type=int)
+    cursor = request.args.get('cursor')
+    count_mode = request.args.get('count')
     
     # Validate date range
     if start_date and end_date:
@@ -1012,38 +1441,106 @@ def get_attendance():
         except ValueError:
             return jsonify({'success': False, 'error': 'Invalid date format'})
     
+    # Only the columns the table shows, not full ORM entities
     query = db.session.query(
-        AttendanceRecord, Student, Subject, Faculty
-    ).join(Student).join(Subject).join(Faculty)
+        AttendanceRecord.record_id, AttendanceRecord.date, AttendanceRecord.time,
+        AttendanceRecord.status, AttendanceRecord.method,
+        Student.name.label('student_name'), Student.enrollment_number, Student.class_name,
+        Subject.name.label('subject_name'), Faculty.name.label('faculty_name')
+    ).select_from(AttendanceRecord).join(Student).join(Subject).join(Faculty)
+    try:
+        query = apply_report_filters(query, start_date, end_date, class_name, report_faculty_scope())
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Invalid date format'})
     
-    if start_date:
-        query = query.filter(AttendanceRecord.date >= datetime.strptime(start_date, '%Y-%m-%d').date())
-    if end_date:
-        query = query.filter(AttendanceRecord.date <= datetime.strptime(end_date, '%Y-%m-%d').date())
-    if class_name:
-        query = query.filter(Student.class_name == class_name)
-        
-    if session.get('user_type') == 'faculty':
-        query = query.filter(AttendanceRecord.faculty_id == current_user.faculty_id)
-        
-    records = query.all()
-    
-    result = []
-    for r, s, sub, f in records:
-        result.append({
-            'date': r.date.strftime('%Y-%m-%d'),
-            'time': r.time.strftime('%H:%M:%S') if r.time else '-',
-            'lecture_number': '-', # Not tracked in DB
-            'student_name': s.name,
-            'enrollment_number': s.enrollment_number,
-            'class_name': s.class_name,
-            'subject': sub.name,
-            'status': r.status,
-            'method': r.method,
-            'faculty_name': f.name
-        })
+    response = {'success': True}
+    if count_mode in ('exact', 'estimate') and not cursor:
+        if count_mode == 'estimate':
+            response['total'], response['total_is_estimate'] = estimate_row_count(query)
+        else:
+            response['total'], response['total_is_estimate'] = query.order_by(None).count(), False
+    
+    query = query.order_by(AttendanceRecord.date.desc(), AttendanceRecord.record_id.desc())
+    if cursor:
+        try:
+            cursor_date, cursor_id = decode_report_cursor(cursor)
+        except (ValueError, UnicodeDecodeError, binascii.Error):
+            return jsonify({'success': False, 'error': 'Invalid cursor'})
+        query = query.filter(tuple_(AttendanceRecord.date, AttendanceRecord.record_id) < (cursor_date, cursor_id))
+    
+    if limit:
+        limit = max(1, min(limit, REPORT_PAGE_MAX))
+        records = query.limit(limit + 1).all()
+        has_more = len(records) > limit
+        records = records[:limit]
+        response['next_cursor'] = encode_report_cursor(records[-1].date, records[-1].record_id) if has_more else None
+    else:
+        records = query.all()
+    
+    response['data'] = [{
+        'date': r.date.strftime('%Y-%m-%d'),
+        'time': r.time.strftime('%H:%M:%S') if r.time else '-',
+        'lecture_number': '-', # Not tracked in DB
+        'student_name': r.student_name,
+        'enrollment_number': r.enrollment_number,
+        'class_name': r.class_name,
+        'subject': r.subject_name,
+        'status': r.status,
+        'method': r.method,
+        'faculty_name': r.faculty_name
+    } for r in records]
         
-    return jsonify({'success': True, 'data': result})
+    return jsonify(response)
+
+EXPORT_COLUMNS = ['Date', 'Time', 'Student Name', 'Enrollment', 'Class', 'Subject', 'Status', 'Method', 'Faculty']
+EXPORT_BATCH_SIZE = 1000
+
+def export_attendance_query(start_date, end_date, class_name, faculty_id=None):
+    """Column-projected export query with the report filters and faculty scoping applied."""
+    query = db.session.query(
+        AttendanceRecord.date, AttendanceRecord.time, Student.name, Student.enrollment_number,
+        Student.class_name, Subject.name, AttendanceRecord.status, AttendanceRecord.method, Faculty.name
+    ).select_from(AttendanceRecord).join(Student).join(Subject).join(Faculty)
+    
+    return apply_report_filters(query, start_date, end_date, class_name, faculty_id)
+
+def export_row(row):
+    r_date, r_time, name, enrollment, class_name, subject, status, method, faculty_name = row
+    return [
+        r_date.strftime('%Y-%m-%d'),
+        r_time.strftime('%H:%M:%S') if r_time else '-',
+        name, enrollment, class_name, subject, status, method, faculty_name
+    ]
+
+def stream_csv(query, compress=False):
+    """
+    Yield the export as CSV chunks, reading rows through a server-side cursor
+    (yield_per) so memory stays constant regardless of the number of rows.
+    With compress=True the chunks are gzip-compressed on the fly.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None  # wbits 31 = gzip container
+    
+    def drain():
+        chunk = buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate(0)
+        return compressor.compress(chunk) if compressor else chunk
+    
+    writer.writerow(EXPORT_COLUMNS)
+    for row in query.yield_per(EXPORT_BATCH_SIZE):
+        writer.writerow(export_row(row))
+        if buffer.tell() >= 64 * 1024:
+            chunk = drain()
+            if chunk:
+                yield chunk
+    
+    chunk = drain()
+    if compressor:
+        chunk += compressor.flush()
+    if chunk:
+        yield chunk
 
 @app.route('/api/export_attendance')
 @login_required
@@ -1053,57 +1550,53 @@ def export_attendance():
     class_name = request.args.get('class_name')
     fmt = request.args.get('format', 'csv')
     
-    query = db.session.query(
-        AttendanceRecord, Student, Subject, Faculty
-    ).join(Student).join(Subject).join(Faculty)
-    
-    if start_date:
-        query = query.filter(AttendanceRecord.date >= datetime.strptime(start_date, '%Y-%m-%d').date())
-    if end_date:
-        query = query.filter(AttendanceRecord.date <= datetime.strptime(end_date, '%Y-%m-%d').date())
-    if class_name:
-        query = query.filter(Student.class_name == class_name)
-        
-    if session.get('user_type') == 'faculty':
-        query = query.filter(AttendanceRecord.faculty_id == current_user.faculty_id)
-        
-    records = query.all()
-    
-    data = []
-    for r, s, sub, f in records:
-        data.append({
-            'Date': r.date.strftime('%Y-%m-%d'),
-            'Time': r.time.strftime('%H:%M:%S') if r.time else '-',
-            'Student Name': s.name,
-            'Enrollment': s.enrollment_number,
-            'Class': s.class_name,
-            'Subject': sub.name,
-            'Status': r.status,
-            'Method': r.method,
-            'Faculty': f.name
-        })
-    
-    df = pd.DataFrame(data)
-    
-    output = BytesIO()
     if fmt == 'excel':
-        df.to_excel(output, index=False, engine='openpyxl')
-        mimetype = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-        filename = f'attendance_report_{date.today()}.xlsx'
-    else:
-        df.to_csv(output, index=False)
-        mimetype = 'text/csv'
-        filename = f'attendance_report_{date.today()}.csv'
-        
-    output.seek(0)
-    
-    return send_file(
-        output,
-        mimetype=mimetype,
-        as_attachment=True,
-        download_name=filename
+        # The workbook is built in memory by a background job; the page polls it and downloads the result
+        job_id = enqueue('export_excel', {
+            'start_date': start_date,
+            'end_date': end_date,
+            'class_name': class_name,
+            'faculty_id': report_faculty_scope(),
+        }, created_by=current_user.get_id())
+        return jsonify({'success': True, 'job_id': job_id, 'message': 'Export started'}), 202
+    
+    # CSV is streamed row by row instead of being built in memory
+    query = export_attendance_query(start_date, end_date, class_name, report_faculty_scope())
+    compress = request.args.get('compress') == 'gzip'
+    filename = f'attendance_report_{date.today()}.csv' + ('.gz' if compress else '')
+    return Response(
+        stream_with_context(stream_csv(query, compress)),
+        mimetype='application/gzip' if compress else 'text/csv',
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
     )
 
+@job_handler('export_excel')
+def export_excel_job(payload, job):
+    """Write the filtered attendance report to an .xlsx file in the job files directory."""
+    try:
+        query = export_attendance_query(payload.get('start_date'), payload.get('end_date'),
+                                        payload.get('class_name'), payload.get('faculty_id'))
+    except ValueError:
+        raise PermanentJobError('Invalid date format')
+    
+    # Excel needs the whole workbook in memory
+    rows = []
+    for row in query.yield_per(EXPORT_BATCH_SIZE):
+        rows.append(export_row(row))
+        if len(rows) % (EXPORT_BATCH_SIZE * 10) == 0:
+            job.progress(rows=len(rows))  # also keeps the job's lock fresh
+    df = pd.DataFrame(rows, columns=EXPORT_COLUMNS)
+    path = job_file_path(f'attendance_report_{job.id}.xlsx')
+    df.to_excel(path, index=False, engine='openpyxl')
+    
+    return {
+        'path': path,
+        'filename': f'attendance_report_{date.today()}.xlsx',
+        'mimetype': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        'rows': len(df),
+        'message': f'{len(df)} record(s) exported',
+    }
+
 @app.route('/change_password', methods=['GET', 'POST'])
 @login_required
 def change_password():
@@ -1115,8 +1608,10 @@ def change_password():
             flash('Incorrect current password', 'error')
             return redirect(url_for('change_password'))
             
+        user_id = current_user.get_id()
         current_user.password = generate_password_hash(new_pw)
         db.session.commit()
+        identity_cache.invalidate(user_id)
         flash('Password updated successfully', 'success')
         
         if session.get('user_type') == 'student':
@@ -1128,44 +1623,78 @@ def change_password():
 @app.route('/defaulters')
 @login_required
 def defaulters():
-    students = Student.query.all()
-    defaulter_list = []
-    
-    for student in students:
-        # Calculate Percentage
-        total_records = AttendanceRecord.query.filter_by(student_id=student.student_id).count()
-        # Simplified: Assuming 1 total 'possible' class per day since admission (Demo logic)
-        # In real app: Count unique (Subject, Date) from Timetable
-        possible_classes = max(1, (date.today() - student.admission_date).days + 1)
-        
-        # Or simpler for demo: Just use Records as "Attended" and total as fixed number or relative
-        # Let's use: (Present / Total records entries) if records exist, else 0
-        # If no records, technically 0%
-        
-        attended = AttendanceRecord.query.filter_by(student_id=student.student_id, status='Present').count()
-        
-        # For a better demo metric:
-        # Let's assume total classes = total subjects * records today? No.
-        # Let's just use: Percentage = (Attended / Valid Records) * 100
-        # If a student has 5 records and was present in 3, that's 60%
-        
-        total_marked = total_records
-        if total_marked == 0:
-            percentage = 0
-        else:
-            percentage = (attended / total_marked) * 100
-            
-        if percentage < 75:
-            defaulter_list.append({
-                'name': student.name,
-                'enrollment': student.enrollment_number,
-                'class': student.class_name,
-                'attended': attended,
-                'total': total_marked,
-                'percentage': round(percentage, 1)
+    # Percentage = Present / marked records, served from the attendance_summary counters
+    threshold = request.args.get('threshold', type=float)
+    if threshold is None:
+        threshold = app.config['DEFAULTER_THRESHOLD']
+    subject_id = request.args.get('subject_id', type=int)
+    class_name = request.args.get('class_name')
+    
+    join_on = AttendanceSummary.student_id == Student.student_id
+    if subject_id:
+        join_on = and_(join_on, AttendanceSummary.subject_id == subject_id)
+    
+    attended = func.coalesce(func.sum(AttendanceSummary.present), 0)
+    total = func.coalesce(func.sum(AttendanceSummary.total), 0)
+    percentage = case((total > 0, attended * 100.0 / total), else_=0.0)
+    
+    query = db.session.query(
+        Student.student_id, Student.name, Student.enrollment_number, Student.class_name,
+        attended.label('attended'), total.label('total'), percentage.label('percentage')
+    ).outerjoin(AttendanceSummary, join_on).group_by(
+        Student.student_id, Student.name, Student.enrollment_number, Student.class_name
+    ).having(percentage < threshold)
+    if class_name:
+        query = query.filter(Student.class_name == class_name)
+    rows = query.order_by(percentage, Student.name).all()
+    
+    # Per-subject breakdown for the defaulters (one query on the summary primary key)
+    breakdown = {}
+    if rows:
+        subject_rows = db.session.query(
+            AttendanceSummary.student_id, Subject.name, AttendanceSummary.present, AttendanceSummary.total
+        ).join(Subject, Subject.subject_id == AttendanceSummary.subject_id).filter(
+            AttendanceSummary.student_id.in_([r.student_id for r in rows])
+        ).order_by(Subject.name)
+        if subject_id:
+            subject_rows = subject_rows.filter(AttendanceSummary.subject_id == subject_id)
+        for sid, subject_name, present, subject_total in subject_rows:
+            breakdown.setdefault(sid, []).append({
+                'subject': subject_name,
+                'attended': present,
+                'total': subject_total,
+                'percentage': round(present * 100.0 / subject_total, 1) if subject_total else 0
             })
-            
-    return render_template('defaulters.html', defaulters=defaulter_list)
+    
+    defaulter_list = [{
+        'name': r.name,
+        'enrollment': r.enrollment_number,
+        'class': r.class_name,
+        'attended': r.attended,
+        'total': r.total,
+        'percentage': round(r.percentage, 1),
+        'subjects': breakdown.get(r.student_id, [])
+    } for r in rows]
+    
+    subjects = Subject.query.order_by(Subject.class_name, Subject.name).all()
+    return render_template('defaulters.html', defaulters=defaulter_list, threshold=threshold,
+                           subjects=subjects, subject_id=subject_id, class_name=class_name)
+
+@app.route('/api/defaulters/recalculate', methods=['POST'])
+@login_required
+def recalculate_defaulters():
+    """Queue a full rebuild of the attendance_summary counters the defaulter list reads."""
+    if session.get('user_type') != 'admin':
+        return jsonify({'success': False, 'message': 'Unauthorized'}), 403
+    job_id = enqueue('rebuild_summary', created_by=current_user.get_id())
+    return jsonify({'success': True, 'job_id': job_id, 'message': 'Recalculation started'}), 202
+
+@job_handler('rebuild_summary')
+def rebuild_summary_job(payload, job):
+    with db.engine.begin() as conn:
+        rebuild_summary(conn)
+    rows = db.session.query(func.count()).select_from(AttendanceSummary).scalar()
+    return {'rows': rows, 'message': f'Recalculated {rows} student/subject counter(s)'}
 
 # --- LEAVE MANAGEMENT ---
 @app.route('/apply_leave', methods=['GET', 'POST'])
@@ -1338,6 +1867,7 @@ def approve_leave(leave_id):
                 subject_id=leave.subject_id
             )
             db.session.add(attendance_record)
+            update_summary([(leave.student_id, leave.subject_id, 'Leave')])
 
     
     db.session.commit()
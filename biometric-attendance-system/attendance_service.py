@@ -0,0 +1,208 @@
+"""
+Attendance Service Module
+Set-based helpers for writing AttendanceRecord rows, so request handlers
+don't issue one query and one commit per student.
+Every write path also updates the AttendanceSummary counters and, once the
+transaction commits, drops the shared dashboard stats snapshot.
+"""
+from collections import defaultdict
+from datetime import datetime, date
+
+from sqlalchemy import select, exists, literal, func, case, event, update
+
+from models import db, AttendanceRecord, AttendanceSummary, AttendanceSession, Student
+from stats_cache import invalidate_dashboard
+
+# Status -> AttendanceSummary counter column
+SUMMARY_COUNTERS = {
+    'Present': 'present',
+    'Late': 'late',
+    'Leave': 'leave',
+    'Absent': 'absent',
+}
+
+# Outcomes returned by mark_students_bulk
+MARKED = 'marked'
+EXISTING = 'existing'
+DUPLICATE = 'duplicate'  # lost a race with a concurrent insert
+
+# Session.info flag set by update_summary, consumed after commit
+_DASHBOARD_DIRTY = 'dashboard_stats_dirty'
+
+
+@event.listens_for(db.session, 'after_commit')
+def _invalidate_dashboard_after_commit(session):
+    if session.info.pop(_DASHBOARD_DIRTY, False):
+        invalidate_dashboard()
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _clear_dashboard_flag(session):
+    session.info.pop(_DASHBOARD_DIRTY, None)
+
+
+def _dialect_insert(table):
+    if db.engine.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(table)
+
+
+def insert_ignoring_duplicates(table=AttendanceRecord.__table__):
+    """
+    INSERT ... ON CONFLICT DO NOTHING on unique_attendance_per_day for the
+    current database (PostgreSQL uses the named constraint, SQLite the columns).
+    """
+    if db.engine.dialect.name == 'postgresql':
+        return _dialect_insert(table).on_conflict_do_nothing(constraint='unique_attendance_per_day')
+    return _dialect_insert(table).on_conflict_do_nothing(index_elements=['student_id', 'subject_id', 'date'])
+
+
+def update_summary(entries):
+    """
+    Add newly written records to AttendanceSummary.
+    entries: iterable of (student_id, subject_id, status).
+    Issues one multi-row upsert that increments the counters; the caller commits.
+    """
+    deltas = defaultdict(lambda: dict.fromkeys(['present', 'late', 'leave', 'absent', 'total'], 0))
+    for student_id, subject_id, status in entries:
+        delta = deltas[(int(student_id), int(subject_id))]
+        if status in SUMMARY_COUNTERS:
+            delta[SUMMARY_COUNTERS[status]] += 1
+        delta['total'] += 1
+    if not deltas:
+        return
+
+    rows = [dict(student_id=student_id, subject_id=subject_id, **delta)
+            for (student_id, subject_id), delta in deltas.items()]
+    table = AttendanceSummary.__table__
+    stmt = _dialect_insert(table).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['student_id', 'subject_id'],
+        set_={col: table.c[col] + stmt.excluded[col] for col in ('present', 'late', 'leave', 'absent', 'total')}
+    )
+    db.session.execute(stmt)
+    db.session.info[_DASHBOARD_DIRTY] = True
+
+
+def rebuild_summary(conn=None):
+    """
+    Recompute AttendanceSummary from AttendanceRecord with one INSERT ... SELECT.
+    Used to backfill the table and after bulk deletes that bypass this module.
+    """
+    conn = conn if conn is not None else db.session
+    rec = AttendanceRecord.__table__
+    counters = [
+        func.sum(case((rec.c.status == status, 1), else_=0))
+        for status in SUMMARY_COUNTERS
+    ]
+    counts = select(rec.c.student_id, rec.c.subject_id, *counters, func.count()).group_by(
+        rec.c.student_id, rec.c.subject_id
+    )
+    conn.execute(AttendanceSummary.__table__.delete())
+    conn.execute(AttendanceSummary.__table__.insert().from_select(
+        ['student_id', 'subject_id', *SUMMARY_COUNTERS.values(), 'total'], counts
+    ))
+
+
+def mark_students_bulk(student_ids, subject_id, faculty_id, status='Present', method='FaceID',
+                       session_id=None, on_date=None):
+    """
+    Mark attendance for several students with two statements and one commit:
+    a single SELECT for records that already exist, then one multi-row upsert.
+    Returns {student_id: MARKED | EXISTING | DUPLICATE}.
+    The caller is responsible for rolling back if this raises.
+    """
+    on_date = on_date or date.today()
+    student_ids = list(dict.fromkeys(int(s) for s in student_ids))
+    if not student_ids:
+        return {}
+
+    existing = set(db.session.execute(
+        select(AttendanceRecord.student_id).where(
+            AttendanceRecord.subject_id == subject_id,
+            AttendanceRecord.date == on_date,
+            AttendanceRecord.student_id.in_(student_ids)
+        )
+    ).scalars())
+
+    outcome = {sid: EXISTING for sid in existing}
+    new_ids = [sid for sid in student_ids if sid not in existing]
+    if new_ids:
+        now = datetime.now().time()
+        rows = [{
+            'date': on_date,
+            'time': now,
+            'status': status,
+            'method': method,
+            'student_id': sid,
+            'faculty_id': faculty_id,
+            'subject_id': subject_id,
+            'session_id': session_id
+        } for sid in new_ids]
+
+        stmt = insert_ignoring_duplicates().values(rows).returning(AttendanceRecord.student_id)
+        inserted = set(db.session.execute(stmt).scalars())
+        for sid in new_ids:
+            outcome[sid] = MARKED if sid in inserted else DUPLICATE
+        update_summary((sid, subject_id, status) for sid in inserted)
+
+    db.session.commit()
+    return outcome
+
+
+def mark_absentees(attendance_session, faculty_id):
+    """
+    Mark every student of the session's class who has no record for that
+    date and subject as Absent, using a single INSERT ... SELECT with an
+    anti-join instead of one existence query per student.
+    Returns the list of student ids that were marked Absent.
+    The caller commits.
+    """
+    on_date = attendance_session.start_time.date()
+    already_recorded = exists().where(
+        AttendanceRecord.student_id == Student.student_id,
+        AttendanceRecord.date == on_date,
+        AttendanceRecord.subject_id == attendance_session.subject_id
+    )
+
+    absentees = select(
+        literal(on_date, db.Date),
+        literal(datetime.now().time(), db.Time),
+        literal('Absent'),
+        literal('Auto'),
+        Student.student_id,
+        literal(faculty_id, db.Integer),
+        literal(attendance_session.subject_id, db.Integer),
+        literal(attendance_session.id, db.Integer)
+    ).where(
+        Student.class_name == attendance_session.class_name,
+        ~already_recorded
+    )
+
+    stmt = insert_ignoring_duplicates().from_select(
+        ['date', 'time', 'status', 'method', 'student_id', 'faculty_id', 'subject_id', 'session_id'],
+        absentees
+    ).returning(AttendanceRecord.student_id)
+    absent_ids = list(db.session.execute(stmt).scalars())
+    update_summary((sid, attendance_session.subject_id, 'Absent') for sid in absent_ids)
+    return absent_ids
+
+
+def end_attendance_session(attendance_session, end_time=None):
+    """
+    Mark the session Ended and its unmarked students Absent (used by the
+    end_session route and the expiry scheduler). Returns the absent student
+    ids, or None if the session had already been ended concurrently.
+    The caller commits.
+    """
+    # Guarded by status so a manual end and the scheduler can't both end it
+    ended = db.session.execute(
+        update(AttendanceSession)
+        .where(AttendanceSession.id == attendance_session.id, AttendanceSession.status != 'Ended')
+        .values(status='Ended', end_time=end_time or datetime.now())
+    ).rowcount
+    if not ended:
+        return None
+    return mark_absentees(attendance_session, attendance_session.faculty_id)
@@ -0,0 +1,195 @@
+"""
+Auth Service Module
+Login helpers: one UNION ALL lookup across Admin/Faculty/Student, password
+verification on a bounded thread pool, and a per-identifier attempt limiter.
+
+hashlib's scrypt releases the GIL, so a small pool keeps at most
+LOGIN_HASH_WORKERS hashes running per process; a morning login rush queues
+(or is turned away) instead of pinning every gunicorn thread on CPU.
+The limiter is checked before the database and the hash, so a flood against
+one account costs a dictionary lookup. Counts are per process.
+
+Configuration (environment variables):
+    LOGIN_HASH_WORKERS     threads verifying passwords (default 2; 0 = inline)
+    LOGIN_HASH_QUEUE_SIZE  logins allowed to wait for a free thread (default 32)
+    LOGIN_HASH_TIMEOUT     seconds a login waits for its hash (default 5)
+    LOGIN_MAX_ATTEMPTS     attempts per identifier per window (default 10)
+    LOGIN_WINDOW           window length in seconds (default 300)
+"""
+import atexit
+import os
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+from sqlalchemy import literal_column, select, union_all
+from werkzeug.security import check_password_hash
+
+LOGIN_HASH_WORKERS = int(os.getenv('LOGIN_HASH_WORKERS', '2'))
+LOGIN_HASH_QUEUE_SIZE = int(os.getenv('LOGIN_HASH_QUEUE_SIZE', '32'))
+LOGIN_HASH_TIMEOUT = float(os.getenv('LOGIN_HASH_TIMEOUT', '5'))
+LOGIN_MAX_ATTEMPTS = int(os.getenv('LOGIN_MAX_ATTEMPTS', '10'))
+LOGIN_WINDOW = int(os.getenv('LOGIN_WINDOW', '300'))
+
+# user_type is 'admin', 'faculty' or 'student'; user_id is the Flask-Login id
+Credentials = namedtuple('Credentials', ['user_type', 'user_id', 'password_hash'])
+
+
+class LoginBusy(Exception):
+    """Raised when the hashing pool is saturated or a hash took too long."""
+
+
+def find_credentials(identifier):
+    """
+    Looks the identifier up as an admin email, faculty email or student
+    enrollment number in one query (each branch hits that column's unique
+    index). Admin wins over faculty over student, as with the old probes.
+    Returns Credentials or None.
+    """
+    from models import db, Admin, Faculty, Student
+
+    # Constant columns are inlined so the statement text never changes
+    principals = union_all(
+        select(literal_column('0').label('rank'), literal_column("'admin'").label('user_type'),
+               Admin.a_id.label('pk'), Admin.password).where(Admin.email == identifier),
+        select(literal_column('1'), literal_column("'faculty'"),
+               Faculty.faculty_id, Faculty.password).where(Faculty.email == identifier),
+        select(literal_column('2'), literal_column("'student'"),
+               Student.student_id, Student.password).where(Student.enrollment_number == identifier),
+    ).subquery()
+    row = db.session.execute(
+        select(principals.c.user_type, principals.c.pk, principals.c.password)
+        .order_by(principals.c.rank).limit(1)
+    ).first()
+    if row is None:
+        return None
+    return Credentials(row.user_type, f'{row.user_type}_{row.pk}', row.password)
+
+
+class PasswordVerifier:
+    """Bounded front-end to a ThreadPoolExecutor running check_password_hash."""
+
+    def __init__(self, workers=LOGIN_HASH_WORKERS, queue_size=LOGIN_HASH_QUEUE_SIZE, timeout=LOGIN_HASH_TIMEOUT):
+        self.workers = max(0, workers)
+        self.queue_size = max(0, queue_size)
+        self.timeout = timeout
+        self.max_pending = max(1, self.workers) + self.queue_size
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.timeouts = 0
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='login-hash')
+            return self._executor
+
+    def _acquire(self):
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self.rejected += 1
+                raise LoginBusy(f'{self._pending} logins already pending')
+            self._pending += 1
+
+    def _release(self):
+        with self._lock:
+            self._pending -= 1
+
+    def verify(self, password_hash, password):
+        """Returns whether password matches password_hash. Raises LoginBusy."""
+        self._acquire()
+        if self.workers == 0:
+            try:
+                result = check_password_hash(password_hash, password)
+            finally:
+                self._release()
+        else:
+            try:
+                future = self._get_executor().submit(check_password_hash, password_hash, password)
+            except Exception:
+                self._release()
+                raise
+            future.add_done_callback(lambda _: self._release())
+            try:
+                result = future.result(timeout=self.timeout)
+            except FutureTimeoutError:
+                future.cancel()
+                with self._lock:
+                    self.timeouts += 1
+                raise LoginBusy(f'Password check took longer than {self.timeout}s')
+
+        with self._lock:
+            self.completed += 1
+        return result
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'pending': self._pending,
+                'completed': self.completed,
+                'rejected': self.rejected,
+                'timeouts': self.timeouts,
+            }
+
+
+class LoginRateLimiter:
+    """Fixed-window attempt counter per identifier, bounded to max_keys entries."""
+
+    def __init__(self, max_attempts=LOGIN_MAX_ATTEMPTS, window=LOGIN_WINDOW, max_keys=10000):
+        self.max_attempts = max_attempts
+        self.window = window
+        self.max_keys = max_keys
+        self._attempts = OrderedDict()  # identifier -> (window start, attempts)
+        self._lock = threading.Lock()
+        self.blocked = 0
+
+    @staticmethod
+    def _key(identifier):
+        return (identifier or '').strip().lower()
+
+    def allow(self, identifier):
+        """Counts an attempt; returns False once the identifier is over its limit."""
+        key = self._key(identifier)
+        now = time.monotonic()
+        with self._lock:
+            started, attempts = self._attempts.get(key, (now, 0))
+            if now - started >= self.window:
+                started, attempts = now, 0
+            if attempts >= self.max_attempts:
+                self.blocked += 1
+                return False
+            self._attempts[key] = (started, attempts + 1)
+            self._attempts.move_to_end(key)
+            while len(self._attempts) > self.max_keys:
+                self._attempts.popitem(last=False)
+            return True
+
+    def reset(self, identifier):
+        """Clears the count after a successful login."""
+        with self._lock:
+            self._attempts.pop(self._key(identifier), None)
+
+    def stats(self):
+        with self._lock:
+            return {'tracked': len(self._attempts), 'blocked': self.blocked}
+
+
+def stats():
+    return {'hashing': password_verifier.stats(), 'rate_limit': login_limiter.stats()}
+
+
+# Shared instances used by app.py
+password_verifier = PasswordVerifier()
+login_limiter = LoginRateLimiter()
+atexit.register(password_verifier.shutdown)
@@ -0,0 +1,80 @@
+"""
+Benchmark: face detection latency and recall at each DETECTION_SCALE
+Reference boxes come from full-resolution detection; a face counts as found
+at a scale when one of its rescaled boxes overlaps it with IoU >= 0.5.
+Usage: python bench_detection_scale.py <image or directory> [--scales 1.0 0.75 0.5 0.35 0.25]
+"""
+import argparse
+import os
+import time
+
+import cv2
+import numpy as np
+
+from face_recognition_api import detect_face_locations, DETECTION_UPSAMPLE
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+MAX_WIDTH = 800  # attendance.js never sends wider frames
+
+
+def load_frames(path):
+    paths = [path] if os.path.isfile(path) else sorted(
+        os.path.join(path, name) for name in os.listdir(path) if name.lower().endswith(IMAGE_EXTENSIONS)
+    )
+    frames = []
+    for p in paths:
+        frame = cv2.imread(p)
+        if frame is None:
+            continue
+        if frame.shape[1] > MAX_WIDTH:
+            scale = MAX_WIDTH / frame.shape[1]
+            frame = cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        frames.append(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+    return frames
+
+
+def iou(a, b):
+    top, right, bottom, left = max(a[0], b[0]), min(a[1], b[1]), min(a[2], b[2]), max(a[3], b[3])
+    inter = max(0, right - left) * max(0, bottom - top)
+    area = lambda box: (box[1] - box[3]) * (box[2] - box[0])
+    union = area(a) + area(b) - inter
+    return inter / union if union else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('path', help='image file or directory of webcam-style frames')
+    parser.add_argument('--scales', type=float, nargs='+', default=[1.0, 0.75, 0.5, 0.35, 0.25])
+    parser.add_argument('--upsample', type=int, default=DETECTION_UPSAMPLE)
+    args = parser.parse_args()
+
+    frames = load_frames(args.path)
+    if not frames:
+        raise SystemExit(f"No images found in {args.path}")
+
+    reference = [detect_face_locations(frame, scale=1.0, upsample=args.upsample) for frame in frames]
+    total_faces = sum(len(boxes) for boxes in reference)
+
+    print("=" * 60)
+    print(f"Detection benchmark ({len(frames)} frames, {total_faces} reference faces, upsample {args.upsample})")
+    print("=" * 60)
+    print(f"{'scale':>6} {'p50 (ms)':>10} {'p99 (ms)':>10} {'recall':>8} {'extra boxes':>12}")
+
+    for scale in args.scales:
+        timings = []
+        found = 0
+        extra = 0
+        for frame, expected in zip(frames, reference):
+            start = time.perf_counter()
+            boxes = detect_face_locations(frame, scale=scale, upsample=args.upsample)
+            timings.append((time.perf_counter() - start) * 1000)
+            matched = sum(any(iou(e, b) >= 0.5 for b in boxes) for e in expected)
+            found += matched
+            extra += max(0, len(boxes) - matched)
+        recall = found / total_faces if total_faces else 1.0
+        print(f"{scale:>6.2f} {np.percentile(timings, 50):>10.1f} {np.percentile(timings, 99):>10.1f} "
+              f"{recall:>8.3f} {extra:>12}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""
+Benchmark: IVF gallery index vs. exact search for campus-wide identification
+Reports recall@1 (agreement with exact search) and p50/p99 query latency.
+Usage: python bench_gallery_index.py [--size 20000] [--queries 500]
+"""
+import argparse
+import time
+
+import numpy as np
+
+from gallery_index import ExactIndex, IVFIndex
+
+
+class SyntheticFaces:
+    """
+    dlib encodings are not uniform noise: they vary along a few directions
+    (age, skin tone, face shape), and faces cluster by those. Identities are
+    drawn from latent groups in a low-dimensional subspace of the 128-d space,
+    and every photo of a person (enrolled or probe) adds its own pose/lighting
+    noise, mostly along the same directions. Same-person distances land around
+    0.45, under face_recognition's 0.6 threshold, and a probe often falls in a
+    different IVF cell than its enrolled photo, as with real photos.
+    """
+
+    def __init__(self, rng, size, groups=64, latent_dims=24):
+        self.rng = rng
+        self.basis = np.linalg.qr(rng.normal(size=(128, latent_dims)))[0].T
+        centers = rng.normal(0, 0.12, size=(groups, latent_dims))
+        self.identities = centers[rng.integers(0, groups, size)] + rng.normal(0, 0.12, size=(size, latent_dims))
+
+    def photos(self, people):
+        """One new encoding per entry of people (identity indices)."""
+        latent = self.identities[people] + self.rng.normal(0, 0.06, size=(len(people), self.basis.shape[0]))
+        return (latent @ self.basis + self.rng.normal(0, 0.015, size=(len(people), 128))).astype(np.float32)
+
+
+def latencies(index, probes, **kwargs):
+    timings = []
+    results = []
+    for probe in probes:
+        start = time.perf_counter()
+        ids, _ = index.search(probe, k=1, **kwargs)
+        timings.append(time.perf_counter() - start)
+        results.append(ids[0, 0])
+    return np.array(results), np.array(timings) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--size', type=int, default=20000)
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--nlist', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    faces = SyntheticFaces(rng, args.size)
+    vectors = faces.photos(np.arange(args.size))
+    ids = np.arange(1, args.size + 1)
+    # Probe = a new photo of an enrolled student
+    truth = rng.integers(0, args.size, args.queries)
+    probes = faces.photos(truth)
+    same_person = np.linalg.norm(probes - vectors[truth], axis=1)
+
+    exact = ExactIndex().build(ids, vectors)
+    start = time.perf_counter()
+    ivf = IVFIndex(nlist=args.nlist or None).build(ids, vectors)
+    build_time = time.perf_counter() - start
+
+    exact_ids, exact_ms = latencies(exact, probes)
+
+    print("=" * 64)
+    print(f"Gallery index benchmark: {args.size} students, {args.queries} queries")
+    print(f"IVF build: {build_time:.2f}s, {ivf.stats()['nlist']} cells")
+    print(f"Same-person distance p50: {np.median(same_person):.2f}, "
+          f"exact search finds the right student for {np.mean(exact_ids == ids[truth]):.1%} of probes")
+    print("=" * 64)
+    print(f"{'index':<16} {'recall@1':>9} {'p50 (ms)':>10} {'p99 (ms)':>10}")
+    print(f"{'exact':<16} {1.0:>9.3f} {np.percentile(exact_ms, 50):>10.3f} {np.percentile(exact_ms, 99):>10.3f}")
+    for nprobe in (1, 2, 4, 8, 16, 32):
+        found, ms = latencies(ivf, probes, nprobe=nprobe)
+        recall = float(np.mean(found == exact_ids))
+        label = f"ivf nprobe={nprobe}"
+        print(f"{label:<16} {recall:>9.3f} {np.percentile(ms, 50):>10.3f} {np.percentile(ms, 99):>10.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+"""
+Benchmark: fraction of face encodings the session tracker avoids
+Replays a recorded frame sequence (directory of images or a video file) through
+detection + FaceTracker, treating every newly encoded face as identified and
+marked. Without a recording, --synthetic simulates a seated class with box
+jitter and detector drop-outs.
+Usage: python bench_tracker.py <frames dir | video> [--every 1]
+       python bench_tracker.py --synthetic [--students 40] [--minutes 10] [--fps 2]
+"""
+import argparse
+import os
+
+import numpy as np
+
+from face_tracker import FaceTracker, match_boxes, TRACK_REVERIFY_FRAMES
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+
+def recorded_frames(path, every):
+    """Yields face locations per frame of a recording (needs face_recognition)."""
+    import cv2
+    from face_recognition_api import detect_face_locations
+
+    if os.path.isdir(path):
+        names = sorted(n for n in os.listdir(path) if n.lower().endswith(IMAGE_EXTENSIONS))
+        images = (cv2.imread(os.path.join(path, n)) for n in names)
+    else:
+        capture = cv2.VideoCapture(path)
+
+        def read_video():
+            while True:
+                ok, image = capture.read()
+                if not ok:
+                    return
+                yield image
+        images = read_video()
+
+    for index, image in enumerate(images):
+        if image is None or index % every:
+            continue
+        yield detect_face_locations(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
+
+
+def synthetic_frames(students, frames, rng, jitter=2.0, drop_rate=0.03, late_fraction=0.2):
+    """Seated students on a grid; boxes jitter, faces drop out for 1-5 frames, some arrive late."""
+    cols = int(np.ceil(np.sqrt(students * 4 / 3)))
+    size = 56
+    seats = np.array([(60 + (i // cols) * 80, 40 + (i % cols) * 75) for i in range(students)], dtype=float)
+    arrival = np.where(rng.random(students) < late_fraction, rng.integers(0, frames // 2, students), 0)
+    hidden_until = np.zeros(students, dtype=int)
+
+    for f in range(frames):
+        seats += rng.normal(0, jitter / 4, seats.shape)  # slow drift
+        locations = []
+        for s in range(students):
+            if f < arrival[s] or f < hidden_until[s]:
+                continue
+            if rng.random() < drop_rate:
+                hidden_until[s] = f + rng.integers(1, 6)
+                continue
+            top, left = seats[s] + rng.normal(0, jitter, 2)
+            locations.append((int(top), int(left + size), int(top + size), int(left)))
+        yield locations
+
+
+def replay(frame_locations, reverify_every):
+    tracker = FaceTracker(reverify_every=reverify_every)
+    frames = faces = encoded = 0
+    for locations in frame_locations:
+        frames += 1
+        skip_boxes = tracker.begin_frame()
+        skipped = match_boxes(locations, skip_boxes, tracker.iou_threshold) if skip_boxes else [-1] * len(locations)
+        batch = [{'location': loc, 'encoding': None if s >= 0 else True, 'skip': s} for loc, s in zip(locations, skipped)]
+        tracks = tracker.update(batch)
+        for face, track in zip(batch, tracks):
+            faces += 1
+            if face['encoding'] is not None:
+                encoded += 1
+                # Every encoded face is taken as identified and marked
+                tracker.resolve(track, student=track.track_id, marked=True)
+    return frames, faces, encoded
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('path', nargs='?', help='directory of frames or a video file')
+    parser.add_argument('--every', type=int, default=1, help='use every Nth recorded frame')
+    parser.add_argument('--synthetic', action='store_true')
+    parser.add_argument('--students', type=int, default=40)
+    parser.add_argument('--minutes', type=float, default=10)
+    parser.add_argument('--fps', type=float, default=2, help='frames the scanner sends per second')
+    parser.add_argument('--reverify', type=int, nargs='+', default=[5, 10, TRACK_REVERIFY_FRAMES, 50])
+    args = parser.parse_args()
+
+    if not args.synthetic and not args.path:
+        parser.error('give a recording path or --synthetic')
+
+    if args.synthetic:
+        n_frames = int(args.minutes * 60 * args.fps)
+        source = f"synthetic: {args.students} students, {n_frames} frames"
+        make = lambda: synthetic_frames(args.students, n_frames, np.random.default_rng(0))
+    else:
+        recorded = list(recorded_frames(args.path, args.every))
+        source = f"{args.path}: {len(recorded)} frames"
+        make = lambda: iter(recorded)
+
+    print("=" * 60)
+    print(f"Tracker benchmark ({source})")
+    print("=" * 60)
+    print(f"{'reverify':>9} {'faces':>9} {'encoded':>9} {'avoided':>9}")
+    for reverify in args.reverify:
+        frames, faces, encoded = replay(make(), reverify)
+        avoided = 1 - encoded / faces if faces else 0.0
+        print(f"{reverify:>9} {faces:>9} {encoded:>9} {avoided:>8.1%}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,242 @@
+"""
+Bulk Student Import Module
+Imports a CSV of students plus a zip of their photos as a background job
+(job_queue.py): photos are encoded across the inference process pool, valid
+rows go in with one bulk INSERT, and progress / per-row errors are reported
+through the job the browser polls.
+
+CSV columns: name, enrollment_number, class_name, semester, dob, password, photo
+`photo` is the file name inside the zip; if empty, <enrollment_number>.jpg/.jpeg/.png is used.
+
+Configuration (environment variables):
+    IMPORT_MAX_PHOTO_BYTES  largest photo accepted from the zip, uncompressed (default 10 MB)
+    IMPORT_MAX_TOTAL_BYTES  largest total of the photos extracted by one import (default 2 GB)
+"""
+import csv
+import io
+import os
+import shutil
+import uuid
+import zipfile
+from datetime import datetime, date
+
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+from werkzeug.security import generate_password_hash
+from werkzeug.utils import secure_filename
+
+from job_queue import job_handler, enqueue, job_file_path, require_files, PermanentJobError
+from stats_cache import invalidate_dashboard
+
+PROGRESS_EVERY = 10  # rows between progress writes
+REQUIRED_COLUMNS = ('name', 'enrollment_number', 'class_name', 'dob')
+PHOTO_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+# The upload limit only bounds the compressed zip, so uncompressed sizes are checked per member
+IMPORT_MAX_PHOTO_BYTES = int(os.getenv('IMPORT_MAX_PHOTO_BYTES', str(10 * 1024 * 1024)))
+IMPORT_MAX_TOTAL_BYTES = int(os.getenv('IMPORT_MAX_TOTAL_BYTES', str(2 * 1024 * 1024 * 1024)))
+
+
+def save_import_zip(file_storage):
+    """Store an uploaded photo zip where the job runner can read it; returns its path or None if not a zip."""
+    path = job_file_path(f'import_{uuid.uuid4().hex}.zip')
+    file_storage.save(path)
+    if not zipfile.is_zipfile(path):
+        os.remove(path)
+        return None
+    return path
+
+
+def save_import_csv(csv_text):
+    """Store the CSV (it may contain plaintext passwords) in a file only the app user can read."""
+    path = job_file_path(f'import_{uuid.uuid4().hex}.csv')
+    with os.fdopen(os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600), 'w', encoding='utf-8') as f:
+        f.write(csv_text)
+    return path
+
+
+def start_import(csv_text, zip_path, upload_folder, created_by=None):
+    """
+    Queue an import and return its job id. The CSV is kept out of the job row;
+    it and the zip are job input files, deleted when the job finishes.
+    """
+    csv_path = save_import_csv(csv_text)
+    return enqueue('bulk_import', {
+        'csv_path': csv_path,
+        'zip_path': zip_path,
+        'upload_folder': upload_folder,
+        'files': [csv_path] + ([zip_path] if zip_path else []),
+    }, created_by=created_by)
+
+
+def parse_rows(csv_text):
+    """Returns (rows, errors); each row is a dict with 'line' added."""
+    reader = csv.DictReader(io.StringIO(csv_text.lstrip('﻿')))
+    missing = [c for c in REQUIRED_COLUMNS if c not in (reader.fieldnames or [])]
+    if missing:
+        return [], [f"CSV is missing column(s): {', '.join(missing)}"]
+
+    rows, errors, seen = [], [], set()
+    for line, raw in enumerate(reader, start=2):
+        row = {k: (v or '').strip() for k, v in raw.items() if k}
+        row['line'] = line
+        if not all(row.get(c) for c in REQUIRED_COLUMNS):
+            errors.append(f"Line {line}: name, enrollment_number, class_name and dob are required")
+            continue
+        if row['enrollment_number'] in seen:
+            errors.append(f"Line {line}: duplicate enrollment {row['enrollment_number']} in CSV")
+            continue
+        try:
+            row['dob'] = datetime.strptime(row['dob'], '%Y-%m-%d').date()
+            row['semester'] = int(row.get('semester') or 1)
+        except ValueError:
+            errors.append(f"Line {line}: invalid dob (YYYY-MM-DD) or semester")
+            continue
+        seen.add(row['enrollment_number'])
+        rows.append(row)
+    return rows, errors
+
+
+def extract_photos(rows, zip_path, upload_folder):
+    """
+    Copy each row's photo out of the zip into upload_folder.
+    Sets row['photo_path'] and returns the rows that have one, plus errors.
+    Members over IMPORT_MAX_PHOTO_BYTES are rejected; photos already written
+    are removed if extraction fails part-way.
+    """
+    if not zip_path:
+        return [], [f"Line {row['line']}: no photo (upload a zip of photos)" for row in rows]
+
+    found, errors = [], []
+    with zipfile.ZipFile(zip_path) as archive:
+        # Match on the bare file name so folders inside the zip don't matter
+        members = {os.path.basename(info.filename).lower(): info for info in archive.infolist() if not info.is_dir()}
+        matched = []
+        for row in rows:
+            wanted = [row['photo']] if row.get('photo') else [row['enrollment_number'] + ext for ext in PHOTO_EXTENSIONS]
+            info = next((members[w.lower()] for w in wanted if w.lower() in members), None)
+            if info is None:
+                errors.append(f"Line {row['line']}: photo {' / '.join(wanted)} not found in zip")
+            elif info.file_size > IMPORT_MAX_PHOTO_BYTES:
+                errors.append(f"Line {row['line']}: photo {os.path.basename(info.filename)} is larger than "
+                              f"{IMPORT_MAX_PHOTO_BYTES / (1024 * 1024):g} MB")
+            else:
+                matched.append((row, info))
+
+        # file_size is the declared size, and zipfile never reads past it
+        if sum(info.file_size for _, info in matched) > IMPORT_MAX_TOTAL_BYTES:
+            raise PermanentJobError(f"Photos in the zip exceed {IMPORT_MAX_TOTAL_BYTES / (1024 * 1024):g} MB uncompressed")
+
+        try:
+            for row, info in matched:
+                filename = secure_filename(f"{row['enrollment_number']}_{os.path.basename(info.filename)}")
+                row['photo_path'] = os.path.join(upload_folder, filename)
+                found.append(row)
+                with archive.open(info) as src, open(row['photo_path'], 'wb') as dst:
+                    shutil.copyfileobj(src, dst)
+        except Exception:
+            for row in found:
+                _remove_photo(row['photo_path'])
+            raise
+    return found, errors
+
+
+def _remove_photo(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+@job_handler('bulk_import')
+def run_import(payload, job):
+    from models import db, Student
+    from inference_service import inference_service
+    from encoding_cache import encoding_cache
+    from gallery_index import campus_index
+
+    zip_path = payload.get('zip_path')
+    require_files([payload['csv_path']] + ([zip_path] if zip_path else []))
+    with open(payload['csv_path'], encoding='utf-8') as f:
+        rows, errors = parse_rows(f.read())
+    total = len(rows) + len(errors)
+    progress = lambda stage, processed, message: job.progress(
+        stage=stage, processed=processed, total=total, errors=len(errors), message=message)
+    progress('validating', 0, f"Validating {len(rows)} row(s)")
+
+    existing = set()
+    enrollments = [row['enrollment_number'] for row in rows]
+    for i in range(0, len(enrollments), 500):
+        existing.update(db.session.execute(
+            db.select(Student.enrollment_number).where(Student.enrollment_number.in_(enrollments[i:i + 500]))
+        ).scalars())
+    for row in rows:
+        if row['enrollment_number'] in existing:
+            errors.append(f"Line {row['line']}: enrollment {row['enrollment_number']} already exists")
+    rows = [row for row in rows if row['enrollment_number'] not in existing]
+
+    rows, photo_errors = extract_photos(rows, zip_path, payload['upload_folder'])
+    errors.extend(photo_errors)
+
+    saved = False
+    try:
+        # Encode every photo across the process pool
+        progress('encoding', 0, f"Encoding {len(rows)} photo(s)")
+        step = lambda done: done % PROGRESS_EVERY == 0 and progress('encoding', done, f"Encoding {len(rows)} photo(s)")
+        encodings = inference_service.encode_images([row['photo_path'] for row in rows], progress=step)
+
+        students = []
+        # scrypt is slow by design: rows without a password share one hash of the default
+        default_hash = None
+        for row, encoding in zip(rows, encodings):
+            if encoding is None:
+                errors.append(f"Line {row['line']}: no face detected in {os.path.basename(row['photo_path'])}")
+                _remove_photo(row['photo_path'])
+                continue
+            if row.get('password'):
+                password_hash = generate_password_hash(row['password'])
+            else:
+                default_hash = default_hash or generate_password_hash('123456')
+                password_hash = default_hash
+            students.append({
+                'name': row['name'],
+                'enrollment_number': row['enrollment_number'],
+                'class_name': row['class_name'],
+                'semester': row['semester'],
+                'password': password_hash,
+                'face_encoding': encoding,
+                'photo_url': row['photo_path'],
+                'dob': row['dob'],
+                'admission_date': date.today(),
+            })
+
+        progress('saving', len(rows), f"Saving {len(students)} student(s)")
+        if students:
+            try:
+                # One executemany INSERT for the whole batch
+                db.session.execute(insert(Student), students)
+                db.session.commit()
+                saved = True
+            except IntegrityError as e:
+                db.session.rollback()
+                errors.append(f"Nothing saved: an enrollment number was added while importing ({e.orig})")
+                for student in students:
+                    _remove_photo(student['photo_url'])
+                students = []
+    except Exception:
+        # Don't leave photos behind for students that were never saved (the job may be retried)
+        if not saved:
+            for row in rows:
+                _remove_photo(row['photo_path'])
+        raise
+
+    if students:
+        for class_name in {s['class_name'] for s in students}:
+            encoding_cache.invalidate(class_name)
+        campus_index.invalidate()
+        invalidate_dashboard()
+
+    return {
+        'success_count': len(students),
+        'errors': errors,
+        'message': f"Imported {len(students)} student(s), {len(errors)} error(s)",
+    }
@@ -1,9 +1,25 @@
 """
 Database Configuration Module
 Handles database connection for both SQLite and PostgreSQL
+
+PostgreSQL engine tuning (environment variables):
+    DB_POOL_SIZE           connections kept open per process (default 5)
+    DB_MAX_OVERFLOW        extra connections allowed under load (default 10)
+    DB_POOL_TIMEOUT        seconds to wait for a free connection (default 30)
+    DB_POOL_RECYCLE        seconds before a connection is replaced (default 1800)
+    DB_POOL_PRE_PING       test connections on checkout (default true)
+    DB_STATEMENT_TIMEOUT   milliseconds before a statement is cancelled (default 30000; 0 = off)
+    DB_APPLICATION_NAME    name shown in pg_stat_activity (default biometric-attendance)
+    DB_CONNECT_TIMEOUT     seconds to establish a connection (default 10)
+    DB_KEEPALIVES_IDLE     idle seconds before TCP keepalives start (default 60)
+    DB_PGBOUNCER           true when DATABASE_URL points at PgBouncer / a transaction
+                           pooler (e.g. Supabase port 6543): no client-side pool and no
+                           startup options; set statement_timeout on the role instead
 """
 import os
 from dotenv import load_dotenv
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import NullPool
 
 # Load environment variables from .env file
 load_dotenv()
@@ -43,6 +59,63 @@ def get_database_uri():
         )
         return f'sqlite:///{db_path}'
 
+def _env_flag(name, default):
+    return os.getenv(name, default).strip().lower() in ('1', 'true', 'yes', 'on')
+
+def get_engine_options(database_uri):
+    """
+    Returns the SQLALCHEMY_ENGINE_OPTIONS for database_uri. SQLite keeps
+    Flask-SQLAlchemy's defaults; PostgreSQL gets a tuned pool and connection settings.
+    """
+    if not database_uri.startswith(('postgresql', 'postgres://')):
+        return {}
+
+    connect_args = {
+        'application_name': os.getenv('DB_APPLICATION_NAME', 'biometric-attendance'),
+        'connect_timeout': int(os.getenv('DB_CONNECT_TIMEOUT', '10')),
+        # Keepalives stop idle connections being dropped silently ("SSL SYSCALL error")
+        'keepalives': 1,
+        'keepalives_idle': int(os.getenv('DB_KEEPALIVES_IDLE', '60')),
+        'keepalives_interval': 10,
+        'keepalives_count': 5,
+    }
+
+    if _env_flag('DB_PGBOUNCER', 'false'):
+        # The pooler owns the connections, and transaction pooling rejects
+        # startup parameters such as -c statement_timeout
+        if make_url(database_uri).get_driver_name() == 'psycopg':
+            # psycopg 3 prepares repeated statements, which break across pooled backends
+            connect_args['prepare_threshold'] = None
+        return {'poolclass': NullPool, 'connect_args': connect_args}
+
+    statement_timeout = int(os.getenv('DB_STATEMENT_TIMEOUT', '30000'))
+    if statement_timeout > 0:
+        connect_args['options'] = f'-c statement_timeout={statement_timeout}'
+
+    return {
+        'pool_size': int(os.getenv('DB_POOL_SIZE', '5')),
+        'max_overflow': int(os.getenv('DB_MAX_OVERFLOW', '10')),
+        'pool_timeout': int(os.getenv('DB_POOL_TIMEOUT', '30')),
+        'pool_recycle': int(os.getenv('DB_POOL_RECYCLE', '1800')),
+        'pool_pre_ping': _env_flag('DB_POOL_PRE_PING', 'true'),
+        'connect_args': connect_args,
+    }
+
+def pool_stats(engine):
+    """Connection pool counters for /api/metrics."""
+    pool = engine.pool
+    stats = {'pool': type(pool).__name__}
+    # QueuePool; NullPool/StaticPool/SingletonThreadPool keep no counters
+    if hasattr(pool, 'checkedout') and hasattr(pool, 'overflow'):
+        stats.update({
+            'size': pool.size(),
+            'checked_in': pool.checkedin(),
+            'checked_out': pool.checkedout(),
+            # overflow() counts from -size; only connections beyond the pool are overflow
+            'overflow': max(0, pool.overflow()),
+        })
+    return stats
+
 # Export the database URI
 DATABASE_URI = get_database_uri()
 
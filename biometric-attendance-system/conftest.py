@@ -0,0 +1,65 @@
+"""
+Shared pytest setup for the test_*.py suites: the app on a throwaway
+in-memory SQLite database, face analysis inline and no job runner threads.
+
+The settings below are read when app and its service modules are first
+imported, so they live here (loaded before any test module) rather than in
+each test file.
+"""
+import os
+from contextlib import contextmanager
+
+os.environ['DATABASE_URL'] = 'sqlite://'
+os.environ['INFERENCE_WORKERS'] = '0'
+os.environ['JOB_WORKER_THREADS'] = '0'
+
+import pytest
+from sqlalchemy import event
+
+
+@pytest.fixture
+def app():
+    """The Flask app with freshly created tables and an empty identity cache."""
+    from app import app as flask_app
+    from models import db
+    from identity_cache import identity_cache
+
+    flask_app.config['SESSION_COOKIE_SECURE'] = False
+    with flask_app.app_context():
+        db.drop_all()
+        db.create_all()
+    identity_cache.invalidate()
+    yield flask_app
+
+
+@pytest.fixture
+def login(app):
+    """login(user_id, user_type) returns a test client signed in as that user."""
+    def login(user_id, user_type):
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess['_user_id'] = user_id
+            sess['_fresh'] = True
+            sess['user_type'] = user_type
+        return client
+    return login
+
+
+@pytest.fixture
+def capture_statements(app):
+    """`with capture_statements() as statements:` collects the SQL sent to the database."""
+    from models import db
+
+    with app.app_context():
+        engine = db.engine
+
+    @contextmanager
+    def capture():
+        statements = []
+        listener = lambda conn, cursor, statement, *args: statements.append(statement)
+        event.listen(engine, 'before_cursor_execute', listener)
+        try:
+            yield statements
+        finally:
+            event.remove(engine, 'before_cursor_execute', listener)
+    return capture
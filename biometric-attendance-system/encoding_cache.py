@@ -0,0 +1,145 @@
+"""
+Face Encoding Cache Module
+Keeps each class's enrolled face encodings in memory as one contiguous
+float32 matrix so recognition does not decode stored encodings on every frame.
+"""
+import os
+import threading
+import time
+from collections import namedtuple
+
+import numpy as np
+
+ENCODING_DIM = 128
+
+# Safety net for multi-worker deployments: another gunicorn worker may have
+# added or deleted a student, so entries are also refreshed after this many seconds.
+FACE_CACHE_TTL = int(os.getenv('FACE_CACHE_TTL', '300'))
+
+# Lightweight stand-in for a Student row, so a match needs no extra query
+MatchedStudent = namedtuple('MatchedStudent', ['student_id', 'name', 'enrollment_number'])
+
+
+class ClassGallery:
+    """
+    Enrolled encodings for one class.
+    `matrix` is (N, 128) float32 and row i belongs to `student_ids[i]`.
+    `sq_norms` holds the squared row norms, precomputed for match_encodings.
+    `matrix` rows are enrollment centroids; `templates[i]` holds the (K, 128)
+    per-photo samples of a multi-photo enrollment, or None.
+    """
+
+    def __init__(self, class_name, student_ids, names, enrollments, matrix, templates=None):
+        self.class_name = class_name
+        self.student_ids = student_ids
+        self.names = names
+        self.enrollments = enrollments
+        self.matrix = matrix
+        self.templates = templates if templates is not None else [None] * len(student_ids)
+        self.sq_norms = np.einsum('ij,ij->i', matrix, matrix)
+        self.loaded_at = time.monotonic()
+
+    def __len__(self):
+        return len(self.student_ids)
+
+    def student(self, index):
+        """Returns the MatchedStudent for a matrix row."""
+        return MatchedStudent(int(self.student_ids[index]), self.names[index], self.enrollments[index])
+
+
+class EncodingCache:
+    """Process-wide, thread-safe cache of ClassGallery objects keyed by class name."""
+
+    def __init__(self, ttl=FACE_CACHE_TTL):
+        self.ttl = ttl
+        self._galleries = {}
+        self._lock = threading.Lock()
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, class_name):
+        """
+        Returns the ClassGallery for class_name, loading it from the database
+        on a miss. Must be called inside an application context.
+        """
+        with self._lock:
+            gallery = self._galleries.get(class_name)
+            if gallery is not None and time.monotonic() - gallery.loaded_at < self.ttl:
+                self.hits += 1
+                return gallery
+            self.misses += 1
+            generation = self._generation
+
+        # Load outside the lock so a slow query doesn't block other classes
+        gallery = load_class_gallery(class_name)
+        with self._lock:
+            # Don't store a gallery that was invalidated while it was loading
+            if generation == self._generation:
+                self._galleries[class_name] = gallery
+        return gallery
+
+    def invalidate(self, class_name=None):
+        """Drops one class (or every class when class_name is None)."""
+        with self._lock:
+            if class_name is None:
+                self._galleries.clear()
+            else:
+                self._galleries.pop(class_name, None)
+            self._generation += 1
+            self.invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'invalidations': self.invalidations,
+                'classes': {name: len(g) for name, g in self._galleries.items()},
+            }
+
+
+def load_class_gallery(class_name):
+    """
+    Builds a ClassGallery with a single query that only selects the biometric
+    projection's columns.
+    """
+    from models import db, Student, BIOMETRIC_COLUMNS
+
+    rows = db.session.query(*BIOMETRIC_COLUMNS).filter(Student.class_name == class_name).all()
+
+    student_ids = []
+    names = []
+    enrollments = []
+    encodings = []
+    templates = []
+    for student_id, name, enrollment, encoding, samples in rows:
+        # FaceEncodingType already decoded the column (None if unreadable)
+        if encoding is None or encoding.shape != (ENCODING_DIM,):
+            continue
+        student_ids.append(student_id)
+        names.append(name)
+        enrollments.append(enrollment)
+        encodings.append(encoding)
+        templates.append(samples.reshape(-1, ENCODING_DIM) if samples is not None and samples.size else None)
+
+    if encodings:
+        matrix = np.vstack(encodings).astype(np.float32, copy=False)
+    else:
+        matrix = np.empty((0, ENCODING_DIM), dtype=np.float32)
+
+    return ClassGallery(
+        class_name,
+        np.asarray(student_ids, dtype=np.int64),
+        names,
+        enrollments,
+        matrix,
+        templates,
+    )
+
+
+# Shared instance used by app.py
+encoding_cache = EncodingCache()
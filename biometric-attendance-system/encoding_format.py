@@ -0,0 +1,77 @@
+"""
+Face Encoding Storage Format
+Binary layout of Student.face_encoding:
+
+    offset 0  4 bytes   magic b'FENC'
+    offset 4  uint16    format version (little-endian)
+    offset 6  uint16    encoding dimension (128 for dlib)
+    offset 8  float32[] little-endian values, one or more rows of `dim`
+
+A single 128-d encoding takes 520 bytes instead of ~2.5 KB of JSON text.
+Rows written before the migration are JSON lists; they are still accepted
+on read so old and new rows can coexist during the rollout.
+"""
+import json
+import struct
+
+import numpy as np
+
+MAGIC = b'FENC'
+FORMAT_VERSION = 1
+HEADER = struct.Struct('<4sHH')
+ENCODING_DTYPE = np.dtype('<f4')
+
+
+class EncodingFormatError(ValueError):
+    """Raised when a stored face encoding cannot be decoded."""
+
+
+def pack_encoding(encoding):
+    """
+    Serialize an encoding (list or numpy array, shape (dim,) or (rows, dim))
+    to the versioned binary format.
+    """
+    array = np.asarray(encoding, dtype=ENCODING_DTYPE)
+    if array.ndim == 1:
+        dim = array.shape[0]
+    elif array.ndim == 2:
+        dim = array.shape[1]
+    else:
+        raise EncodingFormatError(f"Expected a 1-D or 2-D encoding, got shape {array.shape}")
+    return HEADER.pack(MAGIC, FORMAT_VERSION, dim) + array.tobytes()
+
+
+def is_binary_encoding(data):
+    """True if data is already in the binary format (as opposed to legacy JSON)."""
+    return isinstance(data, (bytes, bytearray, memoryview)) and bytes(data[:4]) == MAGIC
+
+
+def unpack_encoding(data):
+    """
+    Decode a stored encoding.
+    Binary rows come back as a read-only np.frombuffer view over the stored
+    bytes (no copy); a single row is returned 1-D, several rows 2-D.
+    Legacy JSON text (str or bytes) is parsed into a new float32 array.
+    """
+    if data is None:
+        return None
+
+    if is_binary_encoding(data):
+        try:
+            magic, version, dim = HEADER.unpack_from(data)
+            values = np.frombuffer(data, dtype=ENCODING_DTYPE, offset=HEADER.size)
+        except (struct.error, ValueError) as e:
+            raise EncodingFormatError(f"Truncated face encoding: {e}")
+        if version != FORMAT_VERSION:
+            raise EncodingFormatError(f"Unsupported face encoding format version {version}")
+        if dim == 0 or values.size % dim:
+            raise EncodingFormatError(f"Face encoding payload is not a multiple of {dim} values")
+        return values if values.size == dim else values.reshape(-1, dim)
+
+    # Legacy JSON row (TEXT on SQLite, or BYTEA converted from TEXT on PostgreSQL)
+    try:
+        if isinstance(data, (bytes, bytearray, memoryview)):
+            data = bytes(data).decode('utf-8')
+        return np.asarray(json.loads(data), dtype=ENCODING_DTYPE)
+    except (TypeError, ValueError) as e:
+        raise EncodingFormatError(f"Unreadable face encoding: {e}")
@@ -12,8 +12,25 @@ import cv2
 import numpy as np
 import json
 import os
+import time
 from PIL import Image
 
+from face_tracker import match_boxes
+
+# Live frames can be searched for faces on a downscaled copy (opt-in: 0.5
+# halves the smallest detectable face size with upsample 1, so faces at the
+# back of a classroom may be missed); landmarks and encodings still use the
+# original pixels inside the rescaled boxes.
+DETECTION_SCALE = float(os.getenv('DETECTION_SCALE', '1.0'))
+DETECTION_UPSAMPLE = int(os.getenv('DETECTION_UPSAMPLE', '1'))
+
+# Multi-photo enrollment: samples are stored as templates plus their centroid.
+# Matching uses the centroid; a probe whose centroid distance misses the
+# tolerance by less than MATCH_AMBIGUITY_BAND is checked against the templates.
+ENROLL_MAX_SAMPLES = int(os.getenv('ENROLL_MAX_SAMPLES', '8'))
+MATCH_AMBIGUITY_BAND = float(os.getenv('MATCH_AMBIGUITY_BAND', '0.08'))
+TEMPLATE_OUTLIER_DISTANCE = 0.6  # farther than this from the other samples = a different face
+
 def encode_face_from_image(image_path):
     """
     Encode a face from an image file.
@@ -68,8 +85,8 @@ def get_all_face_encodings(image_array):
         import face_recognition
         # Convert BGR to RGB
         rgb_image = cv2.cvtColor(image_array, cv2.COLOR_BGR2RGB)
-        # Get locations first (optimization)
-        face_locations = face_recognition.face_locations(rgb_image)
+        # Get locations first (optimization), on a downscaled copy
+        face_locations = detect_face_locations(rgb_image)
         if not face_locations:
             return []
             
@@ -79,6 +96,31 @@ def get_all_face_encodings(image_array):
         print(f"Error getting all encodings: {e}")
         return []
 
+def detect_face_locations(rgb_frame, scale=None, upsample=None):
+    """
+    HOG face detection on a copy of the frame resized by `scale`.
+    Boxes are mapped back to the original frame's coordinates, so callers
+    (and attendance.js overlays) see the same space as without scaling.
+    Returns [(top, right, bottom, left)].
+    """
+    import face_recognition
+    scale = DETECTION_SCALE if scale is None else scale
+    upsample = DETECTION_UPSAMPLE if upsample is None else upsample
+    if scale >= 1.0 or scale <= 0:
+        return face_recognition.face_locations(rgb_frame, number_of_times_to_upsample=upsample)
+
+    small = cv2.resize(rgb_frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    height, width = rgb_frame.shape[:2]
+    locations = []
+    for top, right, bottom, left in face_recognition.face_locations(small, number_of_times_to_upsample=upsample):
+        locations.append((
+            max(0, int(round(top / scale))),
+            min(width, int(round(right / scale))),
+            min(height, int(round(bottom / scale))),
+            max(0, int(round(left / scale)))
+        ))
+    return locations
+
 def compare_faces(known_encoding, unknown_encoding, tolerance=0.6):
     """
     Compare two face encodings.
@@ -106,41 +148,95 @@ def compare_faces(known_encoding, unknown_encoding, tolerance=0.6):
         print(f"Error comparing faces: {e}")
         return False
 
-def find_matching_student(unknown_encoding, students):
+def match_encodings(probes, gallery, gallery_sq_norms=None):
+    """
+    Match an (M, 128) block of probe encodings against an (N, 128) gallery.
+    Uses one matrix product (|p|^2 + |g|^2 - 2 p.g) instead of a Python loop
+    over the gallery, so the cost is a single BLAS call for all probes.
+    Returns (best_indices, best_distances), both of length M.
+    Indices are -1 (and distances inf) when the gallery is empty.
+    """
+    probes = np.atleast_2d(np.asarray(probes, dtype=np.float32))
+    gallery = np.asarray(gallery, dtype=np.float32)
+
+    if probes.shape[0] == 0 or gallery.shape[0] == 0:
+        return (np.full(probes.shape[0], -1, dtype=np.int64),
+                np.full(probes.shape[0], np.inf, dtype=np.float32))
+
+    if gallery_sq_norms is None:
+        gallery_sq_norms = np.einsum('ij,ij->i', gallery, gallery)
+    probe_sq_norms = np.einsum('ij,ij->i', probes, probes)
+
+    # (M, N) squared euclidean distances
+    sq_distances = probe_sq_norms[:, None] + gallery_sq_norms[None, :] - 2.0 * (probes @ gallery.T)
+    np.maximum(sq_distances, 0.0, out=sq_distances)
+
+    best_indices = np.argmin(sq_distances, axis=1)
+    best_distances = np.sqrt(sq_distances[np.arange(probes.shape[0]), best_indices])
+    return best_indices, best_distances
+
+def find_matching_student(unknown_encoding, students, tolerance=0.6):
     """
     Find a matching student from the database.
     Returns student object if match found, None otherwise.
     """
-    # Check import at runtime to ensure we have the latest state
-    try:
-        import face_recognition
-    except ImportError:
-        raise ImportError("face_recognition library is not installed. Please install dlib and face-recognition.")
     try:
         if unknown_encoding is None:
             return None
         
-        best_match = None
-        best_distance = 1.0
-        
+        matched_students = []
+        known_encodings = []
         for student in students:
-            if student.face_encoding:
-                try:
-                    known_encoding = json.loads(student.face_encoding)
-                    distance = face_recognition.face_distance([np.array(known_encoding)], np.array(unknown_encoding))[0]
-                    
-                    if distance < best_distance and distance <= 0.6:
-                        best_distance = distance
-                        best_match = student
-                except Exception as e:
-                    print(f"Error processing student {student.student_id}: {e}")
-                    continue
-        
-        return best_match
+            # face_encoding is decoded to a float32 array by FaceEncodingType
+            if student.face_encoding is not None:
+                known_encodings.append(student.face_encoding)
+                matched_students.append(student)
+        
+        if not known_encodings:
+            return None
+        
+        best_indices, best_distances = match_encodings([unknown_encoding], known_encodings)
+        if best_distances[0] <= tolerance:
+            return matched_students[best_indices[0]]
+        return None
     except Exception as e:
         print(f"Error finding matching student: {e}")
         return None
 
+def build_face_templates(encodings):
+    """
+    Aggregate enrollment samples into (centroid, templates).
+    With three or more samples, any farther than TEMPLATE_OUTLIER_DISTANCE
+    from the element-wise median (another person, a bad crop) is dropped.
+    Returns (None, empty array) when no usable sample remains.
+    """
+    samples = np.asarray([e for e in encodings if e is not None], dtype=np.float32).reshape(-1, 128)
+    if len(samples) > 2:
+        median = np.median(samples, axis=0)
+        samples = samples[np.linalg.norm(samples - median, axis=1) <= TEMPLATE_OUTLIER_DISTANCE]
+    samples = samples[:ENROLL_MAX_SAMPLES]
+    if len(samples) == 0:
+        return None, samples
+    return samples.mean(axis=0), samples
+
+def refine_with_templates(probes, best_indices, best_distances, templates, tolerance, band=MATCH_AMBIGUITY_BAND):
+    """
+    Second matching stage. A probe whose best centroid distance lies in
+    [tolerance, tolerance + band) is compared with that student's enrollment
+    templates (templates[index], (K, 128) or None) and keeps the closest
+    distance. Every other probe is returned unchanged.
+    """
+    distances = np.array(best_distances, dtype=np.float64)
+    for i, (index, distance) in enumerate(zip(best_indices, best_distances)):
+        if index < 0 or not tolerance <= distance < tolerance + band:
+            continue
+        student_templates = templates[index]
+        if student_templates is None:
+            continue
+        probe = np.asarray(probes[i], dtype=np.float32)
+        distances[i] = min(distance, float(np.linalg.norm(student_templates - probe, axis=1).min()))
+    return distances
+
 def detect_faces_in_frame(frame):
     """
     Detect faces in a video frame.
@@ -153,7 +249,7 @@ def detect_faces_in_frame(frame):
         raise ImportError("face_recognition library is not installed. Please install dlib and face-recognition.")
     try:
         rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        face_locations = face_recognition.face_locations(rgb_frame)
+        face_locations = detect_face_locations(rgb_frame)
         return face_locations
     except Exception as e:
         print(f"Error detecting faces: {e}")
@@ -212,37 +308,58 @@ def is_smiling(landmarks):
         print(f"Error checking smile: {e}")
         return False
 
-def analyze_faces(frame):
+def analyze_faces(frame, timings=None, skip_boxes=None):
     """
     Detect faces, getting locations, encodings, and smile status.
+    If a timings dict is given, the seconds spent in each dlib stage
+    are stored under 'detect', 'landmarks' and 'encode'.
+    Faces overlapping one of skip_boxes (tracked faces already identified,
+    see face_tracker.py) are not landmarked or encoded; they come back with
+    encoding None and 'skip' set to the index of that box.
     Returns: [{'location': loc, 'encoding': enc, 'is_smiling': bool}]
     """
+    timings = timings if timings is not None else {}
     try:
         import face_recognition
         rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
         
-        # 1. Locations
-        locations = face_recognition.face_locations(rgb_frame)
+        # 1. Locations (downscaled detection, boxes in original coordinates)
+        start = time.perf_counter()
+        locations = detect_face_locations(rgb_frame)
+        timings['detect'] = time.perf_counter() - start
         if not locations:
             return []
-            
-        # 2. Landmarks (for smile)
-        landmarks_list = face_recognition.face_landmarks(rgb_frame, locations)
+        
+        skipped = match_boxes(locations, skip_boxes) if skip_boxes else [-1] * len(locations)
+        to_encode = [loc for loc, skip in zip(locations, skipped) if skip < 0]
+        
+        # 2. Landmarks (for smile), from the full-resolution regions
+        start = time.perf_counter()
+        landmarks_list = face_recognition.face_landmarks(rgb_frame, to_encode) if to_encode else []
+        timings['landmarks'] = time.perf_counter() - start
         
         # 3. Encodings
-        encodings = face_recognition.face_encodings(rgb_frame, locations)
+        start = time.perf_counter()
+        encodings = face_recognition.face_encodings(rgb_frame, to_encode) if to_encode else []
+        timings['encode'] = time.perf_counter() - start
         
         results = []
-        for i in range(len(locations)):
+        i = 0
+        for location, skip in zip(locations, skipped):
+            if skip >= 0:
+                results.append({'location': location, 'encoding': None, 'is_smiling': None, 'skip': skip})
+                continue
+            
             smile = False
             if i < len(landmarks_list):
                 smile = is_smiling(landmarks_list[i])
                 
             results.append({
-                'location': locations[i],
+                'location': location,
                 'encoding': encodings[i].tolist(),
                 'is_smiling': smile
             })
+            i += 1
             
         return results
     except Exception as e:
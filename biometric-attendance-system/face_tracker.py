@@ -0,0 +1,181 @@
+"""
+Face Tracker Module
+Links face boxes across consecutive frames of one attendance session (greedy
+IoU matching) so a face that is already resolved to a marked student is not
+re-landmarked, re-encoded and re-matched on every frame. Such tracks are
+re-verified every TRACK_REVERIFY_FRAMES frames.
+
+Configuration (environment variables):
+    TRACK_IOU              minimum box overlap to continue a track (default 0.4)
+    TRACK_REVERIFY_FRAMES  frames between re-encodings of a resolved track (default 20)
+    TRACK_MAX_MISSED       frames a track survives without a matching box (default 3)
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+TRACK_IOU = float(os.getenv('TRACK_IOU', '0.4'))
+TRACK_REVERIFY_FRAMES = int(os.getenv('TRACK_REVERIFY_FRAMES', '20'))
+TRACK_MAX_MISSED = int(os.getenv('TRACK_MAX_MISSED', '3'))
+
+
+def iou_matrix(boxes, candidates):
+    """Pairwise IoU, shape (len(boxes), len(candidates)), for (top, right, bottom, left) boxes."""
+    a = np.asarray(boxes, dtype=np.float64).reshape(-1, 1, 4)
+    b = np.asarray(candidates, dtype=np.float64).reshape(1, -1, 4)
+    height = np.clip(np.minimum(a[..., 2], b[..., 2]) - np.maximum(a[..., 0], b[..., 0]), 0, None)
+    width = np.clip(np.minimum(a[..., 1], b[..., 1]) - np.maximum(a[..., 3], b[..., 3]), 0, None)
+    inter = height * width
+    area = lambda x: (x[..., 1] - x[..., 3]) * (x[..., 2] - x[..., 0])
+    union = area(a) + area(b) - inter
+    return np.divide(inter, union, out=np.zeros_like(inter), where=union > 0)
+
+
+def match_boxes(boxes, candidates, threshold=TRACK_IOU):
+    """
+    Greedy one-to-one IoU assignment, best overlaps first.
+    Returns, for each box, the index of its candidate or -1.
+    """
+    assigned = [-1] * len(boxes)
+    if not len(boxes) or not len(candidates):
+        return assigned
+    overlaps = iou_matrix(boxes, candidates)
+    rows, cols = np.nonzero(overlaps >= threshold)
+    used = set()
+    for k in np.argsort(-overlaps[rows, cols], kind='stable'):
+        i, j = int(rows[k]), int(cols[k])
+        if assigned[i] == -1 and j not in used:
+            assigned[i] = j
+            used.add(j)
+    return assigned
+
+
+class Track:
+    __slots__ = ('track_id', 'box', 'student', 'marked', 'verified_at', 'seen_at')
+
+    def __init__(self, track_id, box, frame_index):
+        self.track_id = track_id
+        self.box = tuple(box)
+        self.student = None  # matched student (encoding_cache.MatchedStudent)
+        self.marked = False
+        self.verified_at = frame_index
+        self.seen_at = frame_index
+
+
+class FaceTracker:
+    """Tracks for one scanner/session. Not thread-safe: hold .lock from begin_frame() until the last resolve()."""
+
+    def __init__(self, iou_threshold=TRACK_IOU, reverify_every=TRACK_REVERIFY_FRAMES, max_missed=TRACK_MAX_MISSED):
+        self.iou_threshold = iou_threshold
+        self.reverify_every = reverify_every
+        self.max_missed = max_missed
+        self.frame_index = 0
+        self.tracks = []
+        self._next_id = 1
+        self._skip_tracks = []
+        self.lock = threading.Lock()
+        self.last_used = time.monotonic()
+
+    def begin_frame(self):
+        """
+        Start a new frame. Returns the boxes of tracks that may skip encoding:
+        resolved to a marked student, seen in the previous frame and not due
+        for re-verification. Pass them to analyze_faces as skip_boxes.
+        """
+        self.frame_index += 1
+        self.last_used = time.monotonic()
+        self._skip_tracks = [
+            t for t in self.tracks
+            if t.marked and t.seen_at == self.frame_index - 1
+            and self.frame_index - t.verified_at < self.reverify_every
+        ]
+        return [t.box for t in self._skip_tracks]
+
+    def update(self, faces):
+        """
+        Associate this frame's faces with tracks. faces are analyze_faces
+        results; skipped faces carry 'skip', the index into begin_frame's boxes.
+        Returns the Track for each face, in order.
+        """
+        result = [None] * len(faces)
+        taken = set()
+        for i, face in enumerate(faces):
+            if face.get('skip', -1) >= 0:
+                track = self._skip_tracks[face['skip']]
+                result[i] = track
+                taken.add(track.track_id)
+
+        free = [t for t in self.tracks if t.track_id not in taken]
+        pending = [i for i in range(len(faces)) if result[i] is None]
+        assigned = match_boxes([faces[i]['location'] for i in pending], [t.box for t in free], self.iou_threshold)
+        for i, j in zip(pending, assigned):
+            if j >= 0:
+                result[i] = free[j]
+            else:
+                result[i] = Track(self._next_id, faces[i]['location'], self.frame_index)
+                self._next_id += 1
+                self.tracks.append(result[i])
+
+        for face, track in zip(faces, result):
+            track.box = tuple(face['location'])
+            track.seen_at = self.frame_index
+
+        self.tracks = [t for t in self.tracks if self.frame_index - t.seen_at <= self.max_missed]
+        return result
+
+    def resolve(self, track, student=None, marked=False):
+        """Record the outcome of encoding + matching a track's face this frame."""
+        track.student = student
+        track.marked = bool(student is not None and marked)
+        track.verified_at = self.frame_index
+
+
+class FaceTrackerRegistry:
+    """One FaceTracker per scanner key (session), evicting the least recently used."""
+
+    def __init__(self, max_trackers=64, idle_seconds=900):
+        self.max_trackers = max_trackers
+        self.idle_seconds = idle_seconds
+        self._trackers = OrderedDict()
+        self._lock = threading.Lock()
+        self.encoded = 0
+        self.skipped = 0
+
+    def get(self, key):
+        with self._lock:
+            now = time.monotonic()
+            for stale in [k for k, t in self._trackers.items() if now - t.last_used > self.idle_seconds]:
+                del self._trackers[stale]
+            tracker = self._trackers.get(key)
+            if tracker is None:
+                tracker = self._trackers[key] = FaceTracker()
+                while len(self._trackers) > self.max_trackers:
+                    self._trackers.popitem(last=False)
+            self._trackers.move_to_end(key)
+            return tracker
+
+    def discard(self, key):
+        with self._lock:
+            self._trackers.pop(key, None)
+
+    def record(self, encoded, skipped):
+        with self._lock:
+            self.encoded += encoded
+            self.skipped += skipped
+
+    def stats(self):
+        with self._lock:
+            faces = self.encoded + self.skipped
+            return {
+                'trackers': len(self._trackers),
+                'faces_encoded': self.encoded,
+                'faces_skipped': self.skipped,
+                'skip_rate': round(self.skipped / faces, 4) if faces else 0.0,
+            }
+
+
+# Shared instance used by app.py
+session_trackers = FaceTrackerRegistry()
@@ -0,0 +1,337 @@
+"""
+Gallery Index Module
+Campus-wide face identification over every enrolled student.
+
+Two interchangeable index types share one interface (build/add/remove/search):
+    ExactIndex - brute-force scan, always exact
+    IVFIndex   - inverted-file index in pure NumPy: a k-means coarse quantizer
+                 splits the gallery into `nlist` cells and a query only scans
+                 the `nprobe` nearest cells. Raising nprobe trades latency for recall.
+
+Configuration (environment variables):
+    GALLERY_INDEX     'ivf' (default) or 'exact'
+    IVF_NLIST         number of cells (default: sqrt(N))
+    IVF_NPROBE        cells scanned per query (default 8)
+    GALLERY_INDEX_TTL seconds before the campus index is rebuilt from the database (default 900;
+                      the old index is served while the new one builds)
+"""
+import os
+import threading
+import time
+
+import numpy as np
+
+from face_recognition_api import match_encodings
+
+ENCODING_DIM = 128
+
+GALLERY_INDEX = os.getenv('GALLERY_INDEX', 'ivf').lower()
+IVF_NLIST = int(os.getenv('IVF_NLIST', '0'))  # 0 = pick from gallery size
+IVF_NPROBE = int(os.getenv('IVF_NPROBE', '8'))
+GALLERY_INDEX_TTL = int(os.getenv('GALLERY_INDEX_TTL', '900'))
+
+
+def _squared_distances(queries, vectors, vector_sq_norms):
+    """(M, N) squared euclidean distances, clamped at zero."""
+    query_sq_norms = np.einsum('ij,ij->i', queries, queries)
+    sq = query_sq_norms[:, None] + vector_sq_norms[None, :] - 2.0 * (queries @ vectors.T)
+    return np.maximum(sq, 0.0, out=sq)
+
+
+def _top_k(sq_distances, k):
+    """Indices of the k smallest values in each row, sorted ascending."""
+    k = min(k, sq_distances.shape[1])
+    if k < sq_distances.shape[1]:
+        part = np.argpartition(sq_distances, k - 1, axis=1)[:, :k]
+    else:
+        part = np.tile(np.arange(k), (sq_distances.shape[0], 1))
+    order = np.take_along_axis(sq_distances, part, axis=1).argsort(axis=1)
+    return np.take_along_axis(part, order, axis=1)
+
+
+def _empty_result(m, k):
+    return np.full((m, k), -1, dtype=np.int64), np.full((m, k), np.inf, dtype=np.float32)
+
+
+class ExactIndex:
+    """Brute-force index: the reference for recall and the fallback for small galleries."""
+
+    def __init__(self):
+        self.ids = np.empty(0, dtype=np.int64)
+        self.vectors = np.empty((0, ENCODING_DIM), dtype=np.float32)
+        self.sq_norms = np.empty(0, dtype=np.float32)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def build(self, ids, vectors):
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.vectors = np.ascontiguousarray(vectors, dtype=np.float32).reshape(-1, ENCODING_DIM)
+        self.sq_norms = np.einsum('ij,ij->i', self.vectors, self.vectors)
+        return self
+
+    def add(self, item_id, vector):
+        self.remove(item_id)
+        vector = np.asarray(vector, dtype=np.float32).reshape(1, ENCODING_DIM)
+        self.ids = np.append(self.ids, item_id)
+        self.vectors = np.vstack([self.vectors, vector])
+        self.sq_norms = np.append(self.sq_norms, np.einsum('ij,ij->i', vector, vector))
+
+    def remove(self, item_id):
+        keep = self.ids != item_id
+        if keep.all():
+            return False
+        self.ids, self.vectors, self.sq_norms = self.ids[keep], self.vectors[keep], self.sq_norms[keep]
+        return True
+
+    def search(self, queries, k=5, **kwargs):
+        """Returns (ids, distances), each (M, k); missing slots are -1 / inf."""
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        ids, distances = _empty_result(queries.shape[0], k)
+        if not len(self):
+            return ids, distances
+        if k == 1:
+            best, best_dist = match_encodings(queries, self.vectors, self.sq_norms)
+            ids[:, 0], distances[:, 0] = self.ids[best], best_dist
+            return ids, distances
+        sq = _squared_distances(queries, self.vectors, self.sq_norms)
+        top = _top_k(sq, k)
+        ids[:, :top.shape[1]] = self.ids[top]
+        distances[:, :top.shape[1]] = np.sqrt(np.take_along_axis(sq, top, axis=1))
+        return ids, distances
+
+    def stats(self):
+        return {'type': 'exact', 'size': len(self)}
+
+
+class IVFIndex:
+    """Inverted-file index with a k-means coarse quantizer."""
+
+    def __init__(self, nlist=None, nprobe=IVF_NPROBE, train_iterations=10, seed=0):
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.train_iterations = train_iterations
+        self.seed = seed
+        self.centroids = np.empty((0, ENCODING_DIM), dtype=np.float32)
+        self.centroid_sq_norms = np.empty(0, dtype=np.float32)
+        self.lists = []          # per cell: ExactIndex of its members
+        self.locations = {}      # student id -> cell number
+
+    def __len__(self):
+        return len(self.locations)
+
+    def _train(self, vectors, nlist):
+        rng = np.random.default_rng(self.seed)
+        sample = vectors if len(vectors) <= 50000 else vectors[rng.choice(len(vectors), 50000, replace=False)]
+        centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+        for _ in range(self.train_iterations):
+            assign = np.argmin(_squared_distances(sample, centroids, np.einsum('ij,ij->i', centroids, centroids)), axis=1)
+            counts = np.bincount(assign, minlength=nlist)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, sample)
+            filled = counts > 0
+            centroids[filled] = sums[filled] / counts[filled, None]
+            # Re-seed empty cells with random points so every cell stays useful
+            empty = np.flatnonzero(~filled)
+            if len(empty):
+                centroids[empty] = sample[rng.choice(len(sample), len(empty), replace=False)]
+        return centroids
+
+    def _assign(self, vectors):
+        return np.argmin(_squared_distances(vectors, self.centroids, self.centroid_sq_norms), axis=1)
+
+    def build(self, ids, vectors):
+        ids = np.asarray(ids, dtype=np.int64)
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32).reshape(-1, ENCODING_DIM)
+        nlist = self.nlist or max(1, int(np.sqrt(len(ids))))
+        nlist = max(1, min(nlist, len(ids)))
+
+        if len(ids):
+            self.centroids = self._train(vectors, nlist)
+        else:
+            self.centroids = np.zeros((1, ENCODING_DIM), dtype=np.float32)
+        self.centroid_sq_norms = np.einsum('ij,ij->i', self.centroids, self.centroids)
+
+        assign = self._assign(vectors) if len(ids) else np.empty(0, dtype=np.int64)
+        self.lists = [ExactIndex().build(ids[assign == c], vectors[assign == c]) for c in range(len(self.centroids))]
+        self.locations = {int(i): int(c) for i, c in zip(ids, assign)}
+        return self
+
+    def add(self, item_id, vector):
+        if not self.lists:
+            return self.build([item_id], [vector])
+        self.remove(item_id)
+        vector = np.asarray(vector, dtype=np.float32).reshape(1, ENCODING_DIM)
+        cell = int(self._assign(vector)[0])
+        self.lists[cell].add(item_id, vector)
+        self.locations[int(item_id)] = cell
+
+    def remove(self, item_id):
+        cell = self.locations.pop(int(item_id), None)
+        if cell is None:
+            return False
+        return self.lists[cell].remove(item_id)
+
+    def search(self, queries, k=5, nprobe=None):
+        """
+        Returns (ids, distances), each (M, k); missing slots are -1 / inf.
+        nprobe overrides the index default for this call.
+        """
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        ids, distances = _empty_result(queries.shape[0], k)
+        if not len(self):
+            return ids, distances
+
+        nprobe = max(1, min(nprobe or self.nprobe, len(self.centroids)))
+        cells = _top_k(_squared_distances(queries, self.centroids, self.centroid_sq_norms), nprobe)
+        for q, query_cells in enumerate(cells):
+            members = [self.lists[c] for c in query_cells if len(self.lists[c])]
+            if not members:
+                continue
+            candidate_ids = np.concatenate([m.ids for m in members])
+            candidates = np.concatenate([m.vectors for m in members])
+            candidate_sq = np.concatenate([m.sq_norms for m in members])
+            sq = _squared_distances(queries[q:q + 1], candidates, candidate_sq)
+            top = _top_k(sq, k)[0]
+            ids[q, :len(top)] = candidate_ids[top]
+            distances[q, :len(top)] = np.sqrt(sq[0, top])
+        return ids, distances
+
+    def stats(self):
+        sizes = [len(cell) for cell in self.lists]
+        return {
+            'type': 'ivf',
+            'size': len(self),
+            'nlist': len(self.lists),
+            'nprobe': self.nprobe,
+            'largest_cell': max(sizes) if sizes else 0,
+        }
+
+
+def create_index(kind=GALLERY_INDEX):
+    if kind == 'exact':
+        return ExactIndex()
+    if kind == 'ivf':
+        return IVFIndex(nlist=IVF_NLIST or None, nprobe=IVF_NPROBE)
+    raise ValueError(f"Unknown GALLERY_INDEX type: {kind}")
+
+
+class CampusIndex:
+    """
+    Process-wide index over every Student with an encoding.
+    Built from the database on first query, updated incrementally by
+    add_student/delete_student, and rebuilt after GALLERY_INDEX_TTL seconds so
+    changes made by other workers are eventually picked up. Rebuilds load and
+    train outside the lock (on a background thread or the job runners'
+    periodic task) while searches keep using the current index; adds and
+    removes made meanwhile are replayed onto the new index before the swap.
+    """
+
+    def __init__(self, kind=GALLERY_INDEX, ttl=GALLERY_INDEX_TTL):
+        self.kind = kind
+        self.ttl = ttl
+        self._index = None
+        self._built_at = 0.0
+        self._stale = False
+        self._building = False
+        self._changes = None  # edits to replay onto the index being built
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+
+    def _due(self):
+        return self._index is not None and (self._stale or time.monotonic() - self._built_at >= self.ttl)
+
+    def _build(self):
+        # Caller holds _build_lock
+        with self._lock:
+            self._building = True
+            self._changes = []
+        try:
+            index = build_index_from_db(self.kind)
+            with self._lock:
+                for change in self._changes:
+                    change(index)
+                self._index, self._built_at, self._stale = index, time.monotonic(), False
+        finally:
+            with self._lock:
+                self._building = False
+                self._changes = None
+
+    def rebuild(self, only_if_due=False):
+        """Rebuild from the database and swap the new index in. Must be called inside an application context."""
+        with self._build_lock:
+            with self._lock:
+                if only_if_due and not self._due():
+                    # No build is running while we hold _build_lock
+                    self._building = False
+                    return False
+            self._build()
+            return True
+
+    def _rebuild_in_background(self, app):
+        with app.app_context():
+            try:
+                self.rebuild(only_if_due=True)
+            except Exception as e:
+                print(f"Warning: campus index rebuild failed: {e}")
+
+    def search(self, queries, k=5, nprobe=None):
+        """Must be called inside an application context."""
+        from flask import current_app
+
+        with self._lock:
+            missing = self._index is None
+            refresh = self._due() and not self._building
+            if refresh:
+                self._building = True
+        if missing:
+            # Nothing to serve yet; concurrent first queries wait for one build
+            with self._build_lock:
+                if self._index is None:
+                    self._build()
+        elif refresh:
+            threading.Thread(target=self._rebuild_in_background, args=(current_app._get_current_object(),),
+                             name='campus-index-rebuild', daemon=True).start()
+        with self._lock:
+            return self._index.search(queries, k=k, nprobe=nprobe)
+
+    def _apply(self, change):
+        with self._lock:
+            if self._index is not None:
+                change(self._index)
+            if self._changes is not None:
+                self._changes.append(change)
+
+    def add(self, student_id, encoding):
+        self._apply(lambda index: index.add(student_id, encoding))
+
+    def remove(self, student_id):
+        self._apply(lambda index: index.remove(student_id))
+
+    def invalidate(self):
+        """Rebuild soon; the current index is served until the new one is ready."""
+        with self._lock:
+            self._stale = True
+
+    def stats(self):
+        with self._lock:
+            if self._index is None:
+                return {'type': self.kind, 'built': False}
+            return dict(self._index.stats(), built=True, rebuilding=self._building,
+                        age_seconds=round(time.monotonic() - self._built_at, 1))
+
+
+def build_index_from_db(kind=GALLERY_INDEX):
+    """Loads every student's encoding with one narrow query and builds an index."""
+    from models import db, Student
+
+    rows = db.session.query(Student.student_id, Student.face_encoding).all()
+    rows = [(sid, enc) for sid, enc in rows if enc is not None and enc.shape == (ENCODING_DIM,)]
+    index = create_index(kind)
+    if rows:
+        index.build([sid for sid, _ in rows], np.vstack([enc for _, enc in rows]))
+    return index
+
+
+# Shared instance used by app.py
+campus_index = CampusIndex()
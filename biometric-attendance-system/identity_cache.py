@@ -0,0 +1,119 @@
+"""
+Identity Cache Module
+Per-process LRU/TTL cache for the Flask-Login user_loader, so a logged-in
+request (including every recognition frame) doesn't query its user row.
+Entries are detached Admin/Faculty/Student instances; the model's deferred
+column groups keep the password hash and face data out of the load.
+load_user merges them into the request's session with load=False (no SELECT),
+and those columns load on first access.
+
+Configuration (environment variables):
+    IDENTITY_CACHE_SIZE  users kept per process (default 1024)
+    IDENTITY_CACHE_TTL   seconds an entry is trusted (default 300; bounds
+                         staleness after a change made by another worker)
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy.orm import Session
+
+IDENTITY_CACHE_SIZE = int(os.getenv('IDENTITY_CACHE_SIZE', '1024'))
+IDENTITY_CACHE_TTL = int(os.getenv('IDENTITY_CACHE_TTL', '300'))
+
+
+def _user_models():
+    from models import Admin, Faculty, Student
+    # user id prefix -> model
+    return {'admin': Admin, 'faculty': Faculty, 'student': Student}
+
+
+def load_identity(user_id):
+    """
+    Loads the user for a Flask-Login id ('faculty_3') in a short-lived
+    session and returns it detached, or None if the id is unknown.
+    """
+    from models import db
+
+    prefix, _, pk = user_id.partition('_')
+    model = _user_models().get(prefix)
+    if model is None or not pk.isdigit():
+        return None
+    with Session(db.engine) as loader:
+        user = loader.get(model, int(pk))
+        if user is not None:
+            loader.expunge(user)
+    return user
+
+
+class IdentityCache:
+    """Thread-safe LRU of detached user instances keyed by Flask-Login id."""
+
+    def __init__(self, max_size=IDENTITY_CACHE_SIZE, ttl=IDENTITY_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._users = OrderedDict()  # user_id -> (user, loaded_at)
+        self._lock = threading.Lock()
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, user_id):
+        """
+        Returns the user attached to db.session, loading it on a miss.
+        Must be called inside an application context.
+        """
+        from models import db
+
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is not None and time.monotonic() - entry[1] < self.ttl:
+                self._users.move_to_end(user_id)
+                self.hits += 1
+                user = entry[0]
+            else:
+                self.misses += 1
+                user = None
+                generation = self._generation
+
+        if user is None:
+            user = load_identity(user_id)
+            if user is None:
+                return None
+            with self._lock:
+                # Don't store a user that was invalidated while it was loading
+                if generation == self._generation:
+                    self._users[user_id] = (user, time.monotonic())
+                    self._users.move_to_end(user_id)
+                    while len(self._users) > self.max_size:
+                        self._users.popitem(last=False)
+
+        # Copies the cached state into this request's session without a SELECT
+        return db.session.merge(user, load=False)
+
+    def invalidate(self, user_id=None):
+        """Drops one user (or everyone when user_id is None)."""
+        with self._lock:
+            if user_id is None:
+                self._users.clear()
+            else:
+                self._users.pop(user_id, None)
+            self._generation += 1
+            self.invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'invalidations': self.invalidations,
+                'size': len(self._users),
+            }
+
+
+# Shared instance used by app.py
+identity_cache = IdentityCache()
@@ -0,0 +1,236 @@
+"""
+Inference Service Module
+Runs face detection/encoding (analyze_faces) on a bounded pool of worker
+processes, so dlib work doesn't hold the request thread's GIL and one
+gunicorn worker can serve several scanners at once.
+
+Each pool process imports face_recognition (via face_recognition_api) once
+and keeps the dlib models loaded. Submissions beyond INFERENCE_WORKERS + INFERENCE_QUEUE_SIZE are
+rejected with InferenceQueueFull (the routes answer HTTP 429).
+
+Configuration (environment variables):
+    INFERENCE_WORKERS     pool processes per app worker (default 2; 0 = run inline)
+    INFERENCE_QUEUE_SIZE  frames allowed to wait for a free process (default 4)
+    INFERENCE_TIMEOUT     seconds a request waits for its result (default 10)
+"""
+import atexit
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+from face_recognition_api import analyze_faces, encode_face_from_image
+
+INFERENCE_WORKERS = int(os.getenv('INFERENCE_WORKERS', '2'))
+INFERENCE_QUEUE_SIZE = int(os.getenv('INFERENCE_QUEUE_SIZE', '4'))
+INFERENCE_TIMEOUT = float(os.getenv('INFERENCE_TIMEOUT', '10'))
+
+STAGES = ('queue', 'detect', 'landmarks', 'encode', 'total')
+
+
+class InferenceQueueFull(Exception):
+    """Raised when every pool process is busy and the wait queue is full."""
+
+
+class InferenceTimeout(Exception):
+    """Raised when a frame's analysis does not finish within the timeout."""
+
+
+def _analyze_in_worker(frame, submitted_at, skip_boxes=None):
+    """Runs in a pool process. Returns (faces, stage timings in seconds)."""
+    timings = {'queue': max(0.0, time.time() - submitted_at)}
+    start = time.perf_counter()
+    faces = analyze_faces(frame, timings, skip_boxes)
+    timings['total'] = time.perf_counter() - start
+    return faces, timings
+
+
+class StageTimer:
+    """Count / mean / max per stage, in milliseconds."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._count = dict.fromkeys(STAGES, 0)
+        self._sum = dict.fromkeys(STAGES, 0.0)
+        self._max = dict.fromkeys(STAGES, 0.0)
+
+    def record(self, timings):
+        with self._lock:
+            for stage, seconds in timings.items():
+                if stage not in self._count:
+                    continue
+                ms = seconds * 1000.0
+                self._count[stage] += 1
+                self._sum[stage] += ms
+                self._max[stage] = max(self._max[stage], ms)
+
+    def stats(self):
+        with self._lock:
+            return {
+                stage: {
+                    'count': self._count[stage],
+                    'avg_ms': round(self._sum[stage] / self._count[stage], 2) if self._count[stage] else 0.0,
+                    'max_ms': round(self._max[stage], 2),
+                }
+                for stage in STAGES
+            }
+
+
+class InferenceService:
+    """Bounded front-end to a ProcessPoolExecutor running analyze_faces."""
+
+    def __init__(self, workers=INFERENCE_WORKERS, queue_size=INFERENCE_QUEUE_SIZE, timeout=INFERENCE_TIMEOUT):
+        self.workers = max(0, workers)
+        self.queue_size = max(0, queue_size)
+        self.timeout = timeout
+        self.max_pending = max(1, self.workers) + self.queue_size
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.timer = StageTimer()
+
+    def _get_executor(self):
+        # Created on first use so importing the app (scripts, tests) spawns nothing
+        with self._lock:
+            if self._executor is None:
+                # spawn: forking a threaded gunicorn worker can deadlock the child
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+                print(f"DEBUG: Inference pool started with {self.workers} process(es)")
+            return self._executor
+
+    def _reset_executor(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _acquire(self):
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self.rejected += 1
+                raise InferenceQueueFull(f'{self._pending} frames already pending')
+            self._pending += 1
+
+    def _release(self):
+        with self._lock:
+            self._pending -= 1
+
+    def analyze(self, frame, skip_boxes=None):
+        """
+        Detect and encode the faces in a decoded BGR frame
+        (skip_boxes: see analyze_faces).
+        Returns the analyze_faces result list.
+        Raises InferenceQueueFull or InferenceTimeout.
+        """
+        self._acquire()
+        if self.workers == 0:
+            try:
+                faces, timings = _analyze_in_worker(frame, time.time(), skip_boxes)
+            finally:
+                self._release()
+        else:
+            try:
+                future = self._get_executor().submit(_analyze_in_worker, frame, time.time(), skip_boxes)
+            except Exception:
+                self._release()
+                raise
+            # The slot is freed when the process finishes, even if this request gave up waiting
+            future.add_done_callback(lambda _: self._release())
+            try:
+                faces, timings = future.result(timeout=self.timeout)
+            except FutureTimeoutError:
+                future.cancel()
+                with self._lock:
+                    self.timeouts += 1
+                raise InferenceTimeout(f'Face analysis took longer than {self.timeout}s')
+            except BrokenProcessPool:
+                # A worker died (e.g. out of memory); start a fresh pool for the next frame
+                print("Warning: inference pool broken, restarting")
+                self._reset_executor()
+                raise
+
+        self.timer.record(timings)
+        with self._lock:
+            self.completed += 1
+        return faces
+
+    def encode_images(self, paths, progress=None):
+        """
+        Encode the first face of each image file on the pool (enrollment samples,
+        bulk imports). Returns an encoding list or None per path, in order.
+        progress(done) is called after each image. At most workers // 2 images
+        (at least one) are in flight, so live frames keep the other processes;
+        they count as pending frames but never make a frame wait behind a whole
+        import. An image that takes longer than the timeout is treated as having
+        no face.
+        """
+        results = [None] * len(paths)
+        if self.workers == 0 or len(paths) < 2:
+            for i, path in enumerate(paths):
+                results[i] = encode_face_from_image(path)
+                if progress:
+                    progress(i + 1)
+            return results
+
+        window = max(1, self.workers // 2)
+        in_flight = deque()
+        submitted = 0
+        for done in range(1, len(paths) + 1):
+            while submitted < len(paths) and len(in_flight) < window:
+                with self._lock:
+                    self._pending += 1
+                try:
+                    future = self._get_executor().submit(encode_face_from_image, paths[submitted])
+                except Exception:
+                    self._release()
+                    raise
+                future.add_done_callback(lambda _: self._release())
+                in_flight.append((submitted, future))
+                submitted += 1
+
+            i, future = in_flight.popleft()
+            try:
+                results[i] = future.result(timeout=self.timeout)
+            except FutureTimeoutError:
+                future.cancel()
+                with self._lock:
+                    self.timeouts += 1
+                print(f"Warning: encoding {os.path.basename(paths[i])} took longer than {self.timeout}s, skipped")
+            except BrokenProcessPool:
+                print("Warning: inference pool broken, restarting")
+                self._reset_executor()
+                raise
+            if progress:
+                progress(done)
+        return results
+
+    def shutdown(self):
+        self._reset_executor()
+
+    def stats(self):
+        with self._lock:
+            stats = {
+                'workers': self.workers,
+                'queue_size': self.queue_size,
+                'pending': self._pending,
+                'queue_depth': max(0, self._pending - max(1, self.workers)),
+                'completed': self.completed,
+                'rejected': self.rejected,
+                'timeouts': self.timeouts,
+            }
+        stats['stages'] = self.timer.stats()
+        return stats
+
+
+# Shared instance used by app.py
+inference_service = InferenceService()
+atexit.register(inference_service.shutdown)
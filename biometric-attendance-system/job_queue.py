@@ -0,0 +1,392 @@
+"""
+Background Job Queue Module
+Runs heavy operations (bulk imports, enrollment encoding, Excel exports,
+summary recomputes) outside the HTTP request. Jobs are rows in the
+background_job table: routes enqueue one and return its id, a runner claims
+it (SELECT ... FOR UPDATE SKIP LOCKED on PostgreSQL, a conditional UPDATE on
+SQLite), runs the registered handler and stores its JSON result. Failures are
+retried with exponential backoff.
+
+Runners are daemon threads inside each app worker (JOB_WORKER_THREADS), or a
+separate `python worker.py` process. They also run the periodic tasks
+registered with @periodic_task (e.g. session expiry). Job inputs and outputs
+are files (UPLOAD_FOLDER, JOB_FILES_DIR), so a separate worker needs the web
+server's filesystem: same host or a shared volume.
+
+Configuration (environment variables):
+    JOB_WORKER_THREADS   runner threads per app worker (default 1; 0 when worker.py runs the jobs)
+    JOB_POLL_INTERVAL    seconds an idle runner waits before polling again (default 2)
+    JOB_MAX_ATTEMPTS     attempts before a job is marked failed (default 3)
+    JOB_RETRY_DELAY      seconds before the first retry, doubled per attempt (default 10)
+    JOB_LOCK_TIMEOUT     seconds without a progress heartbeat after which a running job is
+                         treated as abandoned (default 900)
+    JOB_RETENTION_DAYS   days finished jobs and their result files are kept (default 7;
+                         input files are deleted as soon as the job finishes)
+    JOB_FILES_DIR        directory for job inputs and results (default: <tmp>/attendance_job_files)
+    JOB_STATEMENT_TIMEOUT  PostgreSQL statement timeout in ms for job handlers, replacing
+                         DB_STATEMENT_TIMEOUT inside their transactions (default 600000; 0 = none)
+"""
+import os
+import socket
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import event, update, func
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from models import db, BackgroundJob
+
+JOB_WORKER_THREADS = int(os.getenv('JOB_WORKER_THREADS', '1'))
+JOB_POLL_INTERVAL = float(os.getenv('JOB_POLL_INTERVAL', '2'))
+JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', '3'))
+JOB_RETRY_DELAY = int(os.getenv('JOB_RETRY_DELAY', '10'))
+JOB_LOCK_TIMEOUT = int(os.getenv('JOB_LOCK_TIMEOUT', '900'))
+JOB_RETENTION_DAYS = int(os.getenv('JOB_RETENTION_DAYS', '7'))
+JOB_FILES_DIR = os.getenv('JOB_FILES_DIR', os.path.join(tempfile.gettempdir(), 'attendance_job_files'))
+JOB_STATEMENT_TIMEOUT = int(os.getenv('JOB_STATEMENT_TIMEOUT', '600000'))
+MAINTENANCE_INTERVAL = 60  # seconds between stale-lock / retention sweeps
+
+QUEUED, RUNNING, COMPLETED, FAILED = 'queued', 'running', 'completed', 'failed'
+
+HANDLERS = {}
+PERIODIC_TASKS = []  # (func, interval seconds)
+
+
+class PermanentJobError(Exception):
+    """Raised by a handler for failures a retry cannot fix (bad input); the job fails at once."""
+
+
+def job_handler(kind):
+    """Register handler(payload, job) for a job kind. Its return value is stored as the JSON result."""
+    def register(func):
+        HANDLERS[kind] = func
+        return func
+    return register
+
+
+def periodic_task(seconds):
+    """
+    Register func() to run every `seconds` on the job runners (first runner
+    thread of each process). Every process runs it, so it must be safe to run
+    concurrently.
+    """
+    def register(func):
+        PERIODIC_TASKS.append((func, seconds))
+        return func
+    return register
+
+
+def job_file_path(name):
+    """Path for a job input/output file in JOB_FILES_DIR."""
+    os.makedirs(JOB_FILES_DIR, exist_ok=True)
+    return os.path.join(JOB_FILES_DIR, name)
+
+
+def require_files(paths):
+    """Fail the job at once if an input file isn't visible to this runner."""
+    missing = [os.path.basename(p) for p in paths if not os.path.exists(p)]
+    if missing:
+        raise PermanentJobError(
+            f"Job input file(s) not found on this runner: {', '.join(missing)}. "
+            "worker.py needs the web server's upload folder and JOB_FILES_DIR (same host or a shared volume)."
+        )
+
+
+# Set while this thread runs a job handler
+_running = threading.local()
+
+
+@event.listens_for(Session, 'after_begin')
+def _job_statement_timeout(session, transaction, connection):
+    """
+    Exports and summary rebuilds legitimately outlast the web request timeout
+    (DB_STATEMENT_TIMEOUT), so every transaction a handler opens gets
+    JOB_STATEMENT_TIMEOUT instead. SET LOCAL ends with the transaction, so the
+    pooled connection goes back with the web default.
+    """
+    if getattr(_running, 'job', False) and JOB_STATEMENT_TIMEOUT > 0 and connection.dialect.name == 'postgresql':
+        connection.exec_driver_sql(f'SET LOCAL statement_timeout = {int(JOB_STATEMENT_TIMEOUT)}')
+
+
+class JobContext:
+    """Passed to handlers: the job id and a way to publish progress while running."""
+
+    def __init__(self, job):
+        self.id = job.id
+        self.attempt = job.attempts
+        self.worker_id = job.locked_by
+
+    def progress(self, **fields):
+        """Publish progress; also refreshes the lock so a long job isn't reclaimed as abandoned."""
+        # Own short transaction so progress is visible before the handler commits its work
+        with db.engine.begin() as conn:
+            conn.execute(update(BackgroundJob).where(
+                BackgroundJob.id == self.id, BackgroundJob.locked_by == self.worker_id
+            ).values(progress=fields, locked_at=datetime.now()))
+
+
+def enqueue(kind, payload=None, created_by=None, max_attempts=JOB_MAX_ATTEMPTS):
+    """Insert a queued job and return its id. Commits the current session."""
+    if kind not in HANDLERS:
+        raise ValueError(f'No handler registered for job kind {kind!r}')
+    job = BackgroundJob(kind=kind, payload=payload or {}, created_by=created_by,
+                        max_attempts=max_attempts, run_after=datetime.now())
+    db.session.add(job)
+    db.session.commit()
+    runner.ensure_started(current_app._get_current_object())
+    runner.wake()
+    print(f"DEBUG: Job {job.id} ({kind}) queued")
+    return job.id
+
+
+def get_job(job_id):
+    return db.session.get(BackgroundJob, job_id)
+
+
+def claim(worker_id):
+    """Lock the oldest runnable queued job for worker_id and return it, or None."""
+    now = datetime.now()
+    candidate = db.select(BackgroundJob.id).where(
+        BackgroundJob.status == QUEUED, BackgroundJob.run_after <= now
+    ).order_by(BackgroundJob.run_after, BackgroundJob.id).limit(1)
+    if db.engine.dialect.name == 'postgresql':
+        # Concurrent runners skip rows another transaction is claiming instead of waiting
+        candidate = candidate.with_for_update(skip_locked=True)
+
+    for _ in range(3):
+        job_id = db.session.execute(candidate).scalar()
+        if job_id is None:
+            db.session.commit()
+            return None
+        # Guarded by status: SQLite has no row locks, so another runner may have won the race
+        claimed = db.session.execute(
+            update(BackgroundJob).where(BackgroundJob.id == job_id, BackgroundJob.status == QUEUED).values(
+                status=RUNNING, locked_by=worker_id, locked_at=now, attempts=BackgroundJob.attempts + 1
+            ).execution_options(synchronize_session=False)
+        ).rowcount
+        db.session.commit()
+        if claimed:
+            return db.session.get(BackgroundJob, job_id)
+    return None
+
+
+def run_job(job):
+    """
+    Run a claimed job's handler and record completion, a retry or the failure.
+    The outcome is only written while this runner still holds the lock: a job
+    reclaimed by reclaim_stale belongs to whichever runner claimed it next.
+    """
+    job_id, kind, worker_id = job.id, job.kind, job.locked_by
+    attempts, max_attempts = job.attempts, job.max_attempts
+    payload = dict(job.payload or {})
+    owned = update(BackgroundJob).where(BackgroundJob.id == job_id, BackgroundJob.locked_by == worker_id)
+    handler = HANDLERS.get(kind)
+    context = JobContext(job)
+    # End the claim's transaction so the handler's first query opens one with the job timeout
+    db.session.commit()
+    _running.job = True
+    try:
+        if handler is None:
+            raise PermanentJobError(f'No handler registered for job kind {kind!r}')
+        result = handler(dict(payload), context)
+    except Exception as e:
+        _running.job = False
+        db.session.rollback()
+        error = str(e) if isinstance(e, PermanentJobError) else f'{type(e).__name__}: {e}'
+        if isinstance(e, PermanentJobError) or attempts >= max_attempts:
+            outcome = dict(status=FAILED, finished_at=datetime.now())
+        else:
+            outcome = dict(status=QUEUED, run_after=datetime.now() + timedelta(seconds=JOB_RETRY_DELAY * 2 ** (attempts - 1)))
+        recorded = db.session.execute(
+            owned.values(error=error, locked_by=None, locked_at=None, **outcome)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        db.session.commit()
+        print(f"Warning: job {job_id} ({kind}) attempt {attempts} failed: {error}")
+        if not recorded:
+            print(f"Warning: job {job_id} lost its lock while running; outcome not recorded")
+        elif outcome['status'] == FAILED:
+            remove_files(input_files(payload))
+        return False
+    finally:
+        _running.job = False
+
+    recorded = db.session.execute(
+        owned.values(status=COMPLETED, result=result, error=None, locked_by=None, locked_at=None,
+                     finished_at=datetime.now())
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    db.session.commit()
+    if not recorded:
+        print(f"Warning: job {job_id} ({kind}) finished after losing its lock; result discarded")
+        return False
+    # Inputs (uploads, CSVs with passwords) aren't kept once the job is finished
+    remove_files(input_files(payload))
+    print(f"DEBUG: Job {job_id} ({kind}) completed")
+    return True
+
+
+def run_next(worker_id):
+    """Claim and run one job. Returns False when the queue had nothing runnable."""
+    job = claim(worker_id)
+    if job is None:
+        return False
+    run_job(job)
+    return True
+
+
+def reclaim_stale():
+    """Requeue (or fail, if out of attempts) running jobs whose runner died."""
+    cutoff = datetime.now() - timedelta(seconds=JOB_LOCK_TIMEOUT)
+    stale = (BackgroundJob.status == RUNNING, BackgroundJob.locked_at < cutoff)
+    requeued = db.session.execute(
+        update(BackgroundJob).where(*stale, BackgroundJob.attempts < BackgroundJob.max_attempts)
+        .values(status=QUEUED, locked_by=None, locked_at=None, run_after=datetime.now())
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    failed = db.session.execute(
+        update(BackgroundJob).where(*stale)
+        .values(status=FAILED, locked_by=None, locked_at=None, finished_at=datetime.now(),
+                error='Runner stopped responding')
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    db.session.commit()
+    if requeued or failed:
+        print(f"Warning: {requeued} abandoned job(s) requeued, {failed} failed")
+
+
+def purge_finished():
+    """Delete finished jobs older than JOB_RETENTION_DAYS, with the files they reference."""
+    cutoff = datetime.now() - timedelta(days=JOB_RETENTION_DAYS)
+    old = db.session.execute(db.select(BackgroundJob).where(
+        BackgroundJob.status.in_((COMPLETED, FAILED)), BackgroundJob.finished_at < cutoff
+    )).scalars().all()
+    for job in old:
+        remove_files(job_files(job))
+        db.session.delete(job)
+    db.session.commit()
+
+
+def input_files(payload):
+    """Input files under JOB_FILES_DIR named by a payload's 'files' list."""
+    root = os.path.abspath(JOB_FILES_DIR)
+    return [p for p in (payload or {}).get('files', []) if os.path.abspath(p).startswith(root + os.sep)]
+
+
+def job_files(job):
+    """Files under JOB_FILES_DIR named by the job's payload ('files') or result ('path')."""
+    paths = input_files(job.payload)
+    if isinstance(job.result, dict) and job.result.get('path'):
+        root = os.path.abspath(JOB_FILES_DIR)
+        if os.path.abspath(job.result['path']).startswith(root + os.sep):
+            paths.append(job.result['path'])
+    return paths
+
+
+def remove_files(paths):
+    for path in paths:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def run_due_tasks(next_run):
+    """Run the periodic tasks that are due; next_run maps task -> monotonic due time."""
+    for func, interval in PERIODIC_TASKS:
+        if time.monotonic() < next_run.get(func, 0.0):
+            continue
+        next_run[func] = time.monotonic() + interval
+        try:
+            func()
+        except Exception as e:
+            db.session.rollback()
+            print(f"Warning: periodic task {func.__name__} failed: {e}")
+
+
+def work(app, worker_id, poll_interval=JOB_POLL_INTERVAL, wake=None, burst=False, periodic=True):
+    """
+    Runner loop: claim and run jobs (and, with periodic=True, the periodic
+    tasks), sleeping poll_interval when idle (or until wake is set).
+    With burst=True, return once the queue is empty.
+    """
+    last_maintenance = 0.0
+    next_run = {}
+    while True:
+        ran = False
+        with app.app_context():
+            try:
+                if time.monotonic() - last_maintenance > MAINTENANCE_INTERVAL:
+                    last_maintenance = time.monotonic()
+                    reclaim_stale()
+                    purge_finished()
+                if periodic:
+                    run_due_tasks(next_run)
+                ran = run_next(worker_id)
+            except SQLAlchemyError as e:
+                db.session.rollback()
+                print(f"Warning: job runner {worker_id} database error: {e}")
+            finally:
+                db.session.remove()
+        if ran:
+            continue
+        if burst:
+            return
+        if wake is not None:
+            wake.wait(poll_interval)
+            wake.clear()
+        else:
+            time.sleep(poll_interval)
+
+
+def worker_name(suffix):
+    return f'{socket.gethostname()}:{os.getpid()}:{suffix}'
+
+
+class JobRunner:
+    """In-process runner threads, started by the first request of each app worker."""
+
+    def __init__(self, threads=JOB_WORKER_THREADS):
+        self.threads = max(0, threads)
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._pid = None
+
+    def ensure_started(self, app):
+        # Checked per process: gunicorn workers fork after import
+        if self.threads == 0 or self._pid == os.getpid():
+            return
+        if db.engine.url.database in (None, '', ':memory:'):
+            # In-memory SQLite is one connection shared by every thread; runners would interleave with requests
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            for i in range(self.threads):
+                threading.Thread(target=work, args=(app, worker_name(f'thread{i}')),
+                                 kwargs={'wake': self._wake, 'periodic': i == 0},
+                                 name=f'job-runner-{i}', daemon=True).start()
+            print(f"DEBUG: Started {self.threads} job runner thread(s)")
+
+    def wake(self):
+        self._wake.set()
+
+
+def stats():
+    """Job counts by status plus this process's runner threads (for /api/metrics)."""
+    counts = dict(db.session.query(BackgroundJob.status, func.count()).group_by(BackgroundJob.status).all())
+    oldest = db.session.query(func.min(BackgroundJob.run_after)).filter(BackgroundJob.status == QUEUED).scalar()
+    return {
+        'runner_threads': runner.threads if runner._pid == os.getpid() else 0,
+        'counts': {status: counts.get(status, 0) for status in (QUEUED, RUNNING, COMPLETED, FAILED)},
+        'oldest_queued_seconds': round(max(0.0, (datetime.now() - oldest).total_seconds()), 1) if oldest else 0.0,
+    }
+
+
+# Shared instance used by app.py
+runner = JobRunner()
@@ -0,0 +1,160 @@
+"""
+Database Migration Script
+Brings an existing SQLite or PostgreSQL database up to the current schema.
+Every step is idempotent, so the script can be re-run safely.
+
+Usage:
+    python migrate_db.py              # run all steps
+    python migrate_db.py <step> ...   # run selected steps
+"""
+import sys
+
+from sqlalchemy import text, inspect, select, bindparam
+
+from app import app, db
+from models import Student, AttendanceSession, AttendanceRecord
+from encoding_format import pack_encoding, unpack_encoding, is_binary_encoding, EncodingFormatError
+from attendance_service import rebuild_summary
+from session_expiry import session_expires_at
+
+BATCH_SIZE = 500
+
+
+def migrate_face_encoding_binary(conn):
+    """Rewrite JSON face encodings as binary float32 (see encoding_format.py)."""
+    if conn.dialect.name == 'postgresql':
+        column_type = conn.execute(text("""
+            SELECT data_type FROM information_schema.columns
+            WHERE table_name = 'student' AND column_name = 'face_encoding'
+        """)).scalar()
+        if column_type != 'bytea':
+            print("   Converting student.face_encoding from TEXT to BYTEA...")
+            conn.execute(text("""
+                ALTER TABLE student ALTER COLUMN face_encoding TYPE BYTEA
+                USING convert_to(face_encoding, 'UTF8')
+            """))
+    # SQLite: the TEXT column affinity stores BLOB values unchanged, so only rows need rewriting
+
+    rows = conn.execute(text("SELECT student_id, face_encoding FROM student")).fetchall()
+    updates = []
+    skipped = 0
+    for student_id, stored in rows:
+        if stored is None or is_binary_encoding(stored):
+            continue
+        try:
+            updates.append({'id': student_id, 'enc': pack_encoding(unpack_encoding(stored))})
+        except EncodingFormatError as e:
+            print(f"   [WARN] Student {student_id}: {e}")
+            skipped += 1
+
+    update = text("UPDATE student SET face_encoding = :enc WHERE student_id = :id")
+    for i in range(0, len(updates), BATCH_SIZE):
+        conn.execute(update, updates[i:i + BATCH_SIZE])
+
+    print(f"   Rewrote {len(updates)} encoding(s), {len(rows) - len(updates) - skipped} already binary, {skipped} unreadable")
+
+
+def migrate_attendance_summary(conn):
+    """Backfill attendance_summary from existing attendance records."""
+    rebuild_summary(conn)
+    rows = conn.execute(text("SELECT COUNT(*) FROM attendance_summary")).scalar()
+    print(f"   Rebuilt {rows} student/subject summary row(s)")
+
+
+def migrate_hot_path_indexes(conn):
+    """Create the secondary indexes declared on the models (CREATE INDEX if missing)."""
+    created = 0
+    for table in db.metadata.sorted_tables:
+        existing = {ix['name'] for ix in inspect(conn).get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(conn)
+                print(f"   Created {index.name}")
+                created += 1
+    print(f"   {created} index(es) created")
+
+
+def migrate_student_history_index(conn):
+    """Replace the student/status index (counts now come from attendance_summary) with (student_id, date, time)."""
+    table = AttendanceRecord.__table__
+    existing = {ix['name'] for ix in inspect(conn).get_indexes(table.name)}
+    if 'ix_attendance_record_student_status' in existing:
+        conn.execute(text("DROP INDEX ix_attendance_record_student_status"))
+        print("   Dropped ix_attendance_record_student_status")
+    index = next(ix for ix in table.indexes if ix.name == 'ix_attendance_record_student_date_time')
+    if index.name in existing:
+        print(f"   {index.name} already exists")
+    else:
+        index.create(conn)
+        print(f"   Created {index.name}")
+
+
+def add_missing_column(conn, table, column):
+    """ALTER TABLE ... ADD COLUMN for a model column the database doesn't have yet."""
+    existing = {c['name'] for c in inspect(conn).get_columns(table.name)}
+    if column.name in existing:
+        print(f"   {table.name}.{column.name} already exists")
+        return
+    column_type = column.type.compile(dialect=conn.dialect)
+    conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+    print(f"   Added {table.name}.{column.name} ({column_type})")
+
+
+def migrate_face_templates(conn):
+    """Add student.face_templates for multi-photo enrollment (existing students keep a single sample)."""
+    add_missing_column(conn, Student.__table__, Student.__table__.c.face_templates)
+
+
+def migrate_session_expiry(conn):
+    """Add attendance_session.expires_at and fill it in for open sessions (read by session_expiry.py)."""
+    table = AttendanceSession.__table__
+    add_missing_column(conn, table, table.c.expires_at)
+    # Core statements with the table's column types, so SQLite returns start_time as a datetime
+    rows = conn.execute(select(table.c.id, table.c.start_time, table.c.duration_minutes).where(
+        table.c.expires_at.is_(None), table.c.status == 'Active'
+    )).fetchall()
+    updates = [
+        {'session_id': session_id, 'expires': session_expires_at(start_time, duration)}
+        for session_id, start_time, duration in rows
+    ]
+    if updates:
+        conn.execute(table.update().where(table.c.id == bindparam('session_id')).values(expires_at=bindparam('expires')), updates)
+    print(f"   Set expires_at on {len(updates)} active session(s)")
+
+
+MIGRATIONS = [
+    ('face_encoding_binary', migrate_face_encoding_binary),
+    ('attendance_summary', migrate_attendance_summary),
+    # Before hot_path_indexes, which indexes the new column
+    ('session_expiry', migrate_session_expiry),
+    ('hot_path_indexes', migrate_hot_path_indexes),
+    ('face_templates', migrate_face_templates),
+    ('student_history_index', migrate_student_history_index),
+]
+
+
+def run(selected=None):
+    names = [name for name, _ in MIGRATIONS]
+    unknown = set(selected or []) - set(names)
+    if unknown:
+        print(f"[ERROR] Unknown migration step(s): {', '.join(sorted(unknown))}")
+        print(f"Available: {', '.join(names)}")
+        sys.exit(1)
+
+    with app.app_context():
+        # Creates tables added since the database was initialised; never alters existing ones
+        db.create_all()
+        print("=" * 60)
+        print(f"Migrating {db.engine.dialect.name} database")
+        print("=" * 60)
+        for name, step in MIGRATIONS:
+            if selected and name not in selected:
+                continue
+            print(f"\n-> {name}")
+            with db.engine.begin() as conn:
+                step(conn)
+        print("\n[SUCCESS] Migration complete")
+
+
+if __name__ == '__main__':
+    run(sys.argv[1:])
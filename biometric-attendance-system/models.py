@@ -1,16 +1,46 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
 from datetime import datetime, date
+from encoding_format import pack_encoding, unpack_encoding, is_binary_encoding, EncodingFormatError
 
 db = SQLAlchemy()
 
+class FaceEncodingType(db.TypeDecorator):
+    """
+    Stores face encodings in the binary format from encoding_format.py.
+    Accepts lists or numpy arrays on write and returns float32 numpy views on read.
+    Legacy JSON rows are still decoded until migrate_db.py has rewritten them.
+    """
+    impl = db.LargeBinary
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        if is_binary_encoding(value):
+            return bytes(value)
+        return pack_encoding(value)
+
+    def process_result_value(self, value, dialect):
+        try:
+            return unpack_encoding(value)
+        except EncodingFormatError as e:
+            print(f"Warning: {e}")
+            return None
+
+    def result_processor(self, dialect, coltype):
+        # Skip LargeBinary's bytes() coercion: un-migrated SQLite rows are still str
+        def process(value):
+            return self.process_result_value(value, dialect)
+        return process
+
 class Admin(UserMixin, db.Model):
     __tablename__ = 'admin'
     
     a_id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(50), nullable=False)
     email = db.Column(db.String(50), unique=True, nullable=False)
-    password = db.Column(db.String(255), nullable=False) # Increased length for hash
+    password = db.deferred(db.Column(db.String(255), nullable=False), group='credentials') # Increased length for hash
     contact_no = db.Column(db.BigInteger, unique=True, nullable=False)
     
     def get_id(self):
@@ -25,7 +55,7 @@ class Faculty(UserMixin, db.Model):
     faculty_id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(50), nullable=False)
     email = db.Column(db.String(50), unique=True, nullable=False)
-    password = db.Column(db.String(255), nullable=False) # Increased length for hash
+    password = db.deferred(db.Column(db.String(255), nullable=False), group='credentials') # Increased length for hash
     contact_no = db.Column(db.BigInteger, unique=True, nullable=False)
     
     def get_id(self):
@@ -40,13 +70,14 @@ class Student(UserMixin, db.Model):
     student_id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(50), nullable=False)
     enrollment_number = db.Column(db.String(20), unique=True, nullable=False)
-    password = db.Column(db.String(255), nullable=False, default='scrypt:32768:8:1$default$default') # Default hash for migration safety
+    password = db.deferred(db.Column(db.String(255), nullable=False, default='scrypt:32768:8:1$default$default'), group='credentials') # Default hash for migration safety
     class_name = db.Column(db.String(10), nullable=False)  # FY/SY/TY
     semester = db.Column(db.Integer, nullable=False, default=1) # 1-6
-    face_encoding = db.Column(db.Text, nullable=False)  # JSON string
+    face_encoding = db.deferred(db.Column(FaceEncodingType, nullable=False), group='biometric')  # binary float32, see encoding_format.py (centroid of the samples)
+    face_templates = db.deferred(db.Column(FaceEncodingType, nullable=True), group='biometric')  # (K, 128) per-photo samples of a multi-photo enrollment
     photo_url = db.Column(db.String(255), nullable=False)
     dob = db.Column(db.Date, nullable=True)
-    admission_date = db.Column(db.Date, default=datetime.utcnow)
+    admission_date = db.Column(db.Date, default=datetime.now)
     
     attendance_records = db.relationship('AttendanceRecord', backref='student', lazy=True)
     
@@ -79,9 +110,17 @@ class AttendanceSession(db.Model):
     start_time = db.Column(db.DateTime, default=datetime.now)
     end_time = db.Column(db.DateTime, nullable=True)
     duration_minutes = db.Column(db.Integer, default=10)
+    expires_at = db.Column(db.DateTime, nullable=True)  # start_time + duration; Active sessions past it are ended by session_expiry.py
     status = db.Column(db.String(20), default='Active') # Active, Ended, Reopened
     
     records = db.relationship('AttendanceRecord', backref='session', lazy=True)
+    
+    __table_args__ = (
+        # Active/Reopened session lookup on every recognition request
+        db.Index('ix_attendance_session_faculty_status_start', 'faculty_id', 'status', 'start_time'),
+        # Expiry scheduler: Active sessions ordered by expiry
+        db.Index('ix_attendance_session_status_expires', 'status', 'expires_at'),
+    )
 
 class AttendanceRecord(db.Model):
     __tablename__ = 'attendance_record'
@@ -99,11 +138,32 @@ class AttendanceRecord(db.Model):
 
     __table_args__ = (
         db.UniqueConstraint('student_id', 'subject_id', 'date', name='unique_attendance_per_day'),
+        # Dashboard / reset_today date filters and the reports keyset order (date, record_id)
+        db.Index('ix_attendance_record_date_id', 'date', 'record_id'),
+        # Faculty-scoped reports and exports
+        db.Index('ix_attendance_record_faculty_date', 'faculty_id', 'date'),
+        # Student dashboard recent records (counts come from attendance_summary)
+        db.Index('ix_attendance_record_student_date_time', 'student_id', 'date', 'time'),
     )
     
     def __repr__(self):
         return f'<AttendanceRecord {self.record_id}>'
 
+class AttendanceSummary(db.Model):
+    """Per-student, per-subject attendance counters maintained by attendance_service.py"""
+    __tablename__ = 'attendance_summary'
+    
+    student_id = db.Column(db.Integer, db.ForeignKey('student.student_id'), primary_key=True)
+    subject_id = db.Column(db.Integer, db.ForeignKey('subject.subject_id'), primary_key=True)
+    present = db.Column(db.Integer, nullable=False, default=0)
+    late = db.Column(db.Integer, nullable=False, default=0)
+    leave = db.Column(db.Integer, nullable=False, default=0)
+    absent = db.Column(db.Integer, nullable=False, default=0)
+    total = db.Column(db.Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<AttendanceSummary {self.student_id}/{self.subject_id}>'
+
 class LeaveApplication(db.Model):
     __tablename__ = 'leave_application'
     
@@ -113,7 +173,7 @@ class LeaveApplication(db.Model):
     leave_date = db.Column(db.Date, nullable=False)
     reason = db.Column(db.Text, nullable=False)
     status = db.Column(db.String(20), default='Pending')  # Pending/Approved/Rejected
-    applied_on = db.Column(db.DateTime, default=datetime.utcnow)
+    applied_on = db.Column(db.DateTime, default=datetime.now)
     approved_by = db.Column(db.Integer, db.ForeignKey('faculty.faculty_id'), nullable=True)
     approval_date = db.Column(db.DateTime, nullable=True)
     remarks = db.Column(db.Text, nullable=True)
@@ -123,6 +183,11 @@ class LeaveApplication(db.Model):
     subject = db.relationship('Subject', backref='leave_applications', foreign_keys=[subject_id])
     approver = db.relationship('Faculty', backref='approved_leaves', foreign_keys=[approved_by])
     
+    __table_args__ = (
+        # Pending/processed leave lists filtered by the faculty's subjects
+        db.Index('ix_leave_application_status_subject', 'status', 'subject_id'),
+    )
+    
     def __repr__(self):
         return f'<LeaveApplication {self.leave_id} - {self.status}>'
 
@@ -145,3 +210,61 @@ class Timetable(db.Model):
     
     def __repr__(self):
         return f'<Timetable {self.timetable_id} - {self.class_name}>'
+
+class BackgroundJob(db.Model):
+    """Queued heavy operation (imports, exports, recomputes) run by job_queue.py"""
+    __tablename__ = 'background_job'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    payload = db.Column(db.JSON, nullable=False, default=dict)
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued/running/completed/failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=3)
+    run_after = db.Column(db.DateTime, nullable=False, default=datetime.now)
+    locked_by = db.Column(db.String(100), nullable=True)
+    locked_at = db.Column(db.DateTime, nullable=True)
+    progress = db.Column(db.JSON, nullable=True)  # handler-reported progress, e.g. {'processed': 40, 'total': 120}
+    result = db.Column(db.JSON, nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    created_by = db.Column(db.String(50), nullable=True)  # Flask-Login user id, e.g. admin_1
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    
+    __table_args__ = (
+        # Claim query: oldest runnable queued job
+        db.Index('ix_background_job_status_run_after', 'status', 'run_after'),
+    )
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'attempts': self.attempts,
+            'progress': self.progress or {},
+            'result': self.result,
+            'error': self.error,
+            'created_at': self.created_at.isoformat(timespec='seconds'),
+            'finished_at': self.finished_at.isoformat(timespec='seconds') if self.finished_at else None,
+        }
+    
+    def __repr__(self):
+        return f'<BackgroundJob {self.id} {self.kind} - {self.status}>'
+
+# Column groups: 'credentials' (password hashes) and 'biometric' (face data) are
+# deferred, so a plain query never reads them. Student queries pick a projection
+# instead of loading whole rows (password hashes are read only by
+# auth_service.find_credentials):
+#   ROSTER             list pages (students, manual attendance): display columns only
+#   BIOMETRIC_COLUMNS  matching galleries that need the face data
+# The *_COLUMNS tuples serve column queries; ROSTER is the load_only option for ORM queries.
+ROSTER_COLUMNS = (
+    Student.student_id, Student.name, Student.enrollment_number,
+    Student.class_name, Student.semester, Student.photo_url
+)
+BIOMETRIC_COLUMNS = (
+    Student.student_id, Student.name, Student.enrollment_number,
+    Student.face_encoding, Student.face_templates
+)
+ROSTER = db.load_only(*ROSTER_COLUMNS)
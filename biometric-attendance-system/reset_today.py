@@ -7,6 +7,8 @@ from datetime import date
 from sqlalchemy import create_engine, text
 from pathlib import Path
 from config import DATABASE_URI, DATABASE_TYPE
+from attendance_service import rebuild_summary
+from stats_cache import invalidate_dashboard
 
 # Create engine using configured database URI
 engine = create_engine(DATABASE_URI)
@@ -37,10 +39,15 @@ try:
                 AND status IN ('Active', 'Reopened')
             """), {"today": today})
             
+            # Keep the defaulter counters in step with the deleted records
+            rebuild_summary(conn)
+            
             conn.commit()
+            invalidate_dashboard()
             
             print(f"[SUCCESS] Deleted {count_before} attendance record(s)")
             print("[SUCCESS] Ended any active sessions for today")
+            print("[SUCCESS] Rebuilt attendance summary")
         else:
             print("[INFO] No attendance records found for today")
         
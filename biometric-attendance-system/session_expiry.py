@@ -0,0 +1,77 @@
+"""
+Session Expiry Module
+Ends attendance sessions whose time is up on the server, so a closed browser
+tab no longer leaves a session Active forever. A periodic task on the job
+runners (see job_queue.py) reads only the Active sessions with
+expires_at <= now from the (status, expires_at) index, oldest first, and ends
+them in batches with the same absentee marking as the end_session route.
+
+Configuration (environment variables):
+    SESSION_EXPIRY_INTERVAL  seconds between expiry sweeps (default 15)
+    SESSION_EXPIRY_BATCH     sessions ended per transaction (default 50)
+"""
+import os
+import threading
+from datetime import datetime, timedelta
+
+from models import db, AttendanceSession
+from attendance_service import end_attendance_session
+from face_tracker import session_trackers
+from job_queue import periodic_task
+
+SESSION_EXPIRY_INTERVAL = int(os.getenv('SESSION_EXPIRY_INTERVAL', '15'))
+SESSION_EXPIRY_BATCH = int(os.getenv('SESSION_EXPIRY_BATCH', '50'))
+
+_lock = threading.Lock()
+_stats = {'sweeps': 0, 'sessions_expired': 0, 'last_sweep': None}
+
+
+def session_expires_at(start_time, duration_minutes):
+    return start_time + timedelta(minutes=duration_minutes or 0)
+
+
+def expire_sessions(now=None, batch_size=SESSION_EXPIRY_BATCH, faculty_id=None):
+    """
+    End every Active session past its expires_at (optionally only one
+    faculty's), committing once per batch. Returns the number ended.
+    """
+    now = now or datetime.now()
+    query = db.select(AttendanceSession).where(
+        AttendanceSession.status == 'Active', AttendanceSession.expires_at <= now
+    )
+    if faculty_id is not None:
+        query = query.where(AttendanceSession.faculty_id == faculty_id)
+    query = query.order_by(AttendanceSession.expires_at).limit(batch_size)
+    if db.engine.dialect.name == 'postgresql':
+        # Runners in other processes take the next sessions instead of waiting on these
+        query = query.with_for_update(skip_locked=True)
+
+    expired = 0
+    while True:
+        batch = db.session.execute(query).scalars().all()
+        for attendance_session in batch:
+            absent_ids = end_attendance_session(attendance_session, end_time=attendance_session.expires_at)
+            if absent_ids is None:
+                continue
+            expired += 1
+            session_trackers.discard((attendance_session.faculty_id, attendance_session.subject_id, attendance_session.id))
+            print(f"DEBUG: Session {attendance_session.id} expired, {len(absent_ids)} student(s) marked absent")
+        db.session.commit()
+        if len(batch) < batch_size:
+            break
+
+    with _lock:
+        _stats['sweeps'] += 1
+        _stats['sessions_expired'] += expired
+        _stats['last_sweep'] = now.isoformat(timespec='seconds')
+    return expired
+
+
+@periodic_task(SESSION_EXPIRY_INTERVAL)
+def expire_sessions_task():
+    expire_sessions()
+
+
+def stats():
+    with _lock:
+        return dict(_stats, interval_seconds=SESSION_EXPIRY_INTERVAL)
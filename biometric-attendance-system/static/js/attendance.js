@@ -13,9 +13,19 @@ const SMOOTHING_ENABLED = true; // feature-flag: safe to toggle
 const FRAME_SKIP = 2; // process every Nth capture frame for recognition
 let frameCounter = 0;
 
+// Milliseconds to wait before the next frame after the server answered 429
+let retryDelay = 0;
+
 // overlay smoothing structures
 let detectedBoxes = []; // {id, target:{x,y,w,h}, current:{x,y,w,h}, name, status}
 
+// Streaming channel: frames go over a WebSocket when the server supports it
+let recognitionSocket = null;
+let socketSessionId = null;
+let socketReady = false;
+let socketUnavailable = false;
+let socketRetryAt = 0;
+
 // Session State
 let currentSessionId = null;
 let sessionEndTime = null;
@@ -76,7 +86,7 @@ function updateUIState(state, data = {}) {
         if (state === 'Active') {
             statusBadge.innerText = 'Active';
             statusBadge.style.background = 'var(--success)';
-            startTimer(data.remaining_minutes);
+            startTimer(data.remaining_seconds ?? data.remaining_minutes * 60);
         } else {
             statusBadge.innerText = 'Reopened (Late Marking)';
             statusBadge.style.background = '#f59e0b';
@@ -169,7 +179,7 @@ function startSession() {
             console.log("Start Session Response:", data);
             if (data.success) {
                 currentSessionId = data.session_id;
-                updateUIState('Active', { remaining_minutes: duration });
+                updateUIState('Active', { remaining_seconds: duration * 60 });
                 showResult('Session Started', 'success');
             } else {
                 alert('Error starting session: ' + data.message);
@@ -210,6 +220,7 @@ function endSession() {
         .then(data => {
             if (data.success) {
                 currentSessionId = null; // Prevent camera restart loop
+                closeRecognitionSocket();
                 updateUIState('Ended');
                 showResult('Session Ended. Absentees Marked.', 'info');
             } else {
@@ -261,11 +272,13 @@ function reopenSession() {
         });
 }
 
-// Timer Logic
-function startTimer(minutes) {
+// Timer Logic (display only: the server ends the session when it expires)
+const EXPIRY_CHECK_MS = 5000;
+
+function startTimer(seconds) {
     stopTimer();
     const now = new Date().getTime();
-    sessionEndTime = now + (minutes * 60 * 1000);
+    sessionEndTime = now + (seconds * 1000);
 
     updateTimerDisplay(); // Initial
     timerInterval = setInterval(updateTimerDisplay, 1000);
@@ -284,10 +297,8 @@ function updateTimerDisplay() {
         stopTimer();
         document.getElementById('timer-display').innerText = "00:00";
         document.getElementById('timer-display').style.color = 'red';
-        // Optional: Auto-end? User wanted "marked absent by default", implying end.
-        // But also "faculty can reopen".
-        // Let's just alert visually.
-        showResult('Time Expired. Please End Session.', 'error');
+        showResult('Time Expired. Ending session...', 'info');
+        waitForServerExpiry(currentSessionId);
         return;
     }
 
@@ -299,6 +310,26 @@ function updateTimerDisplay() {
     document.getElementById('timer-display').style.color = 'inherit';
 }
 
+function waitForServerExpiry(sessionId) {
+    // The expiry scheduler ends the session and marks absentees within a few seconds
+    setTimeout(() => {
+        if (!sessionId || currentSessionId !== sessionId) return; // Ended or replaced meanwhile
+        fetch('/api/session_status')
+            .then(res => res.json())
+            .then(data => {
+                if (data.active && data.session_id === sessionId && data.status === 'Active') {
+                    waitForServerExpiry(sessionId);
+                    return;
+                }
+                currentSessionId = null; // Prevent camera restart loop
+                closeRecognitionSocket();
+                updateUIState('Ended');
+                showResult('Session Ended. Absentees Marked.', 'info');
+            })
+            .catch(() => waitForServerExpiry(sessionId));
+    }, EXPIRY_CHECK_MS);
+}
+
 // Camera Logic (Simplified helpers)
 function toggleCamera() {
     if (stream) stopCamera();
@@ -449,7 +480,6 @@ function captureAndRecognize() {
 
     // draw scaled frame for recognition
     context.drawImage(video, 0, 0, canvas.width, canvas.height);
-    const imageData = canvas.toDataURL('image/jpeg', 0.7);
 
     // Only send if session active (or reopened)
     if (!currentSessionId) {
@@ -459,29 +489,54 @@ function captureAndRecognize() {
 
     isProcessing = true;
 
-    fetch('/api/recognize_face', {
-        method: 'POST',
-        headers: {
-            'Content-Type': 'application/json',
-            'X-CSRFToken': getCSRFToken()
-        },
-        credentials: 'include',
-        body: JSON.stringify({
-            image: imageData,
-            class_name: document.getElementById('class_name').value,
-            subject_id: document.getElementById('subject_id').value
-        })
-    })
+    // Prefer the session's WebSocket: no per-frame login or session lookups
+    if (recognitionSocket && socketSessionId !== currentSessionId) closeRecognitionSocket();
+    if (!recognitionSocket && !socketUnavailable && window.WebSocket && Date.now() >= socketRetryAt) {
+        openRecognitionSocket(currentSessionId);
+    }
+    if (socketReady) {
+        // The 'results' message schedules the next frame
+        frameToBlob(canvas)
+            .then(blob => recognitionSocket.send(blob))
+            .catch(err => {
+                console.error('Socket send error:', err);
+                scheduleNextFrame();
+            });
+        return;
+    }
+
+    const params = new URLSearchParams({
+        class_name: document.getElementById('class_name').value,
+        subject_id: document.getElementById('subject_id').value
+    });
+
+    // Send the JPEG bytes as-is (no base64 data URL inside JSON)
+    frameToBlob(canvas)
+        .then(blob => fetch(`/api/recognize_face_frame?${params.toString()}`, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'image/jpeg',
+                'X-CSRFToken': getCSRFToken()
+            },
+            credentials: 'include',
+            body: blob
+        }))
         .then(res => {
             if (res.status === 401 || res.status === 403 || res.url.includes('/login')) {
                 throw new Error('Session expired');
             }
+            if (res.status === 429 || res.status === 503) {
+                // Recognition pool is saturated: back off without clearing the overlay
+                retryDelay = (parseInt(res.headers.get('Retry-After'), 10) || 1) * 1000;
+                return null;
+            }
             if (!res.ok) {
                 return res.text().then(text => { throw new Error('Server Error: ' + res.status + ' '); });
             }
             return res.json();
         })
         .then(data => {
+            if (!data) return;
             if (data.success) {
                 // Update detectedBoxes targets for smooth overlay
                 updateDetectedBoxesFromResults(data.results);
@@ -511,20 +566,101 @@ function captureAndRecognize() {
                 setTimeout(() => requestAnimationFrame(captureAndRecognize), 500);
             }
         })
-        .finally(() => {
-            // isProcessing = false; // Moved out to fix loop
-            isProcessing = false;
-            // Always continue the loop if stream exists and session is active
-            if (stream && currentSessionId) {
-                requestAnimationFrame(captureAndRecognize);
-            } else if (currentSessionId && !stream) {
-                // Session active but stream lost - try to restart
-                console.log('Stream lost during recognition, attempting restart...');
-                setTimeout(() => {
-                    if (currentSessionId) startCameraInternal();
-                }, 1000);
-            }
-        });
+        .finally(scheduleNextFrame);
+}
+
+function scheduleNextFrame() {
+    isProcessing = false;
+    // Always continue the loop if stream exists and session is active
+    if (stream && currentSessionId && retryDelay) {
+        const delay = retryDelay;
+        retryDelay = 0;
+        setTimeout(() => requestAnimationFrame(captureAndRecognize), delay);
+    } else if (stream && currentSessionId) {
+        requestAnimationFrame(captureAndRecognize);
+    } else if (currentSessionId && !stream) {
+        // Session active but stream lost - try to restart
+        console.log('Stream lost during recognition, attempting restart...');
+        setTimeout(() => {
+            if (currentSessionId) startCameraInternal();
+        }, 1000);
+    }
+}
+
+// --- Streaming channel (WebSocket bound to one attendance session) ---
+function openRecognitionSocket(sessionId) {
+    const scheme = window.location.protocol === 'https:' ? 'wss' : 'ws';
+    const socket = new WebSocket(`${scheme}://${window.location.host}/ws/recognize?session_id=${sessionId}`);
+    let receivedAny = false;
+    recognitionSocket = socket;
+    socketSessionId = sessionId;
+    socketReady = false;
+
+    socket.onmessage = event => {
+        receivedAny = true;
+        if (recognitionSocket === socket) handleSocketMessage(JSON.parse(event.data));
+    };
+    socket.onclose = () => {
+        if (recognitionSocket !== socket) return;
+        if (!receivedAny) {
+            // Handshake failed: the server has no WebSocket support, stay on HTTP
+            socketUnavailable = true;
+        } else {
+            socketRetryAt = Date.now() + 5000;
+        }
+        recognitionSocket = null;
+        socketReady = false;
+        if (isProcessing) scheduleNextFrame();
+    };
+}
+
+function closeRecognitionSocket() {
+    const socket = recognitionSocket;
+    recognitionSocket = null;
+    socketReady = false;
+    if (socket) socket.close();
+}
+
+function handleSocketMessage(msg) {
+    switch (msg.type) {
+        case 'ready':
+            socketReady = true;
+            break;
+        case 'results':
+            updateDetectedBoxesFromResults(msg.results);
+            processResults(msg.results);
+            scheduleNextFrame();
+            break;
+        case 'busy':
+            retryDelay = (msg.retry_after || 1) * 1000;
+            scheduleNextFrame();
+            break;
+        case 'roster': {
+            const rosterCount = document.getElementById('roster-count');
+            if (rosterCount) rosterCount.innerText = `${msg.present} / ${msg.class_size}`;
+            break;
+        }
+        case 'status':
+            if (msg.status === 'Reopened') updateUIState('Reopened');
+            break;
+        case 'session_ended':
+            // Ended elsewhere (another tab or the server)
+            closeRecognitionSocket();
+            currentSessionId = null;
+            updateUIState('Ended');
+            showResult('Session Ended. Absentees Marked.', 'info');
+            break;
+        case 'error':
+            showResult(msg.message || 'Recognition Error', 'error');
+            if (isProcessing) scheduleNextFrame();
+            break;
+    }
+}
+
+function frameToBlob(canvas) {
+    return new Promise((resolve, reject) => {
+        canvas.toBlob(blob => blob ? resolve(blob) : reject(new Error('Could not encode frame')), 'image/jpeg', 0.7);
+    });
 }
 
 function processResults(results) {
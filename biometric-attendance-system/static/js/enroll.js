@@ -0,0 +1,60 @@
+// Multi-photo enrollment: capture a short webcam burst into the photo input
+const BURST_FRAMES = 5;
+const BURST_INTERVAL_MS = 400;
+const MAX_PHOTOS = 8; // ENROLL_MAX_SAMPLES on the server
+
+document.addEventListener('DOMContentLoaded', function () {
+    document.getElementById('photo').addEventListener('change', updatePhotoCount);
+});
+
+function updatePhotoCount() {
+    const count = document.getElementById('photo').files.length;
+    document.getElementById('photo-count').innerText = count ? `${count} photo(s) selected` : '';
+}
+
+function grabFrame(video, canvas, index) {
+    canvas.width = video.videoWidth;
+    canvas.height = video.videoHeight;
+    canvas.getContext('2d').drawImage(video, 0, 0);
+    return new Promise((resolve, reject) => {
+        canvas.toBlob(blob => blob
+            ? resolve(new File([blob], `burst_${index}.jpg`, { type: 'image/jpeg' }))
+            : reject(new Error('Could not capture frame')), 'image/jpeg', 0.92);
+    });
+}
+
+async function captureBurst() {
+    const input = document.getElementById('photo');
+    const button = document.getElementById('captureBurstBtn');
+    const video = document.getElementById('burst-preview');
+    const canvas = document.createElement('canvas');
+    let stream = null;
+
+    button.disabled = true;
+    try {
+        stream = await navigator.mediaDevices.getUserMedia({ video: { facingMode: 'user' } });
+        video.srcObject = stream;
+        video.style.display = 'block';
+        await video.play();
+
+        // Keep already chosen files and add the burst after them
+        const files = new DataTransfer();
+        Array.from(input.files).forEach(file => files.items.add(file));
+        for (let i = 0; i < BURST_FRAMES && files.items.length < MAX_PHOTOS; i++) {
+            button.innerText = `Capturing ${i + 1}/${BURST_FRAMES}... move your head slightly`;
+            await new Promise(resolve => setTimeout(resolve, BURST_INTERVAL_MS));
+            files.items.add(await grabFrame(video, canvas, i + 1));
+        }
+        input.files = files.files;
+        updatePhotoCount();
+    } catch (err) {
+        console.error('Burst capture error:', err);
+        alert('Could not capture from camera: ' + err.message);
+    } finally {
+        if (stream) stream.getTracks().forEach(track => track.stop());
+        video.srcObject = null;
+        video.style.display = 'none';
+        button.disabled = false;
+        button.innerHTML = '<i class="fas fa-camera"></i> Capture from Camera';
+    }
+}
@@ -0,0 +1,23 @@
+// Polls a background job (see job_queue.py) until it completes or fails
+const JOB_POLL_INTERVAL_MS = 1000;
+
+function pollJob(jobId, onProgress) {
+    return new Promise((resolve, reject) => {
+        function check() {
+            fetch(`/api/jobs/${jobId}`)
+                .then(response => response.json())
+                .then(job => {
+                    if (!job.success) {
+                        reject(new Error(job.message || 'Job not found'));
+                    } else if (job.status === 'completed' || job.status === 'failed') {
+                        resolve(job);
+                    } else {
+                        if (onProgress) onProgress(job);
+                        setTimeout(check, JOB_POLL_INTERVAL_MS);
+                    }
+                })
+                .catch(reject);
+        }
+        check();
+    });
+}
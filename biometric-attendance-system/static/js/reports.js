@@ -1,54 +1,90 @@
+// Rows requested per page; the server caps this at 500
+const PAGE_SIZE = 200;
+// Bumped on every new search so pages from an older search are dropped
+let loadGeneration = 0;
+
 document.addEventListener('DOMContentLoaded', function() {
     const filterBtn = document.getElementById('filterBtn');
     const exportCsvBtn = document.getElementById('exportCsvBtn');
     const exportExcelBtn = document.getElementById('exportExcelBtn');
-    
+
     filterBtn.addEventListener('click', loadReports);
     exportCsvBtn.addEventListener('click', () => exportReports('csv'));
     exportExcelBtn.addEventListener('click', () => exportReports('excel'));
-    
-    // Set default dates (today)
-    const today = new Date().toISOString().split('T')[0];
-    document.getElementById('end_date').value = today;
-    
-    // Load reports on page load
-    loadReports();
 });
 
-function loadReports() {
+function getFilterParams() {
     const startDate = document.getElementById('start_date').value;
     const endDate = document.getElementById('end_date').value;
-    const classFilter = document.getElementById('filter_class').value;
-    
+    const classFilter = document.getElementById('class_filter').value;
+
     const params = new URLSearchParams();
     if (startDate) params.append('start_date', startDate);
     if (endDate) params.append('end_date', endDate);
     if (classFilter) params.append('class_name', classFilter);
-    
+    return params;
+}
+
+function setStatusRow(html) {
+    document.getElementById('report-data').innerHTML = `<tr><td colspan="8" style="text-align: center;">${html}</td></tr>`;
+}
+
+function loadReports() {
+    const generation = ++loadGeneration;
+    const params = getFilterParams();
+    params.append('limit', PAGE_SIZE);
+    params.append('count', 'estimate');
+
+    setStatusRow('Loading...');
+    document.getElementById('report-count').innerText = '';
+    fetchPage(params, generation, 0);
+}
+
+function fetchPage(params, generation, loaded) {
     fetch(`/api/get_attendance?${params.toString()}`)
         .then(response => response.json())
         .then(data => {
-            if (data.success) {
-                displayReports(data.data);
-            } else {
-                alert('Error loading reports: ' + (data.error || 'Unknown error'));
+            if (generation !== loadGeneration) return; // A newer search started
+
+            if (!data.success) {
+                setStatusRow(`<span style="color: red;">${data.error || 'Error loading data'}</span>`);
+                return;
+            }
+
+            if (loaded === 0) {
+                document.getElementById('report-data').innerHTML = '';
+                if (data.total !== undefined) {
+                    document.getElementById('report-count').innerText =
+                        `${data.total_is_estimate ? '~' : ''}${data.total} record(s)`;
+                }
+            }
+
+            appendRows(data.data);
+            loaded += data.data.length;
+
+            if (loaded === 0) {
+                setStatusRow('No records found.');
+                return;
+            }
+
+            if (data.next_cursor) {
+                // Let the browser paint this page before requesting the next one
+                params.set('cursor', data.next_cursor);
+                params.delete('count');
+                requestAnimationFrame(() => fetchPage(params, generation, loaded));
             }
         })
         .catch(error => {
             console.error('Error:', error);
-            alert('Error loading reports');
+            if (generation === loadGeneration && loaded === 0) {
+                setStatusRow('<span style="color: red;">Error loading data</span>');
+            }
         });
 }
 
-function displayReports(data) {
-    const tbody = document.getElementById('reports-tbody');
-    
-    if (data.length === 0) {
-        tbody.innerHTML = '<tr><td colspan="8" style="text-align: center;">No records found</td></tr>';
-        return;
-    }
-    
-    tbody.innerHTML = data.map(record => `
+function appendRows(records) {
+    const tbody = document.getElementById('report-data');
+    tbody.insertAdjacentHTML('beforeend', records.map(record => `
         <tr>
             <td>${record.date}</td>
             <td>${record.time}</td>
@@ -56,22 +92,38 @@ function displayReports(data) {
             <td>${record.student_name}</td>
             <td>${record.enrollment_number}</td>
             <td>${record.class_name}</td>
-            <td><span style="color: ${record.status === 'Present' ? 'green' : 'red'}; font-weight: bold;">${record.status}</span></td>
+            <td><span class="badge ${record.status === 'Present' ? 'badge-success' : 'badge-danger'}">${record.status}</span></td>
             <td>${record.faculty_name}</td>
         </tr>
-    `).join('');
+    `).join(''));
 }
 
 function exportReports(format) {
-    const startDate = document.getElementById('start_date').value;
-    const endDate = document.getElementById('end_date').value;
-    const classFilter = document.getElementById('filter_class').value;
-    
-    const params = new URLSearchParams();
-    if (startDate) params.append('start_date', startDate);
-    if (endDate) params.append('end_date', endDate);
-    if (classFilter) params.append('class_name', classFilter);
+    const params = getFilterParams();
     params.append('format', format);
-    
-    window.location.href = `/api/export_attendance?${params.toString()}`;
+
+    if (format !== 'excel') {
+        window.location.href = `/api/export_attendance?${params.toString()}`;
+        return;
+    }
+
+    // Excel files are built by a background job; download once it completes
+    const button = document.getElementById('exportExcelBtn');
+    button.disabled = true;
+    button.innerText = 'Preparing Excel...';
+    fetch(`/api/export_attendance?${params.toString()}`)
+        .then(response => response.json())
+        .then(data => {
+            if (!data.success) throw new Error(data.message || 'Export failed');
+            return pollJob(data.job_id);
+        })
+        .then(job => {
+            if (job.status !== 'completed') throw new Error(job.error || 'Export failed');
+            window.location.href = `/api/jobs/${job.id}/download`;
+        })
+        .catch(error => alert('Error exporting: ' + error.message))
+        .finally(() => {
+            button.disabled = false;
+            button.innerText = 'Export Excel';
+        });
 }
@@ -0,0 +1,125 @@
+"""
+Shared Stats Cache Module
+Short-TTL cache for computed page statistics, shared by every gunicorn
+worker on the host through small JSON files (served from the OS page cache).
+Any worker can invalidate an entry by deleting its file.
+
+The default directory is named after a hash of the database URI, so apps and
+test runs on the same host only share entries when they share a database.
+An in-memory SQLite database gets a private directory per process.
+
+Configuration (environment variables):
+    STATS_CACHE_DIR      directory for cache files
+                         (default: <tmp>/attendance_stats_cache_<hash of database URI>)
+    DASHBOARD_CACHE_TTL  seconds a dashboard snapshot stays valid (default 30)
+"""
+import atexit
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from config import DATABASE_URI
+
+
+def default_cache_dir(database_uri):
+    """Per-database cache directory under the system temp dir."""
+    if database_uri in ('sqlite://', 'sqlite:///:memory:'):
+        # Nothing outside this process can see an in-memory database
+        directory = tempfile.mkdtemp(prefix='attendance_stats_cache_')
+        atexit.register(shutil.rmtree, directory, ignore_errors=True)
+        return directory
+    digest = hashlib.sha1(database_uri.encode('utf-8')).hexdigest()[:12]
+    return os.path.join(tempfile.gettempdir(), f'attendance_stats_cache_{digest}')
+
+
+# Same selection as app.py: DATABASE_URL wins over config.DATABASE_URI
+STATS_CACHE_DIR = os.getenv('STATS_CACHE_DIR') or default_cache_dir(os.getenv('DATABASE_URL') or DATABASE_URI)
+DASHBOARD_CACHE_TTL = int(os.getenv('DASHBOARD_CACHE_TTL', '30'))
+
+
+class SharedTTLCache:
+    """JSON values stored one file per key; an entry is fresh while its file is younger than ttl."""
+
+    def __init__(self, directory=STATS_CACHE_DIR, ttl=DASHBOARD_CACHE_TTL):
+        self.directory = directory
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        if hasattr(os, 'getuid') and os.stat(directory).st_uid != os.getuid():
+            print(f"Warning: stats cache directory {directory} belongs to another user; using a private one")
+            self.directory = tempfile.mkdtemp(prefix='attendance_stats_cache_')
+            atexit.register(shutil.rmtree, self.directory, ignore_errors=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, f'{key}.json')
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def get(self, key):
+        """Returns the cached value, or None if missing or older than ttl."""
+        path = self._path(key)
+        try:
+            if time.time() - os.path.getmtime(path) < self.ttl:
+                with open(path, 'r', encoding='utf-8') as f:
+                    value = json.load(f)
+                self._count(True)
+                return value
+        except (OSError, ValueError):
+            pass
+        self._count(False)
+        return None
+
+    def set(self, key, value):
+        # Write to a temp file and rename so readers never see a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(value, f)
+            os.replace(tmp_path, self._path(key))
+        except OSError as e:
+            print(f"Warning: could not write stats cache {key}: {e}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+    def invalidate(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+        with self._lock:
+            self.invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'invalidations': self.invalidations,
+                'ttl': self.ttl,
+            }
+
+
+# Shared instance used by app.py and attendance_service.py
+stats_cache = SharedTTLCache()
+
+DASHBOARD_KEY = 'dashboard'
+
+
+def invalidate_dashboard():
+    stats_cache.invalidate(DASHBOARD_KEY)
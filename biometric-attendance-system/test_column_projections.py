@@ -0,0 +1,74 @@
+"""Column projection test: which student/faculty columns each route SELECTs (in-memory SQLite; see conftest.py)"""
+import re
+
+import pytest
+from werkzeug.security import generate_password_hash
+
+from models import db, Admin, Faculty, Student, Subject, AttendanceSession
+from identity_cache import identity_cache
+
+ROSTER = {'student_id', 'name', 'enrollment_number', 'class_name', 'semester', 'photo_url'}
+HEAVY = {'password', 'face_encoding', 'face_templates'}
+
+
+def selected_columns(statements, table):
+    """Columns of `table` named in the SELECT lists of the captured statements."""
+    columns = set()
+    for statement in statements:
+        if not statement.lstrip().upper().startswith(('SELECT', 'INSERT')):
+            continue
+        columns.update(re.findall(rf'\b{table}\.(\w+)', re.split(r'\sFROM\s', statement)[0]))
+    return columns
+
+
+def test_column_projections(app, login, capture_statements):
+    def capture(call):
+        # Cold identity cache: the user_loader's own query is checked too
+        identity_cache.invalidate()
+        with capture_statements() as statements:
+            response = call()
+        assert response.status_code in (200, 302), response.status_code
+        return statements
+
+    with app.app_context():
+        admin = Admin(name='Admin', email='admin@test.edu', password=generate_password_hash('pw'), contact_no=1000000002)
+        faculty = Faculty(name='Dr. Test', email='test@college.edu', password='x', contact_no=1000000001)
+        subject = Subject(name='Mathematics-I', class_name='FY', semester=1)
+        db.session.add_all([admin, faculty, subject])
+        db.session.add_all([
+            Student(name=f'Student {i}', enrollment_number=f'T{i:05d}', class_name='FY',
+                    face_encoding=[0.0] * 128, photo_url='-')
+            for i in range(20)
+        ])
+        db.session.commit()
+        attendance_session = AttendanceSession(faculty_id=faculty.faculty_id, subject_id=subject.subject_id,
+                                               class_name='FY', status='Active')
+        db.session.add(attendance_session)
+        db.session.commit()
+        admin_id, faculty_id, session_id = admin.get_id(), faculty.get_id(), attendance_session.id
+
+    admin_client = login(admin_id, 'admin')
+    faculty_client = login(faculty_id, 'faculty')
+
+    routes = {
+        '/students': (ROSTER, lambda: admin_client.get('/students')),
+        '/manual_attendance': (ROSTER, lambda: faculty_client.get('/manual_attendance?class_name=FY')),
+        '/timetable': (set(), lambda: faculty_client.get('/timetable')),
+        '/api/end_session': ({'student_id'}, lambda: faculty_client.post('/api/end_session', json={'session_id': session_id})),
+    }
+    for route, (expected, call) in routes.items():
+        statements = capture(call)
+        student_columns = selected_columns(statements, 'student')
+        faculty_columns = selected_columns(statements, 'faculty')
+        print(f"{route}: student {sorted(student_columns)}, faculty {sorted(faculty_columns)}")
+        assert student_columns == expected, (route, student_columns)
+        assert not faculty_columns & HEAVY and not student_columns & HEAVY, route
+
+    # Login is the one route that reads the password hash, only in its credential lookup
+    statements = capture(lambda: app.test_client().post('/login', data={'email': 'admin@test.edu', 'password': 'pw'}))
+    with_password = [s for s in statements if 'admin.password' in s]
+    assert len(with_password) == 1 and 'UNION ALL' in with_password[0], statements
+
+
+if __name__ == '__main__':
+    raise SystemExit(pytest.main(['-q', __file__]))
@@ -0,0 +1,72 @@
+"""End-session absentee marking test (500-student class, in-memory SQLite; see conftest.py)"""
+import time
+from datetime import datetime, date
+
+import pytest
+
+from models import db, Faculty, Student, Subject, AttendanceRecord, AttendanceSession
+
+CLASS_SIZE = 500
+PRESENT = 120
+ON_LEAVE = 30
+MAX_SECONDS = 2.0
+
+
+def test_end_session_marks_absentees(app, login, capture_statements):
+    with app.app_context():
+        faculty = Faculty(name='Dr. Test', email='test@college.edu', password='x', contact_no=1000000001)
+        subject = Subject(name='Mathematics-I', class_name='FY', semester=1)
+        db.session.add_all([faculty, subject])
+        db.session.commit()
+
+        students = [
+            Student(name=f'Student {i}', enrollment_number=f'T{i:05d}', class_name='FY',
+                    face_encoding=[0.0] * 128, photo_url='-')
+            for i in range(CLASS_SIZE)
+        ]
+        # Another class must not be touched
+        students.append(Student(name='Other', enrollment_number='OTHER', class_name='SY',
+                                face_encoding=[0.0] * 128, photo_url='-'))
+        db.session.add_all(students)
+        db.session.commit()
+
+        attendance_session = AttendanceSession(faculty_id=faculty.faculty_id, subject_id=subject.subject_id,
+                                               class_name='FY', status='Active')
+        db.session.add(attendance_session)
+        db.session.commit()
+
+        for i, student in enumerate(students[:PRESENT + ON_LEAVE]):
+            db.session.add(AttendanceRecord(
+                date=date.today(), time=datetime.now().time(),
+                status='Present' if i < PRESENT else 'Leave',
+                student_id=student.student_id, faculty_id=faculty.faculty_id,
+                subject_id=subject.subject_id, session_id=attendance_session.id
+            ))
+        db.session.commit()
+        faculty_id, session_id, subject_id = faculty.faculty_id, attendance_session.id, subject.subject_id
+
+    client = login(f'faculty_{faculty_id}', 'faculty')
+    with capture_statements() as statements:
+        start = time.perf_counter()
+        response = client.post('/api/end_session', json={'session_id': session_id})
+        elapsed = time.perf_counter() - start
+
+    expected_absent = CLASS_SIZE - PRESENT - ON_LEAVE
+    data = response.get_json()
+    print(f"end_session: {elapsed * 1000:.1f} ms, {len(statements)} statements -> {data['message']}")
+
+    assert data['success'], data
+    assert f'{expected_absent} students marked as absent' in data['message']
+    assert elapsed < MAX_SECONDS
+    # Absentees are written by one statement, not one per student
+    assert sum('INSERT INTO attendance_record' in s for s in statements) == 1
+    assert len(statements) < 20
+
+    with app.app_context():
+        absent = AttendanceRecord.query.filter_by(subject_id=subject_id, status='Absent').count()
+        assert absent == expected_absent
+        assert AttendanceRecord.query.count() == CLASS_SIZE
+
+
+if __name__ == '__main__':
+    raise SystemExit(pytest.main(['-q', __file__]))
@@ -0,0 +1,59 @@
+"""Identity cache test: hits issue no SELECT, and user changes drop the cached entry (in-memory SQLite; see conftest.py)"""
+import pytest
+from werkzeug.security import generate_password_hash, check_password_hash
+
+from models import db, Admin, Faculty, Student
+from identity_cache import identity_cache
+
+
+def test_identity_cache(app, login, capture_statements):
+    def load(user_id, attribute='name'):
+        """(the user's attribute or None if unknown, whether the lookup queried the database)"""
+        with app.test_request_context():
+            with capture_statements() as statements:
+                user = identity_cache.get(user_id)
+            value = None if user is None else getattr(user, attribute)
+        return value, any(s.lstrip().upper().startswith('SELECT') for s in statements)
+
+    def cached(user_id):
+        return not load(user_id)[1]
+
+    with app.app_context():
+        admin = Admin(name='Admin', email='admin@test.edu', password=generate_password_hash('pw'), contact_no=1000000002)
+        faculty = Faculty(name='Dr. Test', email='test@college.edu', password='x', contact_no=1000000001)
+        leaving = Faculty(name='Dr. Gone', email='gone@college.edu', password='x', contact_no=1000000003)
+        student = Student(name='Student', enrollment_number='T00001', class_name='FY',
+                          password=generate_password_hash('old'), face_encoding=[0.0] * 128, photo_url='-')
+        removed = Student(name='Removed', enrollment_number='T00002', class_name='FY',
+                          face_encoding=[0.0] * 128, photo_url='-')
+        db.session.add_all([admin, faculty, leaving, student, removed])
+        db.session.commit()
+        admin_id, faculty_id = admin.get_id(), faculty.get_id()
+        leaving_pk, removed_pk = leaving.faculty_id, removed.student_id
+        leaving_id, student_id, removed_id = leaving.get_id(), student.get_id(), removed.get_id()
+
+    # The first lookup reads the row; a hit merges the cached user without a SELECT
+    assert load(faculty_id) == ('Dr. Test', True)
+    assert load(faculty_id) == ('Dr. Test', False)
+    for user_id in (leaving_id, student_id, removed_id):
+        load(user_id)
+
+    # Deleting a user drops its entry: the next lookup goes to the database and finds nothing
+    admin_client = login(admin_id, 'admin')
+    assert admin_client.post(f'/delete_student/{removed_pk}').status_code == 302
+    assert load(removed_id) == (None, True)
+    assert admin_client.post(f'/delete_faculty/{leaving_pk}').status_code == 302
+    assert load(leaving_id) == (None, True)
+
+    # A password change reloads the user with the new hash
+    student_client = login(student_id, 'student')
+    response = student_client.post('/change_password', data={'current_password': 'old', 'new_password': 'new'})
+    assert response.status_code == 302
+    password_hash, queried = load(student_id, 'password')
+    assert queried and check_password_hash(password_hash, 'new')
+    # Other users keep their entries
+    assert cached(faculty_id)
+
+
+if __name__ == '__main__':
+    raise SystemExit(pytest.main(['-q', __file__]))
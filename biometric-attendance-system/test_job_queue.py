@@ -0,0 +1,97 @@
+"""Background job queue test: claim, retry, permanent failure and status API (in-memory SQLite; see conftest.py)"""
+import pytest
+from sqlalchemy import update
+
+from models import db, Admin, BackgroundJob
+import job_queue
+from job_queue import job_handler, enqueue, claim, run_job, work, PermanentJobError
+
+calls = []
+
+
+@job_handler('test_flaky')
+def flaky_job(payload, job):
+    calls.append(job.attempt)
+    job.progress(step=job.attempt)
+    if job.attempt < payload['succeed_on']:
+        raise RuntimeError('temporary failure')
+    return {'value': payload['value'] * 2}
+
+
+@job_handler('test_invalid')
+def invalid_job(payload, job):
+    calls.append(job.attempt)
+    raise PermanentJobError('bad input')
+
+
+@job_handler('test_taken_over')
+def taken_over_job(payload, job):
+    # Simulates reclaim_stale requeueing the job and another runner claiming it mid-run
+    with db.engine.begin() as conn:
+        conn.execute(update(BackgroundJob).where(BackgroundJob.id == job.id).values(locked_by='runner-b'))
+    job.progress(step=1)
+    return {'value': 'stale'}
+
+
+def test_job_queue(app, login, monkeypatch):
+    # Jobs run explicitly below (conftest.py starts no runner threads), and retries are due at once
+    monkeypatch.setattr(job_queue, 'JOB_RETRY_DELAY', 0)
+    with app.app_context():
+        admin = Admin(name='Admin', email='admin@test.edu', password='x', contact_no=1000000002)
+        db.session.add(admin)
+        db.session.commit()
+        admin_id = admin.get_id()
+
+    with app.test_request_context():
+        retried = enqueue('test_flaky', {'value': 21, 'succeed_on': 2}, created_by=admin_id)
+        failed = enqueue('test_invalid', created_by=admin_id)
+        exhausted = enqueue('test_flaky', {'value': 1, 'succeed_on': 99}, max_attempts=2)
+
+    with app.app_context():
+        # A claimed job is not handed to a second runner
+        job = claim('runner-a')
+        assert job.id == retried and job.status == 'running' and job.locked_by == 'runner-a'
+        second = claim('runner-b')
+        assert second.id != retried
+        run_job(job)
+        run_job(second)
+        db.session.remove()
+
+    work(app, 'runner-a', burst=True)
+
+    with app.app_context():
+        job = db.session.get(BackgroundJob, retried)
+        assert job.status == 'completed' and job.attempts == 2, job.to_dict()
+        assert job.result == {'value': 42} and job.error is None
+        assert job.progress == {'step': 2}
+
+        job = db.session.get(BackgroundJob, failed)
+        assert job.status == 'failed' and job.attempts == 1 and job.error == 'bad input'
+
+        job = db.session.get(BackgroundJob, exhausted)
+        assert job.status == 'failed' and job.attempts == 2
+        assert 'temporary failure' in job.error
+
+        assert job_queue.stats()['counts'] == {'queued': 0, 'running': 0, 'completed': 1, 'failed': 2}
+
+    # A job reclaimed while running belongs to the next runner: the first one's result is discarded
+    with app.test_request_context():
+        taken_over = enqueue('test_taken_over')
+    with app.app_context():
+        job = claim('runner-a')
+        assert job.id == taken_over and run_job(job) is False
+        job = db.session.get(BackgroundJob, taken_over)
+        assert job.status == 'running' and job.locked_by == 'runner-b' and job.result is None
+        # Progress from the original runner no longer touches the job
+        assert job.progress is None
+        db.session.remove()
+
+    client = login(admin_id, 'admin')
+    data = client.get(f'/api/jobs/{retried}').get_json()
+    print(f"job {retried}: {data['status']} after {data['attempts']} attempt(s) -> {data['result']}")
+    assert data['success'] and data['status'] == 'completed' and data['result'] == {'value': 42}
+    assert client.get('/api/jobs/9999').status_code == 404
+
+
+if __name__ == '__main__':
+    raise SystemExit(pytest.main(['-q', __file__]))
@@ -0,0 +1,46 @@
+"""Login test: single credential query, admin/faculty/student lookup and rate limiting (in-memory SQLite; see conftest.py)"""
+import pytest
+from werkzeug.security import generate_password_hash
+
+from models import db, Admin, Faculty, Student
+from auth_service import find_credentials, password_verifier, login_limiter
+
+
+def test_login(app, capture_statements, monkeypatch):
+    monkeypatch.setattr(login_limiter, 'max_attempts', 3)
+    with app.app_context():
+        db.session.add_all([
+            Admin(name='Admin', email='admin@test.edu', password=generate_password_hash('admin-pw'), contact_no=1000000001),
+            Faculty(name='Dr. Test', email='test@college.edu', password=generate_password_hash('faculty-pw'), contact_no=1000000002),
+            Student(name='Student', enrollment_number='T00001', class_name='FY',
+                    password=generate_password_hash('student-pw'), face_encoding=[0.0] * 128, photo_url='-'),
+        ])
+        db.session.commit()
+
+        assert find_credentials('admin@test.edu').user_type == 'admin'
+        assert find_credentials('test@college.edu').user_id == 'faculty_1'
+        assert find_credentials('T00001').user_type == 'student'
+        assert find_credentials('nobody') is None
+
+    client = app.test_client()
+    with capture_statements() as statements:
+        response = client.post('/login', data={'email': 'T00001', 'password': 'student-pw'})
+    assert response.status_code == 302 and response.location.endswith('/student_dashboard')
+    lookups = [s for s in statements if '.password' in s]
+    print(f"student login: {len(statements)} statement(s), {len(lookups)} credential lookup(s)")
+    assert len(lookups) == 1
+
+    # Wrong passwords count against the identifier; once over the limit no hashing happens
+    for _ in range(3):
+        assert client.post('/login', data={'email': 'test@college.edu', 'password': 'wrong'}).status_code == 200
+    hashed = password_verifier.completed
+    response = client.post('/login', data={'email': 'TEST@college.edu', 'password': 'faculty-pw'})
+    assert response.status_code == 429 and password_verifier.completed == hashed
+
+    # Other identifiers are unaffected
+    response = app.test_client().post('/login', data={'email': 'admin@test.edu', 'password': 'admin-pw'})
+    assert response.status_code == 302 and response.location.endswith('/dashboard')
+
+
+if __name__ == '__main__':
+    raise SystemExit(pytest.main(['-q', __file__]))
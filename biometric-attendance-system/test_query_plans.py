@@ -0,0 +1,65 @@
+"""Query-plan regression test: hot attendance queries must use an index, without a sort step (SQLite EXPLAIN QUERY PLAN)"""
+from datetime import date, timedelta
+
+import pytest
+from sqlalchemy import text
+
+from models import db, AttendanceRecord, AttendanceSession, LeaveApplication
+
+
+def hot_queries():
+    """(description, query, index the plan must use)"""
+    today = date.today()
+    week_ago = today - timedelta(days=7)
+    return [
+        ('dashboard: records for today',
+         AttendanceRecord.query.filter_by(date=today),
+         'ix_attendance_record_date_id'),
+        ('reports: newest first',
+         AttendanceRecord.query.filter(AttendanceRecord.date >= week_ago)
+         .order_by(AttendanceRecord.date.desc(), AttendanceRecord.record_id.desc()),
+         'ix_attendance_record_date_id'),
+        ('faculty reports: faculty + date range',
+         AttendanceRecord.query.filter(AttendanceRecord.faculty_id == 1, AttendanceRecord.date >= week_ago),
+         'ix_attendance_record_faculty_date'),
+        ('student dashboard: recent records',
+         AttendanceRecord.query.filter_by(student_id=1)
+         .order_by(AttendanceRecord.date.desc(), AttendanceRecord.time.desc()).limit(10),
+         'ix_attendance_record_student_date_time'),
+        ('recognition: existing record check',
+         AttendanceRecord.query.filter_by(student_id=1, subject_id=1, date=today),
+         'sqlite_autoindex_attendance_record_1'),  # unique_attendance_per_day
+        ('recognition: active session lookup',
+         AttendanceSession.query.filter_by(faculty_id=1, subject_id=1, status='Active')
+         .order_by(AttendanceSession.start_time.desc()),
+         'ix_attendance_session_faculty_status_start'),
+        ('leaves: pending for faculty subjects',
+         LeaveApplication.query.filter_by(status='Pending').filter(LeaveApplication.subject_id.in_([1, 2])),
+         'ix_leave_application_status_subject'),
+    ]
+
+
+def query_plan(query):
+    sql = query.statement.compile(db.engine, compile_kwargs={'literal_binds': True})
+    rows = db.session.execute(text(f'EXPLAIN QUERY PLAN {sql}')).fetchall()
+    return [row[-1] for row in rows]
+
+
+def test_hot_queries_use_indexes(app):
+    with app.app_context():
+        failures = []
+        for description, query, index_name in hot_queries():
+            plan = query_plan(query)
+            print(f"{description}: {' / '.join(plan)}")
+            if not any(index_name in step for step in plan):
+                failures.append(f"{description} did not use {index_name}: {plan}")
+            if any(step.startswith('SCAN') and 'INDEX' not in step for step in plan):
+                failures.append(f"{description} has a full table scan: {plan}")
+            if any('TEMP B-TREE FOR ORDER BY' in step for step in plan):
+                failures.append(f"{description} sorts instead of reading the index in order: {plan}")
+
+        assert not failures, '\n'.join(failures)
+
+
+if __name__ == '__main__':
+    raise SystemExit(pytest.main(['-q', __file__]))
@@ -0,0 +1,95 @@
+"""Session expiry test: batched sweeps, the periodic task and start_session (in-memory SQLite; see conftest.py)"""
+from datetime import datetime, timedelta
+
+import pytest
+
+from models import db, Faculty, Student, Subject, AttendanceRecord, AttendanceSession
+from job_queue import PERIODIC_TASKS, run_due_tasks
+from session_expiry import expire_sessions, expire_sessions_task, session_expires_at, SESSION_EXPIRY_INTERVAL
+
+CLASS_SIZE = 10
+EXPIRED = 5
+BATCH_SIZE = 2
+
+
+def add_session(faculty, subject, started_minutes_ago, duration=10):
+    start_time = datetime.now() - timedelta(minutes=started_minutes_ago)
+    attendance_session = AttendanceSession(
+        faculty_id=faculty.faculty_id, subject_id=subject.subject_id, class_name='FY',
+        start_time=start_time, duration_minutes=duration,
+        expires_at=session_expires_at(start_time, duration), status='Active'
+    )
+    db.session.add(attendance_session)
+    db.session.commit()
+    return attendance_session.id
+
+
+def absent_count(session_id):
+    return AttendanceRecord.query.filter_by(session_id=session_id, status='Absent').count()
+
+
+def test_session_expiry(app, login, capture_statements):
+    with app.app_context():
+        faculty = [Faculty(name=f'Dr. {i}', email=f'f{i}@college.edu', password='x', contact_no=1000000000 + i)
+                   for i in range(3)]
+        # One subject per session: absentees are recorded once per student, date and subject
+        subjects = [Subject(name=f'Subject {i}', class_name='FY', semester=1) for i in range(EXPIRED + 3)]
+        db.session.add_all(faculty + subjects)
+        db.session.add_all([
+            Student(name=f'Student {i}', enrollment_number=f'T{i:05d}', class_name='FY',
+                    face_encoding=[0.0] * 128, photo_url='-')
+            for i in range(CLASS_SIZE)
+        ])
+        db.session.commit()
+
+        expired_ids = [add_session(faculty[i % 2], subjects[i], started_minutes_ago=60 + i) for i in range(EXPIRED)]
+        running_id = add_session(faculty[1], subjects[EXPIRED], started_minutes_ago=2)
+
+        # More expired sessions than batch_size: every one is ended, one SELECT per batch
+        with capture_statements() as statements:
+            ended = expire_sessions(batch_size=BATCH_SIZE)
+        assert ended == EXPIRED, ended
+        batches = [s for s in statements if s.lstrip().startswith('SELECT') and 'FROM attendance_session' in s]
+        assert len(batches) == EXPIRED // BATCH_SIZE + 1, len(batches)
+
+        db.session.expire_all()
+        for session_id in expired_ids:
+            attendance_session = db.session.get(AttendanceSession, session_id)
+            assert attendance_session.status == 'Ended'
+            # Ended at its expiry, not at the time of the sweep
+            assert attendance_session.end_time == attendance_session.expires_at
+            assert absent_count(session_id) == CLASS_SIZE
+
+        # A session still within its duration is left alone
+        running = db.session.get(AttendanceSession, running_id)
+        assert running.status == 'Active' and running.end_time is None
+        assert absent_count(running_id) == 0
+        assert expire_sessions(batch_size=BATCH_SIZE) == 0
+
+        # The runners' periodic task sweeps the same way
+        assert (expire_sessions_task, SESSION_EXPIRY_INTERVAL) in PERIODIC_TASKS
+        swept_id = add_session(faculty[0], subjects[EXPIRED + 1], started_minutes_ago=30)
+        run_due_tasks({})
+        db.session.expire_all()
+        assert db.session.get(AttendanceSession, swept_id).status == 'Ended'
+        assert db.session.get(AttendanceSession, running_id).status == 'Active'
+
+        # A faculty whose own session ran out before the next sweep
+        overdue_id = add_session(faculty[2], subjects[EXPIRED + 2], started_minutes_ago=30)
+        faculty_id, subject_id = faculty[2].faculty_id, subjects[0].subject_id
+
+    client = login(f'faculty_{faculty_id}', 'faculty')
+    data = client.post('/api/start_session', json={'class_name': 'FY', 'subject_id': subject_id, 'duration': 10}).get_json()
+    assert data['success'], data
+
+    with app.app_context():
+        overdue = db.session.get(AttendanceSession, overdue_id)
+        assert overdue.status == 'Ended' and overdue.end_time == overdue.expires_at
+        assert absent_count(overdue_id) == CLASS_SIZE
+        assert db.session.get(AttendanceSession, data['session_id']).status == 'Active'
+        # Only this faculty's session was ended by the route
+        assert db.session.get(AttendanceSession, running_id).status == 'Active'
+
+
+if __name__ == '__main__':
+    raise SystemExit(pytest.main(['-q', __file__]))
@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+"""
+Background job worker
+Runs queued jobs and periodic tasks such as session expiry (see job_queue.py)
+in its own process. Start it next to the web server and set
+JOB_WORKER_THREADS=0 so the web workers only enqueue.
+Jobs hand files over on local disk (uploaded photos in static/uploads, import
+zips and exports in JOB_FILES_DIR), so the worker must run on the same host
+or mount the same volume as the web server.
+Usage: python worker.py [--threads 2] [--burst]
+"""
+import argparse
+import os
+import sys
+import threading
+
+# Add current directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run background jobs')
+    parser.add_argument('--threads', type=int, default=1, help='jobs run concurrently')
+    parser.add_argument('--burst', action='store_true', help='exit once the queue is empty')
+    parser.add_argument('--poll', type=float, default=None, help='seconds between polls when idle')
+    args = parser.parse_args()
+
+    # Identify the worker in pg_stat_activity, unless configured explicitly.
+    # Job handlers get JOB_STATEMENT_TIMEOUT wherever they run (see job_queue.py)
+    os.environ.setdefault('DB_APPLICATION_NAME', 'biometric-attendance-worker')
+
+    # Importing app registers every job handler and periodic task
+    from app import app
+    from job_queue import work, worker_name, JOB_POLL_INTERVAL
+
+    poll = args.poll if args.poll is not None else JOB_POLL_INTERVAL
+    print("=" * 50)
+    print(f"Job worker started ({args.threads} thread(s), pid {os.getpid()})")
+    print("Press Ctrl+C to stop the worker")
+    print("=" * 50)
+
+    threads = [
+        threading.Thread(target=work, args=(app, worker_name(f'worker{i}'), poll),
+                         kwargs={'burst': args.burst, 'periodic': i == 0}, daemon=True)
+        for i in range(args.threads)
+    ]
+    for thread in threads:
+        thread.start()
+    try:
+        for thread in threads:
+            while thread.is_alive():
+                thread.join(1)
+    except KeyboardInterrupt:
+        print("\nWorker stopped")
+
+
+if __name__ == '__main__':
+    main()